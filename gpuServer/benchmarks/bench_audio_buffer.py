@@ -0,0 +1,76 @@
+"""Microbenchmark: Task audio buffer append/read cost vs chapter length.
+
+Compares the old `np.concatenate` buffer with tasks.audio_buffer.AudioBuffer.
+Run from gpuServer/:
+
+    python -m benchmarks.bench_audio_buffer
+    python -m benchmarks.bench_audio_buffer --minutes 1 5 15 30 60 --skip-concat-above 8
+"""
+import argparse
+import time
+
+import numpy as np
+
+from tasks.audio_buffer import AudioBuffer
+
+SAMPLE_RATE = 48000
+BLOCK_SIZE = 19200
+
+
+def run_concatenate(n_blocks, block):
+    buffer = np.array([], dtype=np.float32)
+    cursor = 0
+    append_s = read_s = 0.0
+    for _ in range(n_blocks):
+        start = time.perf_counter()
+        buffer = np.concatenate((buffer, block))
+        append_s += time.perf_counter() - start
+
+        start = time.perf_counter()
+        new = buffer[cursor:]  # what server.generate() did with get_response()
+        cursor = len(buffer)
+        read_s += time.perf_counter() - start
+    return append_s, read_s, len(new)
+
+
+def run_audio_buffer(n_blocks, block, capacity):
+    buffer = AudioBuffer(np.float32, capacity=capacity)
+    cursor = 0
+    append_s = read_s = 0.0
+    for _ in range(n_blocks):
+        start = time.perf_counter()
+        buffer.append(block)
+        append_s += time.perf_counter() - start
+
+        start = time.perf_counter()
+        new = buffer.read(cursor)
+        cursor += len(new)
+        read_s += time.perf_counter() - start
+    return append_s, read_s, len(new)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, nargs="+", default=[1, 2, 4, 8, 30, 60])
+    parser.add_argument("--skip-concat-above", type=float, default=8,
+                        help="the concatenate path is quadratic; skip it for longer chapters")
+    args = parser.parse_args()
+
+    block = np.random.default_rng(0).uniform(-1, 1, BLOCK_SIZE).astype(np.float32)
+    print(f"{'minutes':>8} {'blocks':>7} {'impl':>14} {'append us/blk':>14} {'read us/blk':>12} {'total s':>9}")
+    for minutes in args.minutes:
+        n_blocks = int(minutes * 60 * SAMPLE_RATE / BLOCK_SIZE)
+        runs = [
+            ("AudioBuffer", lambda: run_audio_buffer(n_blocks, block, 0)),
+            ("AudioBuf+cap", lambda: run_audio_buffer(n_blocks, block, n_blocks * BLOCK_SIZE)),
+        ]
+        if minutes <= args.skip_concat_above:
+            runs.insert(0, ("concatenate", lambda: run_concatenate(n_blocks, block)))
+        for name, run in runs:
+            append_s, read_s, _ = run()
+            print(f"{minutes:>8g} {n_blocks:>7} {name:>14} {append_s / n_blocks * 1e6:>14.1f} "
+                  f"{read_s / n_blocks * 1e6:>12.2f} {append_s + read_s:>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
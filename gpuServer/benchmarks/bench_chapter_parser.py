@@ -0,0 +1,101 @@
+"""Microbenchmark: chapter text extraction per HTML parser backend.
+
+Runs every available scarping.chapter_parser backend over a corpus of saved
+chapter pages and compares speed and output against the original
+BeautifulSoup("html.parser") + multi-pass cleanup. Without --corpus a
+synthetic chapter page is generated. Run from gpuServer/:
+
+    python -m benchmarks.bench_chapter_parser --corpus saved_chapters/
+    python -m benchmarks.bench_chapter_parser --paragraphs 50 400 --repeat 20
+"""
+import argparse
+import glob
+import os
+import random
+import time
+from functools import partial
+
+from bs4 import BeautifulSoup
+
+from scarping.chapter_parser import available_backends, extract_chapter_text
+
+
+def legacy_extract(html):
+    # scrape_novel_chapter before the parser backends, kept verbatim as the reference
+    soup = BeautifulSoup(html, "html.parser")
+    content_div = soup.find('div', class_='chapter-content')
+    if not content_div:
+        content_div = soup.find('div', id='chapter-content')  # fallback
+    if not content_div:
+        return None
+    raw_text = content_div.get_text(separator='\n', strip=True)
+    lines = [line.strip() for line in raw_text.split('\n') if line.strip()]
+    clean_text = '\n\n'.join(lines)
+    clean_text = clean_text.replace('  ', ' ').replace('\r', '')
+    return clean_text.strip()
+
+
+def synthetic_page(paragraphs, seed=0):
+    rng = random.Random(seed)
+    words = "the of and to a in he she said was cultivation sect elder young master  qi realm".split(" ")
+    body = []
+    for i in range(paragraphs):
+        sentence = " ".join(rng.choice(words) for _ in range(rng.randint(20, 80)))
+        body.append(f"<p>{sentence}</p>")
+        if i % 25 == 0:
+            body.append("<script>window.ads = window.ads || [];</script><!-- ad slot --><br>")
+    nav = "".join(f'<li><a href="/novel/x_{i}.html">Chapter {i}</a></li>' for i in range(200))
+    return (f"<html><head><title>Chapter</title><style>p {{ margin: 0 }}</style></head><body>"
+            f"<ul class=\"nav\">{nav}</ul><div class=\"chapter-content\">{''.join(body)}</div>"
+            f"<footer>footer text</footer></body></html>")
+
+
+def load_corpus(path):
+    pages = []
+    for file in sorted(glob.glob(os.path.join(path, "**", "*.htm*"), recursive=True)):
+        with open(file, "r", encoding="utf-8", errors="replace") as f:
+            pages.append((os.path.relpath(file, path), f.read()))
+    return pages
+
+
+def bench(extract, pages, repeat):
+    outputs = [extract(html) for _, html in pages]  # warm-up + equality check
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for _, html in pages:
+            extract(html)
+    elapsed = time.perf_counter() - start
+    return elapsed / (repeat * len(pages)), outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="directory of saved chapter .html files")
+    parser.add_argument("--paragraphs", type=int, nargs="+", default=[100],
+                        help="synthetic page sizes when no corpus is given")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.corpus:
+        pages = load_corpus(args.corpus)
+        if not pages:
+            parser.error(f"no .html files under {args.corpus}")
+    else:
+        pages = [(f"synthetic-{n}p", synthetic_page(n, seed=n)) for n in args.paragraphs]
+
+    total_kb = sum(len(html) for _, html in pages) / 1024
+    print(f"{len(pages)} pages, {total_kb:.0f} KiB, backends: {', '.join(available_backends())}")
+
+    reference_s, reference = bench(legacy_extract, pages, args.repeat)
+    print(f"{'backend':>12} {'ms/page':>9} {'speedup':>8} {'mismatches':>11}")
+    print(f"{'legacy':>12} {reference_s * 1e3:>9.2f} {1:>8.2f} {'-':>11}")
+    for name in available_backends():
+        per_page_s, outputs = bench(partial(extract_chapter_text, backend=name), pages, args.repeat)
+        mismatched = [page for (page, _), got, want in zip(pages, outputs, reference) if got != want]
+        print(f"{name:>12} {per_page_s * 1e3:>9.2f} {reference_s / per_page_s:>8.2f} {len(mismatched):>11}")
+        for page in mismatched[:5]:
+            print(f"{'':>12} differs: {page}")
+
+
+if __name__ == '__main__':
+    main()
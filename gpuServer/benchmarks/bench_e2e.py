@@ -0,0 +1,371 @@
+"""Benchmark: end-to-end /stream load test that runs offline on any Linux box.
+
+Everything the service normally reaches over the network is replaced locally:
+- TTS: the stub model (benchmarks/stub_model.py) at a configurable real-time
+  factor, injected into the task queue before its workers start
+- S3: a moto server, reached through AWS_ENDPOINT_URL
+- Redis: a fakeredis TCP server, reached through REDIS_URL
+- the novel site: a local HTTP server with deterministic chapter fixtures
+
+The service runs in a child process (so its CPU and RSS are measured alone)
+and N simulated listeners request different books concurrently over HTTP.
+A second, cached pass repeats the same requests once the audio is stored.
+The report is JSON: time to first audio and stream time percentiles,
+throughput in audio-seconds per wall-second, the service's per-stage
+latency percentiles (from /health), CPU seconds per audio-minute and RSS.
+Needs the service's own dependencies (torch, ffmpeg, ...) plus
+benchmarks/requirements.txt (moto, fakeredis) but no GPU. Run from gpuServer/:
+
+    python -m benchmarks.bench_e2e --listeners 8 --rtf 0.2
+    python -m benchmarks.bench_e2e --listeners 32 --backend redis --format sse --output report.json
+"""
+import os
+import sys
+import json
+import time
+import logging
+import socket
+import random
+import shutil
+import argparse
+import tempfile
+import statistics
+import threading
+import subprocess
+import contextlib
+import http.client
+from urllib.parse import urlencode
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from streaming.framing import HEADER, FRAME_AUDIO, FRAME_END, FRAME_ERROR, FRAME_META
+
+BUCKET_NAME = 'novelverse-audio-storage-20260131'
+WORDS = ("the sect elder raised his hand and the courtyard fell silent while young disciples "
+         "watched the distant mountain where a thin line of smoke rose into the pale morning sky").split()
+READY_TIMEOUT = 120
+STREAM_TIMEOUT = 600
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def chapter_html(slug, ch_nr, words, seed):
+    """Deterministic chapter page in the layout chapter_parser expects."""
+    rng = random.Random(f"{seed}:{slug}:{ch_nr}")
+    paragraphs, count = [], 0
+    while count < words:
+        sentences = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 18))).capitalize() + "."
+                     for _ in range(rng.randint(1, 4))]
+        paragraphs.append(f"<p>{' '.join(sentences)}</p>")
+        count += sum(len(s.split()) for s in sentences)
+    return (f"<html><head><title>{slug} chapter {ch_nr}</title></head><body>"
+            f"<div class=\"chapter-content\">{''.join(paragraphs)}</div></body></html>")
+
+
+def start_fixture_site(words, seed, latency):
+    """Serves /novel/<slug>_<n>.html, the URL get_chapter_url builds from a /novel/<slug>.html book URL."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            name = self.path.rsplit("/", 1)[-1].removesuffix(".html")
+            slug, _, ch_nr = name.rpartition("_")
+            if not self.path.startswith("/novel/") or not ch_nr.isdigit():
+                self.send_error(404)
+                return
+            time.sleep(latency)
+            body = chapter_html(slug, int(ch_nr), words, seed).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_fake_services():
+    """moto S3 (with the audio bucket) and a fakeredis TCP server; returns them and the env pointing at them."""
+    import boto3
+    import fakeredis
+    from moto.server import ThreadedMotoServer
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)  # moto's per-request access log
+    s3_port = free_port()
+    moto = ThreadedMotoServer(ip_address="127.0.0.1", port=s3_port)
+    with contextlib.redirect_stdout(sys.stderr):  # stdout is for the report
+        moto.start()
+    redis_server = fakeredis.TcpFakeServer(("127.0.0.1", 0), server_type="redis")
+    threading.Thread(target=redis_server.serve_forever, daemon=True).start()
+
+    env = {
+        "AWS_ENDPOINT_URL": f"http://127.0.0.1:{s3_port}",
+        "AWS_ACCESS_KEY_ID": "bench",
+        "AWS_SECRET_ACCESS_KEY": "bench",
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "REDIS_URL": f"redis://127.0.0.1:{redis_server.server_address[1]}/0",
+    }
+    boto3.client("s3", endpoint_url=env["AWS_ENDPOINT_URL"], region_name="us-east-1",
+                 aws_access_key_id="bench", aws_secret_access_key="bench").create_bucket(Bucket=BUCKET_NAME)
+    return moto, redis_server, env
+
+
+def serve(port, rtf, overhead_ms):
+    """Child process: the real service with the stub model, on a threaded WSGI server."""
+    from werkzeug.serving import make_server
+    from benchmarks.stub_model import StubModelPool, chars_per_second_for_rtf
+    import server
+
+    if server.task_queue.model_pool is not None:
+        server.task_queue.model_pool = StubModelPool(server.SAMPLE_RATE, overhead_ms, chars_per_second_for_rtf(rtf))
+    server.task_queue.start(server.worker_function)
+    make_server("127.0.0.1", port, server.app, threaded=True).serve_forever()
+
+
+class ProcessMonitor:
+    """CPU seconds and RSS of a child process, from /proc."""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.ticks = os.sysconf("SC_CLK_TCK")
+
+    def cpu_seconds(self):
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / self.ticks  # utime + stime
+
+    def memory_mib(self):
+        values = {}
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    name, kb = line.split()[:2]
+                    values[name.rstrip(":")] = int(kb) / 1024
+        return values.get("VmRSS"), values.get("VmHWM")
+
+
+def wait_ready(port, proc):
+    deadline = time.monotonic() + READY_TIMEOUT
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Service exited with {proc.returncode} before it was ready")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            conn.request("GET", "/health")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError("Service did not become ready")
+
+
+def get_json(port, path):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    conn.request("GET", path)
+    return json.loads(conn.getresponse().read())
+
+
+def read_exact(response, n):
+    data = response.read(n)
+    if len(data) < n:
+        raise EOFError("Stream ended mid-frame")
+    return data
+
+
+def listen_binary(response, result, start):
+    while True:
+        kind, length = HEADER.unpack(read_exact(response, HEADER.size))
+        payload = read_exact(response, length)
+        if kind == FRAME_AUDIO and result["ttfa"] is None:
+            result["ttfa"] = time.perf_counter() - start
+        elif kind == FRAME_META:
+            result["cached"] = json.loads(payload).get("cached", False)
+        elif kind == FRAME_END:
+            result["audio_seconds"] = json.loads(payload).get("duration") or 0
+            return
+        elif kind == FRAME_ERROR:
+            raise RuntimeError(json.loads(payload).get("message"))
+        if kind == FRAME_AUDIO:
+            result["audio_bytes"] += length
+
+
+def listen_sse(response, result, start):
+    for line in response:
+        if not line.startswith(b"data: "):
+            continue
+        event = json.loads(line[6:])
+        status = event.get("status")
+        if status == "chunk":
+            if result["ttfa"] is None:
+                result["ttfa"] = time.perf_counter() - start
+            result["audio_bytes"] += len(event["audio_bytes"]) * 3 // 4
+        elif status == "started":
+            result["cached"] = event.get("cached", False)
+        elif status == "audio-info":
+            result["audio_seconds"] = event.get("duration") or 0  # the last one is the measured duration
+        elif status == "complete":
+            return
+        elif status == "error":
+            raise RuntimeError(event.get("message"))
+    raise EOFError("Stream ended without completing")
+
+
+def listener(port, book_url, ch_nr, stream_format, preload, results):
+    result = {"book_url": book_url, "ttfa": None, "audio_seconds": 0, "audio_bytes": 0, "cached": None,
+              "error": None}
+    start = time.perf_counter()
+    try:
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=STREAM_TIMEOUT)
+        query = urlencode({"book_url": book_url, "chapter_nr": ch_nr, "format": stream_format, "preload": preload})
+        conn.request("GET", f"/stream?{query}")
+        response = conn.getresponse()
+        if response.status != 200:
+            raise RuntimeError(f"HTTP {response.status}: {response.read()[:200]!r}")
+        (listen_binary if stream_format == "binary" else listen_sse)(response, result, start)
+    except Exception as e:
+        result["error"] = str(e)
+    result["seconds"] = time.perf_counter() - start
+    results.append(result)
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+
+    def pct(p):
+        return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+    return {"count": len(values), "mean": round(statistics.fmean(values), 4), "p50": round(pct(50), 4),
+            "p95": round(pct(95), 4), "p99": round(pct(99), 4), "max": round(values[-1], 4)}
+
+
+def run_phase(port, monitor, books, args):
+    results = []
+    cpu_before = monitor.cpu_seconds()
+    start = time.perf_counter()
+    threads = [threading.Thread(target=listener, args=(port, book, 1, args.format, args.preload, results))
+               for book in books]
+    for thread in threads:
+        thread.start()
+        time.sleep(args.ramp / max(1, len(books)))
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    cpu = monitor.cpu_seconds() - cpu_before
+
+    ok = [r for r in results if r["error"] is None]
+    audio_seconds = sum(r["audio_seconds"] for r in ok)
+    return {
+        "listeners": len(results),
+        "ok": len(ok),
+        "errors": sorted({r["error"] for r in results if r["error"]}),
+        "served_cached": sum(1 for r in ok if r["cached"]),
+        "wall_seconds": round(wall, 3),
+        "audio_seconds": round(audio_seconds, 2),
+        "throughput_audio_s_per_wall_s": round(audio_seconds / wall, 3) if wall else None,
+        "time_to_first_audio": percentiles([r["ttfa"] for r in ok if r["ttfa"] is not None]),
+        "stream_seconds": percentiles([r["seconds"] for r in ok]),
+        "audio_mib": round(sum(r["audio_bytes"] for r in ok) / 2**20, 3),
+        "service_cpu_seconds": round(cpu, 3),
+        "service_cpu_s_per_audio_min": round(cpu / (audio_seconds / 60), 4) if audio_seconds else None,
+    }
+
+
+def wait_drained(port, timeout=120):
+    """Waits until every generated chapter (preloads included) is out of in-flight: stored, or failed to."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if get_json(port, "/health")["inflight"]["in_flight"] == 0:
+            return True
+        time.sleep(0.5)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--listeners", type=int, default=8, help="concurrent listeners, one book each")
+    parser.add_argument("--rtf", type=float, default=0.2, help="stub model seconds per second of audio")
+    parser.add_argument("--overhead-ms", type=float, default=30, help="stub model cost per call")
+    parser.add_argument("--words", type=int, default=1500, help="words per fixture chapter")
+    parser.add_argument("--site-latency-ms", type=float, default=50, help="fixture site response delay")
+    parser.add_argument("--format", choices=("binary", "sse"), default="binary")
+    parser.add_argument("--preload", type=int, default=1, help="chapters preloaded per request")
+    parser.add_argument("--backend", choices=("thread", "redis"), default="thread",
+                        help="TASK_BACKEND (the stub cannot be injected into process-backend workers)")
+    parser.add_argument("--ramp", type=float, default=1.0, help="seconds over which listeners connect")
+    parser.add_argument("--no-cached-pass", action="store_true", help="skip the second, cached pass")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.rtf, args.overhead_ms)
+        return
+
+    site = start_fixture_site(args.words, args.seed, args.site_latency_ms / 1000)
+    moto, redis_server, env = start_fake_services()
+    port = free_port()
+    cache_dir = tempfile.mkdtemp(prefix="bench-e2e-")
+    child_env = {**os.environ, **env, "TASK_BACKEND": args.backend, "AUDIO_CACHE_DIR": cache_dir,
+                 "SCRAPER_BROWSER_FALLBACK": "0"}
+    proc = subprocess.Popen([sys.executable, "-m", "benchmarks.bench_e2e", "--serve", str(port),
+                             "--rtf", str(args.rtf), "--overhead-ms", str(args.overhead_ms)],
+                            env=child_env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(port, proc)
+        monitor = ProcessMonitor(proc.pid)
+        rss_idle, _ = monitor.memory_mib()
+        site_url = f"http://127.0.0.1:{site.server_address[1]}"
+        books = [f"{site_url}/novel/bench-{args.seed}-{i}.html" for i in range(args.listeners)]
+        print(f"{args.listeners} listeners, stub RTF {args.rtf}, {args.words} words/chapter, "
+              f"{args.backend} backend, {args.format} streams", file=sys.stderr)
+
+        phases = {"cold": run_phase(port, monitor, books, args)}
+        if not args.no_cached_pass:
+            drained = wait_drained(port)
+            phases["cached"] = run_phase(port, monitor, books, args)
+            phases["cached"]["inflight_drained_before_pass"] = drained
+        rss, rss_peak = monitor.memory_mib()
+        health = get_json(port, "/health")
+
+        report = {
+            "config": {key: value for key, value in vars(args).items() if key not in ("serve", "output")},
+            "phases": phases,
+            "service": {"rss_idle_mib": round(rss_idle, 1), "rss_end_mib": round(rss, 1),
+                        "rss_peak_mib": round(rss_peak, 1), "cpu_seconds": round(monitor.cpu_seconds(), 3)},
+            "stages": health.get("timings", {}),
+            "health": {key: health.get(key) for key in ("jobs", "inference", "postprocess", "audio_cache",
+                                                        "mp3_encoders", "chapter_text_cache")},
+        }
+        for name, phase in phases.items():
+            ttfa = phase["time_to_first_audio"] or {}
+            print(f"{name:>6}: {phase['ok']}/{phase['listeners']} ok, TTFA p50 {ttfa.get('p50')}s "
+                  f"p95 {ttfa.get('p95')}s, {phase['throughput_audio_s_per_wall_s']} audio-s/s", file=sys.stderr)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+        moto.stop()
+        redis_server.shutdown()
+        site.shutdown()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Benchmark: time to first audio block, paragraph segments vs tts.segmenter.
+
+Runs TTSPipeline over the same chapter with the old one-segment-per-paragraph
+split and with segment_text, on the stub model (benchmarks/stub_model.py), and
+reports time to the first block, total synthesis time and model calls. The
+stub's cost model is set with --overhead-ms / --chars-per-second. Run from gpuServer/:
+
+    python -m benchmarks.bench_first_audio
+    python -m benchmarks.bench_first_audio --chars-per-second 150 --chapter chapter.txt
+"""
+import re
+import time
+import argparse
+import statistics
+import threading
+
+from benchmarks.stub_model import StubModelPool, DEFAULT_OVERHEAD_MS, DEFAULT_CHARS_PER_SECOND
+from tts.inference_scheduler import InferenceScheduler
+from tts.model_pool import DEFAULT_LANG_CODE
+from tts.segmenter import Segment, segment_text
+from tts.tts_pipeline import TTSPipeline
+from tts.audio_format import PIPELINE_SAMPLE_RATE, PIPELINE_DTYPE, block_size_for
+
+SAMPLE_RATE = PIPELINE_SAMPLE_RATE
+BLOCK_SIZE = block_size_for(SAMPLE_RATE)
+DTYPE = PIPELINE_DTYPE
+
+OPENING = ("Lin Feng stood before the towering gate of the Azure Cloud Sect, his breath misting in the cold "
+           "mountain air, while behind him the disciples of the outer court whispered and pointed, some with "
+           "envy, some with open contempt, and a few with something that looked almost like fear. He had waited "
+           "three years for this day, three years of sweeping courtyards and carrying water and swallowing every "
+           "insult the inner disciples threw at him, and now the gate was finally in front of him. ")
+BODY = ('"Open it," he said quietly. Nobody moved. The elder on the wall looked down at him for a long moment, '
+        'then turned away without a word, and the wind carried the sound of a distant bell across the valley.')
+
+
+def paragraph_segments(text):
+    """What TTSPipeline did before tts.segmenter: one segment per line."""
+    for paragraph, match in enumerate(re.finditer(r'[^\n]+', text)):
+        if match.group().strip():
+            yield Segment(match.group(), match.start(), match.end(), paragraph)
+
+
+class BenchTask:
+    priority = 0
+    error = None
+
+    def is_canceled(self):
+        return False
+
+    def set_error(self, msg):
+        self.error = msg
+
+    def add_timing(self, entry):
+        pass
+
+
+def run(scheduler, text, segmenter):
+    pipeline = TTSPipeline("bench", DTYPE, BLOCK_SIZE, SAMPLE_RATE, threading.Event(), BenchTask(), scheduler,
+                           segmenter=segmenter)
+    start = time.perf_counter()
+    first = None
+    samples = 0
+    for is_final, block in pipeline.generate_audio_chunks(text):
+        if first is None:
+            first = time.perf_counter() - start
+        samples += len(block)
+    return first, time.perf_counter() - start, samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chapter", help="chapter text file (default: synthetic chapter with a long opening)")
+    parser.add_argument("--paragraphs", type=int, default=30, help="paragraphs in the synthetic chapter")
+    parser.add_argument("--opening-sentences", type=int, default=3, help="length of the synthetic opening paragraph")
+    parser.add_argument("--overhead-ms", type=float, default=DEFAULT_OVERHEAD_MS)
+    parser.add_argument("--chars-per-second", type=float, default=DEFAULT_CHARS_PER_SECOND)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.chapter:
+        with open(args.chapter, encoding="utf-8") as f:
+            text = f.read()
+    else:
+        text = "\n\n".join([OPENING * args.opening_sentences] + [BODY] * args.paragraphs)
+
+    pool = StubModelPool(SAMPLE_RATE, args.overhead_ms, args.chars_per_second)
+    scheduler = InferenceScheduler(pool, DEFAULT_LANG_CODE, "cpu")
+    scheduler.start()
+    model = pool.load(DEFAULT_LANG_CODE, "cpu")
+
+    print(f"{len(text)} chars, first line {len(text.splitlines()[0])} chars, stub model "
+          f"{args.overhead_ms:.0f} ms + {args.chars_per_second:.0f} chars/s")
+    print(f"{'segmenter':>10} {'segments':>9} {'first ms':>9} {'total s':>8} {'audio s':>8} {'calls':>6}")
+    results = {}
+    for name, segmenter in (("paragraph", paragraph_segments), ("sentence", segment_text)):
+        firsts, totals = [], []
+        calls_before = model.pipeline.calls
+        for _ in range(args.repeat):
+            first, total, samples = run(scheduler, text, segmenter)
+            firsts.append(first)
+            totals.append(total)
+        calls = (model.pipeline.calls - calls_before) // args.repeat
+        results[name] = statistics.median(firsts)
+        print(f"{name:>10} {len(list(segmenter(text))):>9} {statistics.median(firsts) * 1000:>9.1f} "
+              f"{statistics.median(totals):>8.2f} {samples / SAMPLE_RATE:>8.1f} {calls:>6}")
+    scheduler.stop()
+    print(f"first audio {results['paragraph'] / results['sentence']:.1f}x sooner with sentence segments")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Benchmark: CPU per audio-second for /stream MP3 encoding.
+
+Compares the old path (pydub export, one ffmpeg process per ~0.4 s chunk) with a
+persistent streaming.encoder.Mp3EncoderSession fed the same chunks. CPU time
+includes the ffmpeg children. Needs ffmpeg on PATH. Run from gpuServer/:
+
+    python -m benchmarks.bench_mp3_encoder --seconds 60
+"""
+import argparse
+import io
+import resource
+import time
+
+import numpy as np
+from pydub import AudioSegment
+
+from streaming.encoder import FFMPEG_PATH, Mp3EncoderPool
+
+SAMPLE_RATE = 48000
+BLOCK_SIZE = 19200
+
+
+def cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def make_chunks(seconds):
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    signal = 0.3 * np.sin(2 * np.pi * 180 * t) * (0.5 + 0.5 * np.sin(2 * np.pi * 3 * t))
+    signal += 0.02 * rng.standard_normal(len(t))
+    pcm = (np.clip(signal, -1, 1) * 32767).astype(np.int16)
+    return [pcm[i:i + BLOCK_SIZE].tobytes() for i in range(0, len(pcm), BLOCK_SIZE)]
+
+
+def per_chunk_export(chunks):
+    AudioSegment.converter = FFMPEG_PATH
+    out = 0
+    for chunk in chunks:
+        buf = io.BytesIO()
+        AudioSegment(chunk, frame_rate=SAMPLE_RATE, sample_width=2, channels=1).export(
+            buf, format="mp3", codec="libmp3lame")
+        out += len(buf.getvalue())
+    return out
+
+
+def persistent_session(chunks):
+    session = Mp3EncoderPool(1).open_session(SAMPLE_RATE)
+    out = 0
+    for chunk in chunks:
+        out += len(session.feed(chunk))
+    out += len(session.close())
+    return out
+
+
+def measure(name, fn, chunks, seconds):
+    cpu_start, wall_start = cpu_seconds(), time.perf_counter()
+    out_bytes = fn(chunks)
+    cpu, wall = cpu_seconds() - cpu_start, time.perf_counter() - wall_start
+    print(f"{name:>20} {cpu / seconds * 1000:>14.1f} {wall / seconds * 1000:>15.1f} {out_bytes:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=60)
+    args = parser.parse_args()
+
+    chunks = make_chunks(args.seconds)
+    print(f"{len(chunks)} chunks of {BLOCK_SIZE / SAMPLE_RATE:.2f}s")
+    print(f"{'path':>20} {'cpu ms/audio-s':>14} {'wall ms/audio-s':>15} {'mp3 bytes':>10}")
+    measure("per-chunk export", per_chunk_export, chunks, args.seconds)
+    measure("persistent session", persistent_session, chunks, args.seconds)
+
+
+if __name__ == '__main__':
+    main()
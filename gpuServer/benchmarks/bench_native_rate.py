@@ -0,0 +1,103 @@
+"""Benchmark: CPU and memory per audio-minute, upsampled 48 kHz vs native 24 kHz pipeline.
+
+Each mode runs in its own child process so RSS numbers do not mix. A child
+synthesizes --chapters chapters with the stub model (benchmarks/stub_model.py,
+which sleeps instead of computing, so the CPU measured is the pipeline's own:
+resampling, dtype conversion, buffering), keeps every Task alive like a node
+serving listeners, then converts the buffers to s16le the way the MP3 and
+Opus encoders are fed. Reported per minute of audio: CPU seconds in the
+pipeline and in the encoder feed, Task buffer bytes and RSS growth. Run from
+gpuServer/:
+
+    python -m benchmarks.bench_native_rate
+    python -m benchmarks.bench_native_rate --modes 48000:float32 24000:int16 --chapters 8
+"""
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+import subprocess
+
+from benchmarks.stub_model import StubModelPool
+from tts.audio_format import block_size_for, to_int16
+from tts.model_pool import DEFAULT_LANG_CODE, get_rss_bytes
+
+DEFAULT_MODES = ["48000:float32", "24000:float32", "24000:int16"]
+SENTENCE = "The young master looked up at the sect gate and took a slow breath before stepping inside."
+WPM = 187
+
+
+def run_mode(sample_rate, dtype, chapters, words):
+    from tasks.task_queue import Task
+    from tts.inference_scheduler import InferenceScheduler
+    from tts.tts_pipeline import TTSPipeline
+
+    block_size = block_size_for(sample_rate)
+    pool = StubModelPool(sample_rate, overhead_ms=0, chars_per_second=1e9)  # model time out of the picture
+    scheduler = InferenceScheduler(pool, DEFAULT_LANG_CODE, "cpu")
+    scheduler.start()
+    text = "\n".join(SENTENCE for _ in range(max(1, words // len(SENTENCE.split()))))
+    rss_before = get_rss_bytes()
+
+    tasks = []
+    pipeline_cpu = 0.0
+    for ch in range(chapters):
+        task = Task(str(uuid.uuid4()), text, ch, "https://bench.local/novel/bench.html", WPM,
+                    words / WPM * 60, dtype, sample_rate)
+        pipeline = TTSPipeline("bench", dtype, block_size, sample_rate, threading.Event(), task, scheduler)
+        start = time.process_time()
+        for _, block in pipeline.generate_audio_chunks(text):
+            task.put_chunk(block)
+        pipeline_cpu += time.process_time() - start
+        tasks.append(task)
+    rss_after = get_rss_bytes()
+
+    start = time.process_time()
+    for task in tasks:
+        pcm = task.audio.read()
+        for pos in range(0, len(pcm), block_size):
+            to_int16(pcm[pos:pos + block_size]).tobytes()
+    encode_feed_cpu = time.process_time() - start
+    scheduler.stop()
+
+    audio_minutes = sum(len(task.audio) for task in tasks) / sample_rate / 60
+    return {
+        "mode": f"{sample_rate}:{dtype}",
+        "audio_minutes": round(audio_minutes, 2),
+        "pipeline_cpu_s_per_min": round(pipeline_cpu / audio_minutes, 4),
+        "encode_feed_cpu_s_per_min": round(encode_feed_cpu / audio_minutes, 4),
+        "buffer_mib_per_min": round(sum(task.audio.capacity * task.audio.dtype.itemsize for task in tasks)
+                                    / 2**20 / audio_minutes, 2),
+        "rss_mib_per_min": round((rss_after - rss_before) / 2**20 / audio_minutes, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", default=DEFAULT_MODES, help="sample_rate:dtype per run")
+    parser.add_argument("--chapters", type=int, default=4)
+    parser.add_argument("--words", type=int, default=3000, help="words per chapter")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        sample_rate, dtype = args.child.split(":")
+        print(json.dumps(run_mode(int(sample_rate), dtype, args.chapters, args.words)))
+        return
+
+    print(f"{args.chapters} chapters x {args.words} words per mode (stub model, CPU is pipeline-only)")
+    print(f"{'mode':>14} {'audio min':>10} {'pipe cpu s/min':>15} {'feed cpu s/min':>15} "
+          f"{'buffer MiB/min':>15} {'RSS MiB/min':>12}")
+    for mode in args.modes:
+        out = subprocess.run([sys.executable, "-m", "benchmarks.bench_native_rate", "--child", mode,
+                              "--chapters", str(args.chapters), "--words", str(args.words)],
+                             capture_output=True, text=True, check=True).stdout
+        r = json.loads(out.strip().splitlines()[-1])
+        print(f"{r['mode']:>14} {r['audio_minutes']:>10.1f} {r['pipeline_cpu_s_per_min']:>15.4f} "
+              f"{r['encode_feed_cpu_s_per_min']:>15.4f} {r['buffer_mib_per_min']:>15.2f} {r['rss_mib_per_min']:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
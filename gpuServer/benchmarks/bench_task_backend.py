@@ -0,0 +1,95 @@
+"""Benchmark: chapter throughput of the thread vs process TaskQueue backends.
+
+Renders the same batch of synthetic chapters through each backend and reports
+wall time, realtime factor and how much CPU the HTTP (parent) process burned.
+Meant for a many-core CPU box (or a multi-GPU one with --devices). Needs the
+real Kokoro model; nothing is uploaded to S3. Run from gpuServer/:
+
+    python -m benchmarks.bench_task_backend --processes 1 2 4 8 --chapters 16
+    python -m benchmarks.bench_task_backend --backends process --devices cuda:0,cuda:1
+"""
+import os
+
+os.environ["AUDIO_UPLOAD"] = "0"  # before tasks.* is imported (spawned workers inherit it)
+
+import argparse
+import resource
+import time
+import uuid
+
+from tasks.process_backend import ProcessTaskQueue, plan_devices
+from tasks.task_queue import TaskQueue, TaskChain, Task, worker_function
+from tts.audio_format import PIPELINE_SAMPLE_RATE, PIPELINE_DTYPE, block_size_for
+
+SAMPLE_RATE = PIPELINE_SAMPLE_RATE
+BLOCK_SIZE = block_size_for(SAMPLE_RATE)
+DTYPE = PIPELINE_DTYPE
+WPM = 187
+SENTENCE = "The young master looked up at the sect gate and took a slow breath before stepping inside."
+
+
+def make_chapters(n, words):
+    sentences = max(1, words // len(SENTENCE.split()))
+    text = "\n".join(SENTENCE for _ in range(sentences))
+    return [Task(str(uuid.uuid4()), text, ch, "https://bench.local/novel/bench.html", WPM,
+                 words / WPM * 60, DTYPE, SAMPLE_RATE) for ch in range(1, n + 1)]
+
+
+def parent_cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run(task_queue, chapters, words):
+    task_queue.start(worker_function)
+    tasks = make_chapters(chapters, words)
+    cpu_start = parent_cpu_seconds()
+    start = time.perf_counter()
+    # One chain per chapter with its own user so fair share does not serialize them
+    for task in tasks:
+        task_queue.put_chain(TaskChain(str(uuid.uuid4()), [task], user_id=task.task_id, live_ch=task.ch))
+    for task in tasks:
+        while not task.done:
+            task.wait_for_samples(len(task.audio), timeout=1)
+    wall = time.perf_counter() - start
+    cpu = parent_cpu_seconds() - cpu_start
+    task_queue.stop()
+
+    errors = [task.error for task in tasks if task.error]
+    audio_seconds = sum(len(task.audio) for task in tasks) / SAMPLE_RATE
+    return wall, audio_seconds, cpu, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["thread", "process"], choices=["thread", "process"])
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4],
+                        help="worker process counts to sweep (CPU core sets are split evenly)")
+    parser.add_argument("--devices", help="explicit comma-separated device list for the process backend")
+    parser.add_argument("--threads", type=int, default=10, help="workers for the thread backend")
+    parser.add_argument("--threads-per-process", type=int, default=2)
+    parser.add_argument("--chapters", type=int, default=8)
+    parser.add_argument("--words", type=int, default=600, help="words per chapter")
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs, {args.chapters} chapters x {args.words} words")
+    print(f"{'backend':>8} {'procs':>6} {'wall s':>8} {'audio s':>8} {'x realtime':>11} "
+          f"{'ch/min':>7} {'parent cpu s':>13} {'errors':>7}")
+
+    runs = []
+    if "thread" in args.backends:
+        runs.append(("thread", "-", lambda: TaskQueue(DTYPE, SAMPLE_RATE, BLOCK_SIZE, args.threads)))
+    if "process" in args.backends:
+        plans = [plan_devices(args.devices)] if args.devices else [plan_devices("", n) for n in args.processes]
+        for plan in plans:
+            runs.append(("process", len(plan), lambda plan=plan: ProcessTaskQueue(
+                DTYPE, SAMPLE_RATE, BLOCK_SIZE, devices=plan, threads_per_process=args.threads_per_process)))
+
+    for name, procs, factory in runs:
+        wall, audio_seconds, cpu, errors = run(factory(), args.chapters, args.words)
+        print(f"{name:>8} {procs:>6} {wall:>8.2f} {audio_seconds:>8.1f} {audio_seconds / wall:>11.2f} "
+              f"{args.chapters / wall * 60:>7.1f} {cpu:>13.2f} {len(errors):>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Stand-in for the Kokoro ModelPool with a predictable cost model, for benchmarks.
+
+A call costs `overhead_ms + chars / chars_per_second` of wall time (sleeping,
+like a GPU kernel would, so it does not hold the GIL) and returns
+`SAMPLES_PER_CHAR` samples of a quiet tone per input character.
+"""
+import time
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import torch
+import torchaudio
+
+from tts.model_pool import MODEL_SAMPLE_RATE, PooledModel
+
+SAMPLES_PER_CHAR = MODEL_SAMPLE_RATE // 15  # ~15 characters of narration per second
+DEFAULT_OVERHEAD_MS = 30
+DEFAULT_CHARS_PER_SECOND = 1500  # roughly a mid-range GPU; a CPU box is closer to 150
+
+
+def chars_per_second_for_rtf(rtf):
+    """Stub speed at which synthesis takes `rtf` seconds per second of audio (ignoring the per-call overhead)."""
+    return MODEL_SAMPLE_RATE / (SAMPLES_PER_CHAR * rtf)
+
+
+class StubKPipeline:
+    def __init__(self, overhead_ms=DEFAULT_OVERHEAD_MS, chars_per_second=DEFAULT_CHARS_PER_SECOND):
+        self.overhead = overhead_ms / 1000
+        self.chars_per_second = chars_per_second
+        self.calls = 0
+
+    def __call__(self, text, voice=None, speed=1, split_pattern=None):
+        self.calls += 1
+        time.sleep(self.overhead + len(text) / self.chars_per_second)
+        t = np.arange(len(text) * SAMPLES_PER_CHAR, dtype=np.float32)
+        yield text, None, torch.from_numpy(0.1 * np.sin(2 * np.pi * 220 * t / MODEL_SAMPLE_RATE))
+
+
+class StubModelPool:
+    """Same interface as tts.model_pool.ModelPool, backed by StubKPipeline."""
+
+    def __init__(self, sample_rate, overhead_ms=DEFAULT_OVERHEAD_MS, chars_per_second=DEFAULT_CHARS_PER_SECOND):
+        self.sample_rate = sample_rate
+        self.overhead_ms = overhead_ms
+        self.chars_per_second = chars_per_second
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def load(self, lang_code, device):
+        key = (lang_code, str(device))
+        with self._lock:
+            if key not in self._models:
+                resampler = None
+                if self.sample_rate != MODEL_SAMPLE_RATE:
+                    resampler = torchaudio.transforms.Resample(orig_freq=MODEL_SAMPLE_RATE, new_freq=self.sample_rate)
+                self._models[key] = PooledModel(lang_code, device,
+                                                StubKPipeline(self.overhead_ms, self.chars_per_second),
+                                                resampler, 0.0, 0.0, 0)
+            return self._models[key]
+
+    @contextmanager
+    def lease(self, lang_code, device):
+        model = self.load(lang_code, device)
+        with self._lock:
+            model.active_leases += 1
+            model.total_leases += 1
+        try:
+            yield model
+        finally:
+            with self._lock:
+                model.active_leases -= 1
+
+    def stats(self):
+        with self._lock:
+            models = [model.stats() for model in self._models.values()]
+        return {"models": models, "stub": True}
@@ -1,74 +1,88 @@
-from pydub import AudioSegment
 import io
 import numpy as np
 import hashlib
 from mutagen.oggopus import OggOpus
 import subprocess
 
-SAMPLE_RATE = 48000
+from streaming.encoder import FFMPEG_PATH
+from tts.audio_format import PIPELINE_SAMPLE_RATE, to_dtype, to_int16
+
+SAMPLE_RATE = PIPELINE_SAMPLE_RATE
 SAMPLE_WIDTH = 2
 CHANNELS = 1
+OPUS_BITRATE = "48k"          # or "32k" for even smaller size
+
+
+def tag_opus(opus_bytes: bytes, task) -> bytes:
+    """Writes DURATION / LYRICS / WPM into the Ogg Opus comment header in memory (no remux, no size limit)."""
+    buf = io.BytesIO(opus_bytes)
+    audio = OggOpus(buf)
+    audio["DURATION"] = f"{task.duration:.2f}"
+    audio["LYRICS"] = task.text
+    audio["WPM"] = str(task.wpm)
+    audio.save(buf)
+    return buf.getvalue()
+
+
+def encode_pcm_opus(pcm: np.ndarray, sample_rate=SAMPLE_RATE) -> bytes:
+    """Untagged Ogg Opus of float or int16 PCM, in one ffmpeg pass straight from raw s16le.
 
-def add_metadata_ffmpeg(opus_bytes: bytes, task) -> bytes:
+    libopus takes 24 kHz input as-is, so native-rate audio is never upsampled here.
+    """
+    cmd = [
+        FFMPEG_PATH, "-hide_banner", "-loglevel", "error",
+        "-f", "s16le", "-ar", str(sample_rate), "-ac", str(CHANNELS), "-i", "pipe:0",
+        "-c:a", "libopus", "-b:a", OPUS_BITRATE, "-vbr", "on",
+        "-f", "ogg", "pipe:1",
+    ]
+    return subprocess.run(cmd, input=to_int16(pcm).tobytes(), capture_output=True, check=True).stdout
 
-    # Sanitize/escape text for shell safety
-    safe_text = task.text.replace('\\', '\\\\').replace('"', '\\"').replace('=', '\\=')
-    # Limit length  (truncate or store elsewhere if >100KB)
-    if len(safe_text) > 100_000:
-        safe_text = safe_text[:100_000] + " [truncated]"
 
+def decode_opus(opus_bytes: bytes, dtype='float32', sample_rate=SAMPLE_RATE) -> np.ndarray:
+    """PCM of an Ogg Opus object in `dtype` at `sample_rate` (the reverse of encode_pcm_opus)."""
     cmd = [
-        "ffmpeg",
-        "-i", "pipe:0",
-        "-codec", "copy",               # no re-encode
-        "-map_metadata", "0",
-        "-metadata", f"DURATION={task.duration:.2f}",
-        "-metadata", f"LYRICS={task.text}",
-        "-metadata", f"WPM={task.wpm}",
-        "-f", "ogg",
-        "pipe:1"
+        FFMPEG_PATH, "-hide_banner", "-loglevel", "error",
+        "-f", "ogg", "-i", "pipe:0",
+        "-f", "s16le", "-ar", str(sample_rate), "-ac", str(CHANNELS), "pipe:1",
     ]
-    result = subprocess.run(
-        cmd,
-        input=opus_bytes,
-        capture_output=True,
-        check=True
-    )
-    return result.stdout
-
-def encode_opus(full_audio_float32: np.ndarray, task) -> bytes:
-    # full_audio_float32 is the complete _buffer after generation (at 48 kHz now)
-    clipped = np.clip(full_audio_float32, -1.0, 1.0)
-    int16_pcm = (clipped * 32767).astype(np.int16)
-    raw_bytes = int16_pcm.tobytes()
-
-    audio = AudioSegment(
-        raw_bytes,
-        frame_rate=SAMPLE_RATE,
-        sample_width=SAMPLE_WIDTH,
-        channels=CHANNELS
-    )
-    buf = io.BytesIO()
-    audio.export(
-        buf,
-        format="ogg",
-        codec="libopus",
-        bitrate="48k",          # or "32k" for even smaller size
-        parameters=["-vbr", "on"] 
-    )
-    opus_bytes = buf.getvalue()
-
-    return add_metadata_ffmpeg(opus_bytes, task)
+    result = subprocess.run(cmd, input=opus_bytes, capture_output=True, check=True)
+    return to_dtype(np.frombuffer(result.stdout, dtype=np.int16), dtype)
+
+
+def encode_opus(pcm: np.ndarray, task) -> bytes:
+    # pcm is the complete buffer after generation, at task.sample_rate;
+    # the tags are added by tag_opus, not by a second remux
+    return tag_opus(encode_pcm_opus(pcm, task.sample_rate), task)
+
+
+def normalize_book_url(book_url: str) -> str:
+    return book_url.strip().lower().rstrip('/')
+
+
+def get_book_hash(book_url: str) -> str:
+    # md5 of the normalized URL, first 16 hex chars
+    return hashlib.md5(normalize_book_url(book_url).encode('utf-8')).hexdigest()[:16]
 
 
 def get_s3_key(book_url: str, chapter_nr: int | str) -> str:
+    # Must stay in sync with getS3Key in backend/routs/stream/streamController.ts
+    return f"audio/{get_book_hash(book_url)}/chapter_{chapter_nr}-v1.opus"
+
+
+def get_timing_key(s3_key: str) -> str:
+    # Timing index sidecar next to the audio: chapter_5-v1.opus -> chapter_5-v1.timing.json
+    return s3_key.rsplit(".", 1)[0] + ".timing.json"
+
+
+def get_manifest_key(s3_key: str) -> str:
+    # Segmented layout of the same chapter: chapter_5-v1.opus -> chapter_5-v2/manifest.json
+    return s3_key.rsplit("-v1.", 1)[0] + "-v2/manifest.json"
+
+
+def segment_name(index: int) -> str:
+    return f"segment_{index:05d}.opus"
+
 
-    normalized = book_url.strip().lower().rstrip('/')
-    
-    #hash md5
-    h = hashlib.md5(normalized.encode('utf-8')).hexdigest()
-    
-    short_hash = h[:16]
-    
-    # Consistent naming
-    return f"audio/{short_hash}/chapter_{chapter_nr}-v1.opus"
\ No newline at end of file
+def get_segment_key(s3_key: str, index: int) -> str:
+    # Segments sit next to their manifest: chapter_5-v2/segment_00000.opus, ...
+    return get_manifest_key(s3_key).rsplit("/", 1)[0] + "/" + segment_name(index)
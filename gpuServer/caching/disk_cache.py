@@ -0,0 +1,129 @@
+import os
+import mmap
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+AUDIO_CACHE_DIR = os.environ.get("AUDIO_CACHE_DIR", os.path.join(tempfile.gettempdir(), "novelverse-audio-cache"))
+AUDIO_CACHE_MAX_BYTES = int(os.environ.get("AUDIO_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+TMP_SUFFIX = ".part"
+
+
+class DiskLRUCache:
+    """Byte-budgeted LRU cache of audio objects on local disk, keyed by S3 key.
+
+    Writes land in a temp file next to the target and are renamed into place, so
+    readers never see a half-written object. Reads are mmap-backed; an entry
+    evicted while mapped stays readable until the mapping is closed.
+    """
+
+    def __init__(self, root=AUDIO_CACHE_DIR, max_bytes=AUDIO_CACHE_MAX_BYTES):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> size, least recently used first
+        self._size = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        os.makedirs(self.root, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        found = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                if name.endswith(TMP_SUFFIX):
+                    os.remove(path)  # leftover from a crash mid-write
+                    continue
+                st = os.stat(path)
+                found.append((st.st_mtime, os.path.relpath(path, self.root).replace(os.sep, '/'), st.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._size += size
+        with self._lock:
+            self._evict()
+        logger.info(f"DiskLRUCache: {len(self._entries)} objects, {self._size / 2**20:.0f} MiB in {self.root}")
+
+    def _path(self, key):
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid cache key: {key}")
+        return path
+
+    def contains(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def size_of(self, key):
+        with self._lock:
+            return self._entries.get(key)
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=TMP_SUFFIX)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        with self._lock:
+            self._size -= self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._size += len(data)
+            self._evict()
+
+    def open(self, key):
+        """Read-only mmap of a cached object (caller closes it), or None on a miss."""
+        with self._lock:
+            if key not in self._entries:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+        try:
+            with open(self._path(key), "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            os.utime(self._path(key))  # keep LRU order across restarts
+            return mapped
+        except (OSError, ValueError) as e:
+            logger.warning(f"DiskLRUCache: dropping unreadable {key}: {e}")
+            self.discard(key)
+            return None
+
+    def discard(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)
+                self._remove_file(key)
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._size -= size
+            self._evictions += 1
+            self._remove_file(key)
+
+    def _remove_file(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def stats(self):
+        with self._lock:
+            return {"objects": len(self._entries), "bytes": self._size, "max_bytes": self.max_bytes,
+                    "hits": self._hits, "misses": self._misses, "evictions": self._evictions}
@@ -0,0 +1,51 @@
+import time
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+WINDOW = 1000  # samples kept per stage for percentiles
+
+
+class StageTimings:
+    """Rolling per-stage latency samples (seconds) with count / mean / percentile snapshots."""
+
+    def __init__(self, window=WINDOW):
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._counts = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self._samples[stage].append(seconds)
+            self._counts[stage] += 1
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def snapshot(self):
+        with self._lock:
+            samples = {stage: sorted(values) for stage, values in self._samples.items()}
+            counts = dict(self._counts)
+
+        def pct(values, p):
+            return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+        return {
+            stage: {
+                "count": counts[stage],
+                "mean": round(sum(values) / len(values), 4),
+                "p50": round(pct(values, 50), 4),
+                "p95": round(pct(values, 95), 4),
+                "p99": round(pct(values, 99), 4),
+                "max": round(values[-1], 4),
+            }
+            for stage, values in samples.items() if values
+        }
+
+
+stage_timings = StageTimings()
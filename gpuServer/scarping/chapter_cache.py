@@ -0,0 +1,136 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from scarping.scrape import get_chapter_url, scrape_novel_chapter
+from caching.cache_opum import get_book_hash
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+CHAPTER_CACHE_TTL = int(os.environ.get("CHAPTER_CACHE_TTL", 7 * 24 * 3600))
+CHAPTER_CACHE_MAX_ENTRIES = int(os.environ.get("CHAPTER_CACHE_MAX_ENTRIES", 20000))
+PREFETCH_AHEAD = int(os.environ.get("PREFETCH_AHEAD", 5))
+PREFETCH_WORKERS = int(os.environ.get("PREFETCH_WORKERS", 2))
+MAX_PENDING_PREFETCHES = 200
+
+KEY_PREFIX = "chapter:text"
+LRU_KEY = "chapter:text:lru"  # sorted set: text key -> last access time
+
+
+class ChapterTextCache:
+    """Scraped chapter text in Redis, keyed by (normalized book URL, chapter).
+
+    Entries expire after CHAPTER_CACHE_TTL and the least recently used ones are
+    dropped once there are more than CHAPTER_CACHE_MAX_ENTRIES. Redis errors
+    degrade to a plain scrape.
+    """
+
+    def __init__(self, redis_client, scrape=scrape_novel_chapter,
+                 ttl=CHAPTER_CACHE_TTL, max_entries=CHAPTER_CACHE_MAX_ENTRIES):
+        self.r = redis_client
+        self.scrape = scrape
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._errors = 0
+
+    def key(self, book_url, ch_nr):
+        return f"{KEY_PREFIX}:{get_book_hash(book_url)}:{ch_nr}"
+
+    def _count(self, field):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def get(self, book_url, ch_nr):
+        key = self.key(book_url, ch_nr)
+        try:
+            pipe = self.r.pipeline()
+            pipe.get(key)
+            pipe.zadd(LRU_KEY, {key: time.time()}, xx=True)
+            text, _ = pipe.execute()
+        except Exception as e:
+            logging.warning(f"Chapter cache read failed for {key}: {e}")
+            self._count("_errors")
+            return None
+        self._count("_hits" if text else "_misses")
+        return text
+
+    def contains(self, book_url, ch_nr):
+        try:
+            return bool(self.r.exists(self.key(book_url, ch_nr)))
+        except Exception:
+            return False
+
+    def put(self, book_url, ch_nr, text):
+        key = self.key(book_url, ch_nr)
+        try:
+            pipe = self.r.pipeline()
+            pipe.set(key, text, ex=self.ttl)
+            pipe.zadd(LRU_KEY, {key: time.time()})
+            pipe.zcard(LRU_KEY)
+            _, _, count = pipe.execute()
+            if count > self.max_entries:
+                evicted = [member for member, _ in self.r.zpopmin(LRU_KEY, count - self.max_entries)]
+                if evicted:
+                    self.r.delete(*evicted)
+        except Exception as e:
+            logging.warning(f"Chapter cache write failed for {key}: {e}")
+            self._count("_errors")
+
+    def get_or_scrape(self, book_url, ch_nr):
+        text = self.get(book_url, ch_nr)
+        if text:
+            return text
+        chapter_url = get_chapter_url(book_url, ch_nr)
+        if not chapter_url:
+            return None
+        text = self.scrape(chapter_url)
+        if text:
+            self.put(book_url, ch_nr, text)
+        return text
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self._hits, "misses": self._misses, "errors": self._errors,
+                    "ttl": self.ttl, "max_entries": self.max_entries}
+
+
+class ChapterPrefetcher:
+    """Warms the text cache for chapters ahead of what listeners are playing."""
+
+    def __init__(self, cache, ahead=PREFETCH_AHEAD, max_workers=PREFETCH_WORKERS):
+        self.cache = cache
+        self.ahead = ahead
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._inflight = set()
+        self._lock = threading.Lock()
+        self._fetched = 0
+
+    def warm(self, book_url, from_ch):
+        """Queues chapters [from_ch, from_ch + ahead) that are not cached or already being fetched."""
+        for ch_nr in range(from_ch, from_ch + self.ahead):
+            job = self.cache.key(book_url, ch_nr)
+            with self._lock:
+                if job in self._inflight or len(self._inflight) >= MAX_PENDING_PREFETCHES:
+                    continue
+                self._inflight.add(job)
+            self.executor.submit(self._fetch, job, book_url, ch_nr)
+
+    def _fetch(self, job, book_url, ch_nr):
+        try:
+            if not self.cache.contains(book_url, ch_nr) and self.cache.get_or_scrape(book_url, ch_nr):
+                with self._lock:
+                    self._fetched += 1
+        except Exception as e:
+            logging.warning(f"Prefetch of chapter {ch_nr} failed: {e}")
+        finally:
+            with self._lock:
+                self._inflight.discard(job)
+
+    def stats(self):
+        with self._lock:
+            return {"ahead": self.ahead, "pending": len(self._inflight), "fetched": self._fetched}
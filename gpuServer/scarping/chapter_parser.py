@@ -0,0 +1,123 @@
+"""Chapter text extraction with pluggable HTML parser backends.
+
+Every backend finds the first `div.chapter-content` (falling back to
+`div#chapter-content`) and produces exactly what the original BeautifulSoup
+code did:
+
+    raw = content_div.get_text(separator='\\n', strip=True)
+    text = '\\n\\n'.join(line.strip() for line in raw.split('\\n') if line.strip())
+    text = text.replace('  ', ' ').replace('\\r', '').strip()
+
+but in a single pass over the content's text nodes. selectolax (lexbor) and
+lxml parse in C and only the content container is walked in Python; the
+html.parser backend is kept as the always-available fallback.
+"""
+import os
+import logging
+
+from bs4 import BeautifulSoup
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+HTML_PARSER_BACKEND = os.environ.get("HTML_PARSER_BACKEND", "auto")
+BACKEND_PREFERENCE = ("selectolax", "lxml", "bs4")
+
+# bs4's get_text() leaves out strings inside these (Script, Stylesheet, TemplateString, Ruby* strings)
+SKIP_TAGS = ("script", "style", "template", "rt", "rp")
+
+CONTENT_CLASS = "chapter-content"
+CONTENT_ID = "chapter-content"
+
+
+def clean_text(strings):
+    """Single-pass version of the get_text / split / strip / join / replace cleanup."""
+    lines = []
+    for string in strings:
+        for line in string.split('\n'):
+            line = line.strip()
+            if line:
+                # '\n\n' separators hold no spaces, so the replaces can run per line
+                lines.append(line.replace('  ', ' ').replace('\r', ''))
+    return '\n\n'.join(lines)
+
+
+def _extract_bs4(html):
+    soup = BeautifulSoup(html, "html.parser")
+    content_div = soup.find('div', class_=CONTENT_CLASS) or soup.find('div', id=CONTENT_ID)
+    if not content_div:
+        return None
+    return clean_text(content_div.stripped_strings)
+
+
+def _extract_selectolax(html):
+    tree = LexborHTMLParser(html)
+    content_div = tree.css_first(f"div.{CONTENT_CLASS}") or tree.css_first(f"div#{CONTENT_ID}")
+    if content_div is None:
+        return None
+    content_div.strip_tags(list(SKIP_TAGS))
+    return clean_text(node.text_content for node in content_div.traverse(include_text=True)
+                      if node.tag == "-text")
+
+
+def _lxml_strings(element):
+    # Depth-first text/tail walk; comments and processing instructions have non-string tags
+    stack = [(element, False)]
+    while stack:
+        node, is_tail = stack.pop()
+        if is_tail:
+            if node.tail:
+                yield node.tail
+            continue
+        if isinstance(node.tag, str) and node.tag not in SKIP_TAGS:
+            if node.text:
+                yield node.text
+            for child in reversed(node):
+                stack.append((child, True))
+                stack.append((child, False))
+
+
+def _extract_lxml(html):
+    root = lxml_html.fromstring(html)
+    found = (root.xpath(f"//div[contains(concat(' ', normalize-space(@class), ' '), ' {CONTENT_CLASS} ')]")
+             or root.xpath(f"//div[@id='{CONTENT_ID}']"))
+    if not found:
+        return None
+    return clean_text(_lxml_strings(found[0]))
+
+
+BACKENDS = {"bs4": _extract_bs4}
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+    BACKENDS["selectolax"] = _extract_selectolax
+except ImportError:
+    pass
+
+try:
+    from lxml import html as lxml_html
+    BACKENDS["lxml"] = _extract_lxml
+except ImportError:
+    pass
+
+
+def available_backends():
+    return [name for name in BACKEND_PREFERENCE if name in BACKENDS]
+
+
+def resolve_backend(name=HTML_PARSER_BACKEND):
+    if name == "auto":
+        return available_backends()[0]
+    if name not in BACKENDS:
+        logging.warning(f"HTML parser backend {name!r} not available, using {available_backends()[0]}")
+        return available_backends()[0]
+    return name
+
+
+DEFAULT_BACKEND = resolve_backend()
+
+
+def extract_chapter_text(html, backend=None):
+    """Returns the cleaned chapter text, or None if the page has no chapter content div."""
+    extract = BACKENDS[backend or DEFAULT_BACKEND]
+    text = extract(html)
+    return text.strip() if text is not None else None
@@ -2,26 +2,32 @@ import cloudscraper
 from bs4 import BeautifulSoup
 from colorama import Fore, Back, Style
 import requests  # explicit import for exceptions
+from scarping.session_pool import session_pool, is_challenge
+from scarping.chapter_parser import extract_chapter_text
 
 
+import os
 import logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def load_page_soup(url):
-    # Clean scraper – no debug spam, modern fingerprint
-    scraper = cloudscraper.create_scraper(
-        browser={
-            'browser': 'chrome',
-            'platform': 'windows',
-            'mobile': False,
-            'desktop': True
-        },
-        delay=10  # Still good for challenge timing
-    )
+# 1 = pages still challenged after a fresh scraper session go through the headless browser pool
+BROWSER_FALLBACK = os.environ.get("SCRAPER_BROWSER_FALLBACK", "0") == "1"
+
+
+def load_page_html_browser(url):
+    # Imported on first use: seleniumbase is heavy and only needed once cloudscraper is blocked
+    from scarping.selenium_scrape import browser_pool
+    return browser_pool.load(url)
+
 
+def load_page_html(url):
     try:
-        response = scraper.get(url, timeout=30)
-        
+        response = session_pool.get(url, timeout=30)
+
+        if BROWSER_FALLBACK and is_challenge(response):
+            logging.warning(f"Challenge persisted for [{url}], falling back to a browser")
+            return load_page_html_browser(url)
+
         if response.status_code != 200:
             print(f"Response Code: {response.status_code}")
             logging.info(f"Failed to retrieve page [{url}]: {response.status_code}")
@@ -41,34 +47,30 @@ def load_page_soup(url):
         logging.error(f"Unexpected error scraping [{url}]: {e}")
         return None
 
+    return response.text
+
+
+def load_page_soup(url):
+    html = load_page_html(url)
+    if html is None:
+        return None
     # Parse and return
-    soup = BeautifulSoup(response.text, "html.parser")
+    soup = BeautifulSoup(html, "html.parser")
     return soup
 
 
 def scrape_novel_chapter(url):
-    soup = load_page_soup(url)
-    if not soup:
+    html = load_page_html(url)
+    if html is None:
         logging.error("Failed to load chapter page.")
         return None
 
-    content_div = soup.find('div', class_='chapter-content')
-    if not content_div:
-        content_div = soup.find('div', id='chapter-content')  # fallback
-    if not content_div:
+    # Only the content div is walked; see chapter_parser for the backends
+    clean_text = extract_chapter_text(html)
+    if clean_text is None:
         logging.error("Chapter content div not found.")
         return None
-
-    # 2. Get raw text, ignoring all tags completely
-    raw_text = content_div.get_text(separator='\n', strip=True)
-
-    # 3. Clean up multiple newlines and extra spaces
-    lines = [line.strip() for line in raw_text.split('\n') if line.strip()]
-    clean_text = '\n\n'.join(lines)
-
-    # Optional: fix common bullshit like double spaces or weird chars
-    clean_text = clean_text.replace('  ', ' ').replace('\r', '')
-    return clean_text.strip()
+    return clean_text
 
 def get_chapter_url(base_url, ch_nr):
     """
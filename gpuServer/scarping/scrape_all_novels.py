@@ -1,37 +1,189 @@
-import requests
-from bs4 import BeautifulSoup
-from fake_useragent import UserAgent
+"""fanmtl catalog crawler.
+
+Walks the "newstime" list pages with a bounded pool of fetchers behind a
+per-host token bucket, streams novels to JSONL (deduplicated by bookUrl) and
+checkpoints the set of completed pages so an interrupted crawl resumes
+exactly where it left off. Run from gpuServer/:
+
+    python -m scarping.scrape_all_novels --workers 8 --rate 4
+
+`--refresh` instead walks the listing from page 1 only until it reaches
+known, unchanged novels and writes just the added/updated ones as deltas.
+"""
+import os
+import re
+import json
 import time
 import random
-import json
-import re
 import logging
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from bs4 import BeautifulSoup
 from colorama import Fore, Style
+from scarping.session_pool import session_pool
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-ua = UserAgent()
 BASE_URL = "https://www.fanmtl.com"
+LIST_URL = BASE_URL + "/list/all/all-newstime-{page}.html"  # Confirmed working pattern
 JSONL_FILE = "fanmtl_novels.jsonl"
-PAGE_FILE = "latest_page.txt"
+CHECKPOINT_FILE = "crawl_checkpoint.json"
+LEGACY_PAGE_FILE = "latest_page.txt"
+
+MAX_PAGES = int(os.environ.get("CRAWL_MAX_PAGES", 5000))
+CRAWL_WORKERS = int(os.environ.get("CRAWL_WORKERS", 8))
+REQUESTS_PER_SECOND = float(os.environ.get("CRAWL_RATE", 4.0))
+BURST = 4
+STOP_AFTER_EMPTY = 20  # consecutive empty pages past the last populated one = end of the list
+DELTAS_FILE = "catalog_deltas.jsonl"
+REFRESH_STOP_AFTER_UNCHANGED = 2  # fully unchanged pages in a row before a refresh stops
+
+
+class TokenBucket:
+    """Thread-safe token bucket: at most `rate` acquisitions per second, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_for = (1 - self._tokens) / self.rate
+            time.sleep(wait_for + random.uniform(0, 0.1))  # jitter so workers don't wake in lockstep
+
+
+class Checkpoint:
+    """Set of completed list pages: a JSON snapshot plus an append-only log of pages since.
+
+    Marking a page appends one line to the log (O(1) however far the crawl is);
+    loading folds the log into the snapshot and starts a fresh log.
+    """
+
+    def __init__(self, path=CHECKPOINT_FILE):
+        self.path = path
+        self.log_path = path + ".log"
+        self.completed = set()
+        self._lock = threading.Lock()
+        self._load()
+        self._log = open(self.log_path, "a")
 
-novels = []
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                self.completed = set(json.load(f)["completed_pages"])
+        except (FileNotFoundError, ValueError, KeyError):
+            # Older crawls only recorded the highest page reached
+            try:
+                with open(LEGACY_PAGE_FILE, "r") as f:
+                    self.completed = set(range(1, int(f.read().strip()) + 1))
+            except (FileNotFoundError, ValueError):
+                pass
+        try:
+            with open(self.log_path, "r") as f:
+                for line in f:
+                    if line.endswith("\n") and line.strip().isdigit():  # a torn last line from a crash is skipped
+                        self.completed.add(int(line))
+        except FileNotFoundError:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"completed_pages": sorted(self.completed)}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        os.remove(self.log_path)
 
-def get_last_page():
+    def mark(self, *pages):
+        """Records pages as done; callers flush their novels to disk first."""
+        with self._lock:
+            self.completed.update(pages)
+            self._log.write("".join(f"{page}\n" for page in pages))
+            self._log.flush()
+            os.fsync(self._log.fileno())
+
+    def close(self):
+        with self._lock:
+            self._log.close()
+
+    def is_done(self, page):
+        with self._lock:
+            return page in self.completed
+
+
+class JsonlWriter:
+    """Appends novels to one open JSONL file, skipping bookUrls it has already written."""
+
+    def __init__(self, path=JSONL_FILE):
+        self.path = path
+        self.seen = load_known_urls(path)
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, novel):
+        with self._lock:
+            if novel["bookUrl"] in self.seen:
+                return False
+            self.seen.add(novel["bookUrl"])
+            self._file.write(json.dumps(novel, ensure_ascii=False) + "\n")
+            return True
+
+    def flush(self):
+        """Pushes buffered novels to disk (fsynced), so a checkpoint written after it never runs ahead of them."""
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def load_known_urls(path):
+    known = set()
     try:
-        with open(PAGE_FILE, "r") as f:
-            return int(f.read().strip())
-    except (FileNotFoundError, ValueError):
-        return 0  # Start from page 1 if no file or invalid
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    known.add(json.loads(line)["bookUrl"])
+                except (ValueError, KeyError):
+                    continue
+    except FileNotFoundError:
+        pass
+    return known
+
+
+def load_catalog_index(path=JSONL_FILE):
+    """bookUrl -> (numberOfChapters, isComplete) for every novel in the JSONL catalog."""
+    index = {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    novel = json.loads(line)
+                    index[novel["bookUrl"]] = (novel.get("numberOfChapters", 0), novel.get("isComplete", False))
+                except (ValueError, KeyError):
+                    continue
+    except FileNotFoundError:
+        pass
+    return index
 
-def save_last_page(page):
-    with open(PAGE_FILE, "w") as f:
-        f.write(str(page))
 
 def load_page_soup(url):
-    headers = {"User-Agent": ua.random}
     try:
-        response = requests.get(url, headers=headers, timeout=30)
+        response = session_pool.get(url, timeout=30)
         if response.status_code == 200:
             return BeautifulSoup(response.text, 'html.parser')
         logging.warning(f"HTTP {response.status_code} on {url}")
@@ -40,94 +192,253 @@ def load_page_soup(url):
         logging.error(f"Request error {url}: {e}")
         return None
 
-def scrape_page(page_num):
-    url = f"{BASE_URL}/list/all/all-newstime-{page_num}.html"  # Confirmed working pattern
-    soup = load_page_soup(url)
-    if not soup:
-        return 0
 
+def parse_list_page(soup):
+    """Extracts novel records from one list page."""
     # Repeating novel items - flexible for fanmtl structure
     items = soup.find_all("div", class_=re.compile(r"novel-item|item|list-item", re.I)) or soup.find_all("li")
 
-    added = 0
-    with open(JSONL_FILE, "a", encoding="utf-8") as f:
-        for item in items:
-            a_tag = item.find("a", href=re.compile(r"/novel/"))
-            if not a_tag:
+    novels = []
+    for item in items:
+        a_tag = item.find("a", href=re.compile(r"/novel/"))
+        if not a_tag:
+            continue
+
+        book_url = a_tag['href']
+        if not book_url.startswith("http"):
+            book_url = BASE_URL + book_url
+
+        title = re.sub(r'[\"?*<>|]', '', a_tag.get("title") or a_tag.text.strip() or "Unknown")
+
+        img_tag = item.find("img")
+        cover_img = None
+        if img_tag:
+            # Priority: data-src > data-original > src (fallback placeholder)
+            cover_img = img_tag.get('data-src') or img_tag.get('data-original') or img_tag.get('src')
+            if cover_img and not cover_img.startswith("http"):
+                cover_img = BASE_URL + cover_img
+            # Skip if still placeholder
+            if cover_img and "placeholder" in cover_img:
+                cover_img = None  # Or keep as placeholder if you want
+
+        text = item.get_text(separator=" ")
+        chapters_match = re.search(r'(\d+)\s*Chapters?', text, re.I)
+        num_chapters = int(chapters_match.group(1)) if chapters_match else 0
+
+        is_complete = "Completed" in text or "Complete" in text
+
+        author = "Unknown"  # Often missing on list
+
+        categories = []
+        tag_as = item.find_all("a", href=re.compile(r"/tag/|/genre/"))
+        for tag_a in tag_as:
+            categories.append(tag_a.text.strip())
+
+        novels.append({
+            "title": title,
+            "author": author,
+            "category": categories,
+            "isComplete": is_complete,
+            "coverImg": cover_img,
+            "bookUrl": book_url,
+            "numberOfChapters": num_chapters
+        })
+    return novels
+
+
+def fetch_list_page(page_num, bucket):
+    """Returns the novels on a list page, or None if the page could not be fetched."""
+    bucket.acquire()
+    soup = load_page_soup(LIST_URL.format(page=page_num))
+    if not soup:
+        return None
+    return parse_list_page(soup)
+
+
+def crawl(max_pages=MAX_PAGES, workers=CRAWL_WORKERS, rate=REQUESTS_PER_SECOND,
+          jsonl_file=JSONL_FILE, checkpoint_file=CHECKPOINT_FILE, stop_after_empty=STOP_AFTER_EMPTY):
+    """Crawls list pages 1..max_pages, skipping pages already in the checkpoint.
+
+    Failed and empty pages are not checkpointed, so the next run retries them. Only
+    bookUrls are kept in memory (for dedup); novels go straight to disk.
+    """
+    checkpoint = Checkpoint(checkpoint_file)
+    writer = JsonlWriter(jsonl_file)
+    bucket = TokenBucket(rate)
+    pending_pages = deque(p for p in range(1, max_pages + 1) if not checkpoint.is_done(p))
+    stats = {"pages": 0, "failed_pages": 0, "empty_pages": 0, "novels": 0, "duplicates": 0}
+    last_populated = max(checkpoint.completed, default=0)  # only populated pages are checkpointed
+    started = time.perf_counter()
+
+    logging.info(f"Crawling up to {max_pages} pages, {len(checkpoint.completed)} already done")
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="crawl") as executor:
+        in_flight = {}
+
+        def fill_window():
+            # Keep a bounded window of pages in flight so memory stays flat
+            while len(in_flight) < workers * 2 and pending_pages:
+                if pending_pages[0] > last_populated + stop_after_empty:
+                    return
+                page = pending_pages.popleft()
+                in_flight[executor.submit(fetch_list_page, page, bucket)] = page
+
+        fill_window()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            finished = []
+            for future in done:
+                page = in_flight.pop(future)
+                novels = future.result()
+                if novels is None:
+                    stats["failed_pages"] += 1
+                    logging.warning(f"Page {page} failed - will be retried on the next run")
+                elif not novels:
+                    # Past the end of the list, or a soft block: leave it for the next run
+                    stats["empty_pages"] += 1
+                    logging.warning(f"No novels on page {page}")
+                else:
+                    added = sum(writer.write(novel) for novel in novels)
+                    stats["novels"] += added
+                    stats["duplicates"] += len(novels) - added
+                    stats["pages"] += 1
+                    last_populated = max(last_populated, page)
+                    finished.append(page)
+                    logging.info(f"{Fore.GREEN}Page {page} done - {added} new novels - Total: {stats['novels']}{Style.RESET_ALL}")
+            if finished:
+                # Novels first: a page checkpointed before its novels hit disk would be lost on a crash
+                writer.flush()
+                checkpoint.mark(*finished)
+            fill_window()
+
+    writer.close()
+    checkpoint.close()
+    stats["seconds"] = round(time.perf_counter() - started, 1)
+    logging.info(f"Crawl complete! {stats} -> {jsonl_file}")
+    return stats
+
+
+def diff_novel(novel, index):
+    """Returns the delta record for `novel` against the catalog index, or None if it is unchanged."""
+    known = index.get(novel["bookUrl"])
+    if known is None:
+        return {"change": "added", **novel}
+    if known == (novel["numberOfChapters"], novel["isComplete"]):
+        return None
+    previous = {"numberOfChapters": known[0], "isComplete": known[1]}
+    return {"change": "updated", "previous": previous, **novel}
+
+
+def apply_deltas(jsonl_file, deltas):
+    """Rewrites the catalog with updated records replaced in place and added ones appended."""
+    by_url = {delta["bookUrl"]: delta for delta in deltas}
+    tmp_path = jsonl_file + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as dst:
+        try:
+            with open(jsonl_file, "r", encoding="utf-8") as src:
+                for line in src:
+                    try:
+                        delta = by_url.pop(json.loads(line)["bookUrl"], None)
+                    except (ValueError, KeyError):
+                        delta = None
+                    if delta is not None:
+                        line = json.dumps(strip_delta(delta), ensure_ascii=False) + "\n"
+                    dst.write(line)
+        except FileNotFoundError:
+            pass
+        for delta in by_url.values():
+            dst.write(json.dumps(strip_delta(delta), ensure_ascii=False) + "\n")
+    os.replace(tmp_path, jsonl_file)
+
+
+def strip_delta(delta):
+    return {key: value for key, value in delta.items() if key not in ("change", "previous")}
+
+
+def refresh(jsonl_file=JSONL_FILE, deltas_file=DELTAS_FILE, max_pages=MAX_PAGES,
+            rate=REQUESTS_PER_SECOND, stop_after_unchanged=REFRESH_STOP_AFTER_UNCHANGED):
+    """Incremental update: walks newest-first list pages until they only hold known, unchanged novels.
+
+    The listing is ordered by last update, so once `stop_after_unchanged`
+    pages in a row bring nothing new, everything after them is unchanged too.
+    Deltas are appended to `deltas_file` and folded into the catalog.
+    Returns the delta records.
+    """
+    index = load_catalog_index(jsonl_file)
+    bucket = TokenBucket(rate)
+    deltas = {}
+    unchanged_pages = 0
+    stats = {"pages": 0, "added": 0, "updated": 0}
+    started = time.perf_counter()
+
+    logging.info(f"Refreshing catalog of {len(index)} novels")
+
+    for page in range(1, max_pages + 1):
+        novels = fetch_list_page(page, bucket)
+        if novels is None:
+            # Stopping here could miss changes further down; the next refresh re-walks from page 1
+            logging.warning(f"Page {page} failed - stopping refresh early")
+            break
+        if not novels:
+            break
+        stats["pages"] += 1
+
+        page_deltas = [delta for delta in (diff_novel(novel, index) for novel in novels) if delta]
+        for delta in page_deltas:
+            if delta["bookUrl"] not in deltas:
+                stats[delta["change"]] += 1
+            deltas[delta["bookUrl"]] = delta
+        logging.info(f"Page {page}: {len(page_deltas)} changed of {len(novels)}")
+
+        unchanged_pages = 0 if page_deltas else unchanged_pages + 1
+        if unchanged_pages >= stop_after_unchanged:
+            break
+
+    deltas = list(deltas.values())
+    if deltas:
+        with open(deltas_file, "a", encoding="utf-8") as f:
+            for delta in deltas:
+                f.write(json.dumps({"refreshedAt": int(time.time()), **delta}, ensure_ascii=False) + "\n")
+        apply_deltas(jsonl_file, deltas)
+
+    stats["seconds"] = round(time.perf_counter() - started, 1)
+    logging.info(f"Refresh complete! {stats} -> {deltas_file}")
+    return deltas
+
+
+def export_json(jsonl_file=JSONL_FILE, json_file="fanmtl_all.json"):
+    """Streams the JSONL catalog into a single JSON array without loading it all."""
+    with open(jsonl_file, "r", encoding="utf-8") as src, open(json_file, "w", encoding="utf-8") as dst:
+        dst.write("[\n")
+        first = True
+        for line in src:
+            line = line.strip()
+            if not line:
                 continue
+            dst.write(("" if first else ",\n") + line)
+            first = False
+        dst.write("\n]\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-pages", type=int, default=MAX_PAGES)
+    parser.add_argument("--workers", type=int, default=CRAWL_WORKERS)
+    parser.add_argument("--rate", type=float, default=REQUESTS_PER_SECOND, help="requests per second to the host")
+    parser.add_argument("--jsonl", default=JSONL_FILE)
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE)
+    parser.add_argument("--export-json", metavar="PATH", help="also write the catalog as one JSON array")
+    parser.add_argument("--refresh", action="store_true", help="only fetch novels changed since the last crawl")
+    parser.add_argument("--deltas", default=DELTAS_FILE, help="where --refresh appends added/updated novels")
+    args = parser.parse_args()
+
+    if args.refresh:
+        refresh(args.jsonl, args.deltas, args.max_pages, args.rate)
+    else:
+        crawl(args.max_pages, args.workers, args.rate, args.jsonl, args.checkpoint)
+    if args.export_json:
+        export_json(args.jsonl, args.export_json)
+
 
-            book_url = a_tag['href']
-            if not book_url.startswith("http"):
-                book_url = BASE_URL + book_url
-
-            title = re.sub(r'[\"?*<>|]', '', a_tag.get("title") or a_tag.text.strip() or "Unknown")
-
-            img_tag = item.find("img")
-            cover_img = None
-            if img_tag:
-                # Priority: data-src > data-original > src (fallback placeholder)
-                cover_img = img_tag.get('data-src') or img_tag.get('data-original') or img_tag.get('src')
-                if cover_img and not cover_img.startswith("http"):
-                    cover_img = BASE_URL + cover_img
-                # Skip if still placeholder
-                if cover_img and "placeholder" in cover_img:
-                    cover_img = None  # Or keep as placeholder if you want
-
-            text = item.get_text(separator=" ")
-            chapters_match = re.search(r'(\d+)\s*Chapters?', text, re.I)
-            num_chapters = int(chapters_match.group(1)) if chapters_match else 0
-
-            is_complete = "Completed" in text or "Complete" in text
-
-            author = "Unknown"  # Often missing on list
-
-            categories = []
-            tag_as = item.find_all("a", href=re.compile(r"/tag/|/genre/"))
-            for tag_a in tag_as:
-                categories.append(tag_a.text.strip())
-
-            novel_data = {
-                "title": title,
-                "author": author,
-                "category": categories,
-                "isComplete": is_complete,
-                "coverImg": cover_img,
-                "bookUrl": book_url,
-                "numberOfChapters": num_chapters
-            }
-
-            json.dump(novel_data, f, ensure_ascii=False)
-            f.write("\n")
-
-            novels.append(novel_data)
-            added += 1
-            logging.info(f"{Fore.GREEN}{title} - {num_chapters} chapters{Style.RESET_ALL}")
-
-    return added
-
-# MAIN CRAWL WITH REDUNDANCY
-max_pages = 5000
-start_page = get_last_page() + 1  # Resume from next
-total = 0
-
-logging.info(f"Resuming from page {start_page}/{max_pages}")
-
-for page in range(start_page, max_pages + 1):
-    logging.info(f"Scraping page {page}/{max_pages}")
-    added = scrape_page(page)
-    if added == 0:
-        logging.warning("No novels added - possible bad page or block - pausing longer")
-        time.sleep(10)
-    total += added
-    logging.info(f"Page {page} done - {added} novels - Total: {total}")
-
-    save_last_page(page)  # Save progress after success
-
-    time.sleep(random.uniform(1.5, 3.5))  # Polite delay
-
-logging.info(f"Crawl complete! {total} novels in {JSONL_FILE}")
-logging.info(f"Last page saved: {get_last_page()}")
-
-# Optional full JSON dump
-with open("fanmtl_all.json", "w", encoding="utf-8") as f:
-    json.dump(novels, f, indent=4, ensure_ascii=False)
\ No newline at end of file
+if __name__ == '__main__':
+    main()
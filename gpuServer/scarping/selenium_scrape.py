@@ -1,58 +1,260 @@
 from seleniumbase import Driver
 import time
+import atexit
 import logging
+import threading
+from urllib.parse import urlsplit
 from bs4 import BeautifulSoup
 import os
 
+from scarping.session_pool import session_pool, CHALLENGE_MARKERS
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 ENV = os.getenv("ENVIRONMENT", "dev").lower()
 
-def load_page(url):
+BROWSER_POOL_SIZE = int(os.environ.get("BROWSER_POOL_SIZE", 2))
+BROWSER_MAX_PAGES = int(os.environ.get("BROWSER_MAX_PAGES", 50))  # recycle after this many pages...
+BROWSER_MAX_RSS_MB = int(os.environ.get("BROWSER_MAX_RSS_MB", 1500))  # ...or once Chrome's process tree grows past this
+PAGE_TIMEOUT = int(os.environ.get("BROWSER_PAGE_TIMEOUT", 45))  # hard limit for the challenge + content to appear
+BROWSER_WAIT_TIMEOUT = 120  # waiting for a free browser
+POLL_INTERVAL = 0.5
+CLEARANCE_COOKIE = "cf_clearance"
+
+# One round trip per poll instead of pulling page_source: ready state, whether a
+# Cloudflare interstitial is showing, and whether the content selector matched.
+READY_SCRIPT = """
+const challenge = !!document.querySelector('#challenge-form, #challenge-running, #cf-challenge-running, '
+    + 'script[src*="challenge-platform"]') || arguments[1].some(m => document.title.includes(m));
+return [document.readyState, challenge, !!document.querySelector(arguments[0])];
+"""
+
+
+def create_driver():
+    # SeleniumBase UC mode - strongest bypass for Cloudflare 2025
+    driver = Driver(
+        uc=True,  # Undetected mode - key for bypass
+        headless=(ENV == "prod"),  # Visible in dev, headless in prod
+        incognito=False,
+        agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/143.0.0.0 Safari/537.36",  # Real UA
+        locale_code="en",
+        do_not_track=False,
+    )
+    if ENV == "dev":
+        driver.maximize_window()
+    return driver
+
+
+def process_tree_rss(pid):
+    """Resident bytes of `pid` and all its descendants (Chrome's renderers hang off the browser), None off Linux."""
     try:
-        # SeleniumBase UC mode - strongest bypass for Cloudflare 2025
-        driver = Driver(
-            uc=True,  # Undetected mode - key for bypass
-            headless=(ENV == "prod"),  # Visible in dev, headless in prod
-            incognito=False,
-            agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/143.0.0.0 Safari/537.36",  # Real UA
-            locale_code="en",
-            do_not_track=False,
-        )
+        children = {}
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, ValueError, IndexError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
 
-        if ENV == "dev":
-            driver.maximize_window()
+        total, stack = 0, [pid]
+        page_size = os.sysconf("SC_PAGE_SIZE")
+        while stack:
+            current = stack.pop()
+            try:
+                with open(f"/proc/{current}/statm") as f:
+                    total += int(f.read().split()[1]) * page_size
+            except (OSError, ValueError, IndexError):
+                pass
+            stack.extend(children.get(current, ()))
+        return total
+    except OSError:
+        return None
 
-        driver.get(url)
-        logging.info(f"Loading {url} - waiting for Cloudflare bypass...")
 
-        # Give time for uc to solve challenge (10-30s typical)
-        time.sleep(15)  # Adjust up if needed - watch in dev visible mode
+class PooledBrowser:
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+        self.created_at = time.monotonic()
+        self.broken = False
 
-        # Extra check/reload if still challenge
-        if "Just a moment" in driver.page_source or "cloudflare" in driver.current_url.lower():
-            logging.warning("Challenge detected - waiting longer...")
-            time.sleep(15)
-            driver.get(url)  # Reload sometimes helps
+    def rss_bytes(self):
+        # UC mode launches Chrome from this process rather than under chromedriver, so the
+        # browser's own pid is the root of the renderer tree; chromedriver's is a fallback.
+        pid = getattr(self.driver, "browser_pid", None)
+        if not pid:
+            process = getattr(getattr(self.driver, "service", None), "process", None)
+            pid = process.pid if process else None
+        return process_tree_rss(pid) if pid else None
 
-        html_content = driver.page_source
 
-        soup = BeautifulSoup(html_content, 'html.parser')
+class BrowserPool:
+    """A bounded set of long-lived undetected Chrome instances for pages cloudscraper cannot get past.
 
-        if "Just a moment" in soup.text:
-            logging.error("Failed to bypass Cloudflare challenge")
-            return None
+    Browsers keep their Cloudflare clearance between pages. Each load waits for
+    the challenge to go away and the content to appear (polling, with a hard
+    timeout) instead of sleeping a fixed time. A browser is recycled after
+    BROWSER_MAX_PAGES pages, when its process tree passes BROWSER_MAX_RSS_MB,
+    or after a page timed out. New cf_clearance cookies are handed to the
+    cloudscraper session pool so the cheap path works again for that host.
+    """
 
-        logging.info("Bypassed Cloudflare - chapter loaded!")
-        return soup
+    def __init__(self, size=BROWSER_POOL_SIZE, max_pages=BROWSER_MAX_PAGES, max_rss_mb=BROWSER_MAX_RSS_MB,
+                 driver_factory=create_driver, cookie_sink=session_pool):
+        self.size = size
+        self.max_pages = max_pages
+        self.max_rss_bytes = max_rss_mb * 2**20
+        self.driver_factory = driver_factory
+        self.cookie_sink = cookie_sink
+        self._idle = []
+        self._live = 0
+        self._cond = threading.Condition()
+        self._exported = {}  # host -> cf_clearance value last handed to the session pool
+        self._launched = 0
+        self._recycled = 0
+        self._pages = 0
+        self._timeouts = 0
+        self._cookie_exports = 0
+        self._wait_seconds = 0.0
 
-    except Exception as e:
-        logging.error(f"Error: {e}")
-        return None
+    def _acquire(self):
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._idle or self._live < self.size, BROWSER_WAIT_TIMEOUT):
+                raise TimeoutError("No browser available")
+            if self._idle:
+                return self._idle.pop()
+            self._live += 1
+        try:
+            browser = PooledBrowser(self.driver_factory())
+        except Exception:
+            with self._cond:
+                self._live -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._launched += 1
+        return browser
 
-    finally:
-        if ENV == "prod":
-            driver.quit()
+    def _release(self, browser):
+        reason = None
+        if browser.broken:
+            reason = "failed page"
+        elif browser.pages >= self.max_pages:
+            reason = f"{browser.pages} pages"
         else:
-            logging.info("DEV: Browser open for inspection/video")
-            # Keep open in dev
\ No newline at end of file
+            rss = browser.rss_bytes()
+            if rss is not None and rss > self.max_rss_bytes:
+                reason = f"{rss / 2**20:.0f} MiB RSS"
+
+        if reason is None:
+            with self._cond:
+                self._idle.append(browser)
+                self._cond.notify()
+            return
+
+        logging.info(f"Recycling browser after {reason}")
+        try:
+            browser.driver.quit()
+        except Exception as e:
+            logging.warning(f"Browser did not quit cleanly: {e}")
+        with self._cond:
+            self._live -= 1
+            self._recycled += 1
+            self._cond.notify()
+
+    def _wait_ready(self, driver, selector, timeout):
+        """Polls until the challenge is gone and `selector` (or just a loaded page) is there.
+
+        Returns (ready, whether a challenge was seen on the way); ready is False on timeout.
+        """
+        deadline = time.monotonic() + timeout
+        saw_challenge = False
+        while True:
+            state, challenged, found = driver.execute_script(READY_SCRIPT, selector or "body", list(CHALLENGE_MARKERS))
+            saw_challenge = saw_challenge or challenged
+            if state == "complete" and not challenged and found:
+                return True, saw_challenge
+            if time.monotonic() >= deadline:
+                return False, saw_challenge
+            time.sleep(POLL_INTERVAL)
+
+    def _export_cookies(self, driver, url, solved):
+        # Only after a solved challenge (or for a new host): every browser has its own clearance, and
+        # re-exporting whichever one served the last page would keep resetting the scraper sessions
+        host = urlsplit(url).netloc
+        cookies = driver.get_cookies()
+        clearance = next((c["value"] for c in cookies if c["name"] == CLEARANCE_COOKIE), None)
+        with self._cond:
+            if clearance is None or self._exported.get(host) == clearance or (host in self._exported and not solved):
+                return
+            self._exported[host] = clearance
+            self._cookie_exports += 1
+        user_agent = driver.execute_script("return navigator.userAgent")
+        self.cookie_sink.import_cookies(host, cookies, user_agent)
+        logging.info(f"Exported Cloudflare clearance for {host} to the scraper sessions")
+
+    def load(self, url, selector=None, timeout=PAGE_TIMEOUT):
+        """HTML of `url` once it is past any challenge, or None if it did not get there within `timeout`."""
+        browser = self._acquire()
+        start = time.perf_counter()
+        try:
+            browser.driver.get(url)
+            browser.pages += 1
+            logging.info(f"Loading {url} - waiting for Cloudflare bypass...")
+            ready, solved = self._wait_ready(browser.driver, selector, timeout)
+            if not ready:
+                logging.error(f"Failed to bypass Cloudflare challenge for {url} within {timeout}s")
+                browser.broken = True  # a stuck challenge usually means the fingerprint is burned
+                with self._cond:
+                    self._timeouts += 1
+                return None
+            html = browser.driver.page_source
+            self._export_cookies(browser.driver, url, solved)
+            logging.info(f"Bypassed Cloudflare in {time.perf_counter() - start:.1f}s - page loaded!")
+            return html
+        except Exception as e:
+            logging.error(f"Error: {e}")
+            browser.broken = True
+            return None
+        finally:
+            with self._cond:
+                self._pages += 1
+                self._wait_seconds += time.perf_counter() - start
+            self._release(browser)
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._live -= len(idle)
+        for browser in idle:
+            try:
+                browser.driver.quit()
+            except Exception:
+                pass
+
+    def stats(self):
+        with self._cond:
+            return {
+                "live": self._live,
+                "idle": len(self._idle),
+                "launched": self._launched,
+                "recycled": self._recycled,
+                "pages": self._pages,
+                "timeouts": self._timeouts,
+                "cookie_exports": self._cookie_exports,
+                "avg_page_seconds": round(self._wait_seconds / self._pages, 3) if self._pages else 0,
+            }
+
+
+browser_pool = BrowserPool()
+atexit.register(browser_pool.close)
+
+
+def load_page(url, selector=None):
+    html = browser_pool.load(url, selector)
+    if html is None:
+        return None
+    return BeautifulSoup(html, 'html.parser')
@@ -0,0 +1,150 @@
+import os
+import time
+import logging
+import threading
+from urllib.parse import urlsplit
+
+import cloudscraper
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+MAX_SESSIONS_PER_HOST = int(os.environ.get("SCRAPER_SESSIONS_PER_HOST", 4))
+SESSION_WAIT_TIMEOUT = 60
+CHALLENGE_STATUS = (403, 429, 503)
+CHALLENGE_MARKERS = ("Just a moment", "cf-chl", "challenge-platform", "Attention Required")
+
+
+def create_session():
+    # Clean scraper – no debug spam, modern fingerprint
+    return cloudscraper.create_scraper(
+        browser={
+            'browser': 'chrome',
+            'platform': 'windows',
+            'mobile': False,
+            'desktop': True
+        },
+        delay=10  # Still good for challenge timing
+    )
+
+
+def is_challenge(response):
+    if response.status_code not in CHALLENGE_STATUS:
+        return False
+    text = response.text[:5000]
+    return any(marker in text for marker in CHALLENGE_MARKERS)
+
+
+class _HostPool:
+    def __init__(self, max_sessions):
+        self.slots = threading.BoundedSemaphore(max_sessions)
+        self.idle = []
+        self.cookies = None  # (cookie list, user agent) handed over from a real browser
+        self.requests = 0
+        self.errors = 0
+        self.challenges = 0
+        self.refreshes = 0
+        self.latency = 0.0
+
+
+class ScraperSessionPool:
+    """Warm cloudscraper sessions per host, reused across chapter, info and catalog scraping.
+
+    Sessions keep their keep-alive connections and Cloudflare cookies
+    (cf_clearance) between requests. A session is only thrown away and rebuilt
+    when a response looks like a challenge page.
+    """
+
+    def __init__(self, max_sessions_per_host=MAX_SESSIONS_PER_HOST, session_factory=create_session):
+        self.max_sessions_per_host = max_sessions_per_host
+        self.session_factory = session_factory
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _host_pool(self, host):
+        with self._lock:
+            pool = self._hosts.get(host)
+            if pool is None:
+                pool = self._hosts[host] = _HostPool(self.max_sessions_per_host)
+            return pool
+
+    def _new_session(self, pool):
+        session = self.session_factory()
+        if pool.cookies:
+            cookies, user_agent = pool.cookies
+            for cookie in cookies:
+                session.cookies.set(cookie["name"], cookie["value"],
+                                    domain=cookie.get("domain", ""), path=cookie.get("path", "/"))
+            if user_agent:
+                session.headers["User-Agent"] = user_agent
+        return session
+
+    def get(self, url, timeout=30, **kwargs):
+        """GET through a pooled session for the URL's host; retries once on a fresh session after a challenge."""
+        host = urlsplit(url).netloc
+        pool = self._host_pool(host)
+        if not pool.slots.acquire(timeout=SESSION_WAIT_TIMEOUT):
+            raise TimeoutError(f"No scraper session available for {host}")
+        try:
+            with self._lock:
+                session = pool.idle.pop() if pool.idle else None
+            if session is None:
+                session = self._new_session(pool)
+
+            for attempt in range(2):
+                start = time.perf_counter()
+                try:
+                    response = session.get(url, timeout=timeout, **kwargs)
+                except Exception:
+                    with self._lock:
+                        pool.requests += 1
+                        pool.errors += 1
+                        pool.latency += time.perf_counter() - start
+                    session.close()
+                    raise
+
+                challenged = is_challenge(response)
+                with self._lock:
+                    pool.requests += 1
+                    pool.latency += time.perf_counter() - start
+                    if challenged:
+                        pool.challenges += 1
+                if not challenged or attempt == 1:
+                    break
+                logging.warning(f"Challenge page from {host}, refreshing scraper session")
+                session.close()
+                session = self._new_session(pool)
+                with self._lock:
+                    pool.refreshes += 1
+
+            with self._lock:
+                pool.idle.append(session)
+            return response
+        finally:
+            pool.slots.release()
+
+    def import_cookies(self, host, cookies, user_agent=None):
+        """Seeds sessions for `host` with cookies (e.g. cf_clearance) from a browser that passed the challenge."""
+        pool = self._host_pool(host)
+        with self._lock:
+            pool.cookies = (cookies, user_agent)
+            idle, pool.idle = pool.idle, []
+        for session in idle:
+            session.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                host: {
+                    "requests": pool.requests,
+                    "errors": pool.errors,
+                    "challenges": pool.challenges,
+                    "challenge_rate": round(pool.challenges / pool.requests, 4) if pool.requests else 0,
+                    "refreshes": pool.refreshes,
+                    "avg_latency": round(pool.latency / pool.requests, 4) if pool.requests else 0,
+                    "idle_sessions": len(pool.idle),
+                }
+                for host, pool in self._hosts.items()
+            }
+
+
+session_pool = ScraperSessionPool()
@@ -10,13 +10,27 @@ import logging
 from flask_cors import CORS
 import uuid
 import redis
+from bisect import bisect_right
 import boto3
 
 # Import your real modules (adjust paths)
 from tts.tts_pipeline import TTSPipeline
 from tasks.task_queue import TaskChain, TaskQueue, worker_function, Task, MAX_WORKERS
-from scarping.scrape import get_chapter_url, scrape_novel_chapter
-from caching.cache_opum import get_s3_key
+from scarping.chapter_cache import ChapterTextCache, ChapterPrefetcher
+from scarping.session_pool import session_pool
+from caching.cache_opum import get_s3_key, get_segment_key
+from streaming.encoder import Mp3EncoderPool, FFMPEG_PATH
+from tts.audio_format import PIPELINE_SAMPLE_RATE, PIPELINE_DTYPE, block_size_for, to_int16
+from tasks.preload import PreloadPlanner
+from tasks.inflight import InflightRegistry
+from tasks.process_backend import ProcessTaskQueue
+from tasks.redis_backend import RedisTaskQueue
+from tasks.scheduler import PRIORITY_LIVE
+from metrics import stage_timings
+from caching.disk_cache import DiskLRUCache, AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_BYTES
+from streaming.cache_stream import parse_range, CachedAudioSource
+from streaming.framing import (encode_frame, encode_json_frame, BINARY_MIMETYPE,
+                               FRAME_META, FRAME_AUDIO, FRAME_TIMING, FRAME_END, FRAME_ERROR)
 
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
@@ -24,13 +38,14 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
-CORS(app, resources={r'/stream': {"origins": ["http://localhost:5173", "https://novel-verse-three.vercel.app"]}})
+CORS(app, resources={r'/(stream|audio)(/.*)?': {"origins": ["http://localhost:5173", "https://novel-verse-three.vercel.app"],
+                                                   "expose_headers": ["Content-Range", "X-Audio-Duration", "X-Audio-WPM"]}})
 
-SAMPLE_RATE = 48000
+SAMPLE_RATE = PIPELINE_SAMPLE_RATE  # the model's native 24 kHz unless configured otherwise
 SAMPLE_WIDTH = 2
 CHANNELS = 1
-BLOCK_SIZE = 19200
-DTYPE = 'float32'
+BLOCK_SIZE = block_size_for(SAMPLE_RATE)
+DTYPE = PIPELINE_DTYPE
 INITIAL_BUFFER_DURATION_SECONDS = 20
 packet_size = 2048
 backlog_ratio = 0.1
@@ -38,37 +53,33 @@ MIN_CHUNK_SIZE = BLOCK_SIZE * 2
 WPM = 187
 CPM = 820
 MAX_CHAINS_PER_USER = 1
+TASK_BACKEND = os.environ.get("TASK_BACKEND", "thread")  # "process": TTS worker processes, "redis": shared by nodes
+LISTENER_WAIT_TIMEOUT = 15  # seconds a listener sleeps on its task before re-checking
 
 r = None
 
-if os.environ.get("ENV") == "dev":
-    r = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True,)
+if os.environ.get("REDIS_URL"):  # any other Redis, e.g. a local or fake one for benchmarks
+    REDIS_OPTIONS = redis.connection.parse_url(os.environ["REDIS_URL"])
+elif os.environ.get("ENV") == "dev":
+    REDIS_OPTIONS = dict(host='localhost', port=6379, db=0)
 else:
-    r = redis.Redis(
+    REDIS_OPTIONS = dict(
         host='novelverse-redis-knb7i1.serverless.use1.cache.amazonaws.com',
         port=6379,
         ssl=True,                   # ← This enables TLS
-        decode_responses=True,
         socket_timeout=10,
         socket_connect_timeout=10,
     )
+BUCKET_NAME = 'novelverse-audio-storage-20260131'
 
-task_queue = TaskQueue( DTYPE, SAMPLE_RATE, BLOCK_SIZE, MAX_WORKERS)
+AudioSegment.converter = FFMPEG_PATH
 
 
-def encode_mp3(chunk_bytes):
-
-    if os.environ.get("ENV") == "dev":
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        ffmpeg_path = os.path.join(script_dir, "ffmpeg.exe")
-        AudioSegment.ffmpeg = ffmpeg_path
-
-    else:
-        AudioSegment.ffmpeg = "ffmpeg" #Production PATH
-
+def encode_mp3(chunk_bytes, sample_rate=SAMPLE_RATE):
+    """One-shot encode of a PCM chunk; only used when the encoder pool is full."""
     audio = AudioSegment(
         chunk_bytes,
-        frame_rate=SAMPLE_RATE,
+        frame_rate=sample_rate,
         sample_width=SAMPLE_WIDTH,
         channels=CHANNELS
     )
@@ -76,10 +87,312 @@ def encode_mp3(chunk_bytes):
     audio.export(buf, format="mp3", codec="libmp3lame")
     return buf.getvalue()
 
+def build_task(book_url, ch_nr):
+    """Scrapes a chapter into a new Task, or None if it could not be scraped."""
+    with stage_timings.time("chapter_text"):
+        text = chapter_texts.get_or_scrape(book_url, ch_nr)
+
+    if not text:
+        logger.warning(f"Failed to scrape chapter {ch_nr}")
+        return None
+
+    duration = (len(text.split()) / WPM) * 60
+    task_id = str(uuid.uuid4())
+    return Task(task_id, text, ch_nr, book_url, WPM, duration, DTYPE, SAMPLE_RATE)
+
+
+def resolve_preload(book_url, ch_nr):
+    """Task for an uncached preload chapter; None if it is cached, already being generated or unscrapable."""
+    s3_key = get_s3_key(book_url, ch_nr)
+    if cached_audio.exists(s3_key) or inflight.get(s3_key) or inflight.claimed_elsewhere(s3_key):
+        return None
+    task = build_task(book_url, ch_nr)
+    if task is None or inflight.claim(s3_key, task) is not task:
+        return None  # lost the race to another request; that one generates it
+    return task
+
+
+def release_preload(task):
+    """Gives back the in-flight claim resolve_preload took for a Task that was never queued."""
+    inflight.release(get_s3_key(task.book_url, task.ch), task)
+
+
+# Spawned ProcessTaskQueue workers re-import this module as __mp_main__; they only
+# need tasks.process_backend, so the service objects (clients, caches, pools, the
+# task queue) are built in the serving process only.
+if __name__ != '__mp_main__':
+    r = redis.Redis(**REDIS_OPTIONS, decode_responses=True)
+
+    audio_cache = DiskLRUCache(AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_BYTES)
+    inflight = InflightRegistry(r)
+    if TASK_BACKEND == "process":
+        task_queue = ProcessTaskQueue(DTYPE, SAMPLE_RATE, BLOCK_SIZE, audio_cache=audio_cache, inflight=inflight)
+    elif TASK_BACKEND == "redis":
+        # Jobs and audio blocks go through Redis streams; PCM needs a client that does not decode
+        task_queue = RedisTaskQueue(redis.Redis(**REDIS_OPTIONS), DTYPE, SAMPLE_RATE, BLOCK_SIZE,
+                                    audio_cache=audio_cache, inflight=inflight)
+    else:
+        task_queue = TaskQueue( DTYPE, SAMPLE_RATE, BLOCK_SIZE, MAX_WORKERS, audio_cache, inflight)
+
+    s3 = boto3.client('s3')  # ← this line uses EC2 IAM role automatically (AWS_ENDPOINT_URL points it elsewhere)
+    cached_audio = CachedAudioSource(s3, BUCKET_NAME, audio_cache)
+    mp3_encoders = Mp3EncoderPool()
+
+    chapter_texts = ChapterTextCache(r)
+    chapter_prefetcher = ChapterPrefetcher(chapter_texts)
+    preload_planner = PreloadPlanner(task_queue, resolve_preload, release_preload)
+
+
+def transcode_mp3(data, input_format):
+    """One-shot transcode of a whole encoded file; only used when the encoder pool is full."""
+    buf = io.BytesIO()
+    AudioSegment.from_file(io.BytesIO(data), format=input_format).export(buf, format="mp3", codec="libmp3lame")
+    return buf.getvalue()
+
+
+def release_chain_slot(user_chain_key):
+    if user_chain_key:
+        r.decr(user_chain_key)
+        count = r.get(user_chain_key)
+        if count is None or int(count) <= 0:
+            r.delete(user_chain_key)
+
+
+def iter_task_mp3(task):
+    """Yields (mp3_bytes, samples_sent, is_done) as the task produces audio.
+
+    Uses one continuous MP3 stream per listener and falls back to per-chunk
+    encoding if the pool is full. Stops after the final item (is_done=True);
+    that item carries b'' if nothing was left to flush.
+    """
+    encoder = mp3_encoders.open_session(task.sample_rate, CHANNELS)
+    try:
+        cursor = 0
+        while True:
+            new_pcm, is_done = task.wait_for_samples(cursor, timeout=LISTENER_WAIT_TIMEOUT)
+
+            pcm_bytes = b''
+            if len(new_pcm) > 0:
+                cursor += len(new_pcm)
+                pcm_bytes = to_int16(new_pcm).tobytes()
+
+            if is_done and pcm_bytes:
+                silence_samples = int(0.2 * task.sample_rate)
+                silence_pcm = np.zeros(silence_samples, dtype=np.int16).tobytes()
+                pcm_bytes += silence_pcm
+
+            mp3_bytes = b''
+            if pcm_bytes:
+                mp3_bytes = encoder.feed(pcm_bytes) if encoder else encode_mp3(pcm_bytes, task.sample_rate)
+            if is_done and encoder:
+                mp3_bytes += encoder.close()
+
+            if mp3_bytes or is_done:
+                yield mp3_bytes, cursor, is_done
+            if is_done:
+                return
+    finally:
+        if encoder:
+            encoder.abort()
+
+
+def cached_timing(s3_key):
+    """TimingIndex of a cached chapter, or None if it has no sidecar (or it could not be read)."""
+    try:
+        return cached_audio.timing(s3_key)
+    except Exception as e:
+        logger.warning(f"Could not read timing index for {s3_key}: {e}")
+        return None
+
+
+def timing_event(timing, segments):
+    return {'status': 'timing', 'sample_rate': timing.sample_rate, 'segments': segments}
+
+
 @app.route('/health', methods=['GET'])
 def health():
     with task_queue.active_tasks_lock:
-        return {"status": "healthy", "active_tasks": len(task_queue.active_tasks), "queue_size": task_queue.request_queue.qsize()}, 200
+        active_tasks = len(task_queue.active_tasks)
+    return {"status": "healthy", "active_tasks": active_tasks, "queue_size": task_queue.job_scheduler.qsize(),
+            "jobs": task_queue.job_scheduler.stats(),
+            "inflight": inflight.stats(),
+            "backend": task_queue.backend,
+            "model_pool": task_queue.model_pool.stats() if task_queue.model_pool else None,
+            "processes": task_queue.process_stats() if task_queue.backend == "process" else None,
+            "cluster": task_queue.cluster_stats() if task_queue.backend == "redis" else None,
+            "inference": task_queue.inference_scheduler.stats() if task_queue.inference_scheduler else None,
+            "postprocess": task_queue.post_processor.stats() if task_queue.post_processor else None,
+            "mp3_encoders": mp3_encoders.stats(),
+            "audio_cache": audio_cache.stats(),
+            "chapter_text_cache": chapter_texts.stats(),
+            "prefetch": chapter_prefetcher.stats(),
+            "scraper_sessions": session_pool.stats(),
+            "timings": stage_timings.snapshot()}, 200
+
+def chapter_key_arg():
+    """(s3_key, None) for the chapter named by the book_url / chapter_nr query args, or (None, a 400 response)."""
+    book_url = request.args.get("book_url")
+    chapter_nr = request.args.get("chapter_nr")
+    if not book_url or not chapter_nr:
+        return None, ({"error": "Missing book_url or chapter_nr"}, 400)
+    try:
+        return get_s3_key(book_url, int(chapter_nr)), None
+    except ValueError:
+        return None, ({"error": "Invalid chapter_nr"}, 400)
+
+
+@app.route('/audio', methods=['GET'])
+def audio():
+    """Serves a cached chapter's Opus object with HTTP Range support."""
+    s3_key, error = chapter_key_arg()
+    if error:
+        return error
+
+    size = cached_audio.size(s3_key)
+    if size is None:
+        return {"error": "Chapter not cached"}, 404
+
+    try:
+        byte_range = parse_range(request.headers.get("Range"), size)
+    except ValueError:
+        return Response(status=416, headers={'Content-Range': f'bytes */{size}'})
+
+    headers = {'Accept-Ranges': 'bytes', 'Cache-Control': 'public, max-age=86400'}
+    if byte_range is None or byte_range[0] == 0:
+        try:
+            meta = cached_audio.metadata(s3_key)
+            if meta["duration"] is not None:
+                headers['X-Audio-Duration'] = f"{meta['duration']:.2f}"
+            if meta["WPM"] is not None:
+                headers['X-Audio-WPM'] = str(meta["WPM"])
+        except Exception as e:
+            logger.warning(f"Could not read tags for {s3_key}: {e}")
+
+    return object_response(s3_key, size, byte_range, headers)
+
+
+def object_response(key, size, byte_range, headers):
+    """Streams a cached Opus object, or the parsed inclusive `byte_range` of it as a 206."""
+    if byte_range is None:
+        headers['Content-Length'] = str(size)
+        return Response(stream_with_context(cached_audio.iter_bytes(key)),
+                        status=200, mimetype='audio/ogg', headers=headers)
+
+    start, end = byte_range
+    headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    headers['Content-Length'] = str(end - start + 1)
+    return Response(stream_with_context(cached_audio.iter_bytes(key, start, end)),
+                    status=206, mimetype='audio/ogg', headers=headers)
+
+
+@app.route('/audio/info', methods=['GET'])
+def audio_info():
+    """DURATION / WPM / text of a cached chapter, read from its Ogg tags."""
+    s3_key, error = chapter_key_arg()
+    if error:
+        return error
+    try:
+        return cached_audio.metadata(s3_key), 200
+    except Exception:
+        return {"error": "Chapter not cached"}, 404
+
+
+@app.route('/audio/timing', methods=['GET'])
+def audio_timing():
+    """Timing index of a chapter (cached, or still being generated on this node).
+
+    With `char`, `paragraph` or `seconds` it answers a single seek lookup
+    instead: the audio position of a text offset / paragraph start, or the
+    text offset being read at a position. `paragraph` is the 0-based index of
+    the non-blank line (paragraph) of the chapter text, not a line number.
+    """
+    s3_key, error = chapter_key_arg()
+    if error:
+        return error
+    task = inflight.get(s3_key)
+    timing = task.timing if task else cached_timing(s3_key)
+    if timing is None:
+        return {"error": "No timing index for this chapter"}, 404
+
+    try:
+        if "char" in request.args:
+            sample = timing.sample_at_char(int(request.args["char"]))
+        elif "paragraph" in request.args:
+            sample = timing.paragraph_start(int(request.args["paragraph"]))
+        elif "seconds" in request.args:
+            char = timing.char_at_sample(int(float(request.args["seconds"]) * timing.sample_rate))
+            return {"char": char, "generating": task is not None}, 200 if char is not None else 404
+        else:
+            return {**timing.to_dict(), "generating": task is not None}, 200
+    except ValueError:
+        return {"error": "Invalid lookup value"}, 400
+    if sample is None:
+        return {"error": "Position not synthesized"}, 404
+    return {"sample": sample, "seconds": round(sample / timing.sample_rate, 3), "generating": task is not None}, 200
+
+
+@app.route('/audio/segments', methods=['GET'])
+def audio_segments():
+    """Segment manifest of a chapter stored in segments, complete or still being produced.
+
+    Lets a listener join or seek mid-chapter: with `seconds` or `char` the
+    response also names the stored segment to start playback from.
+    """
+    s3_key, error = chapter_key_arg()
+    if error:
+        return error
+    try:
+        manifest = cached_audio.manifest(s3_key)
+    except Exception as e:
+        logger.warning(f"Could not read segment manifest for {s3_key}: {e}")
+        manifest = None
+    if manifest is None:
+        return {"error": "Chapter not stored in segments"}, 404
+
+    try:
+        if "seconds" in request.args:
+            sample = int(float(request.args["seconds"]) * manifest["sample_rate"])
+            ends = [segment["sample_end"] for segment in manifest["segments"]]
+            position = sample
+        elif "char" in request.args:
+            ends = [segment["char_end"] for segment in manifest["segments"]]
+            position = int(request.args["char"])
+        else:
+            return manifest, 200
+    except ValueError:
+        return {"error": "Invalid lookup value"}, 400
+    index = bisect_right(ends, position)
+    if index >= len(ends):
+        return {"error": "Position not stored yet", "complete": manifest["complete"]}, 404
+    return {**manifest, "segment": index}, 200
+
+
+@app.route('/audio/segment', methods=['GET'])
+def audio_segment():
+    """One stored segment (a standalone Ogg Opus file) of a chapter, with HTTP Range support."""
+    s3_key, error = chapter_key_arg()
+    if error:
+        return error
+    if request.args.get("index") is None:
+        return {"error": "Missing index"}, 400
+    try:
+        index = int(request.args["index"])
+    except ValueError:
+        index = -1
+    if index < 0:
+        return {"error": "Invalid index"}, 400
+    segment_key = get_segment_key(s3_key, index)
+    size = cached_audio.size(segment_key)
+    if size is None:
+        return {"error": "Segment not stored"}, 404
+    try:
+        byte_range = parse_range(request.headers.get("Range"), size)
+    except ValueError:
+        return Response(status=416, headers={'Content-Range': f'bytes */{size}'})
+    # Shorter lived than whole chapters: a chapter regenerated from different text rewrites its segments
+    headers = {'Accept-Ranges': 'bytes', 'Cache-Control': 'public, max-age=3600'}
+    return object_response(segment_key, size, byte_range, headers)
+
 
 @app.route('/stream', methods=['GET', 'POST'])
 def stream():
@@ -107,78 +420,74 @@ def stream():
         if not book_url or not chapter_nr:
             return {"error": "Missing book_url or chapter_nr"}, 400
         
-        s3 = boto3.client('s3')  # ← this line uses EC2 IAM role automatically
-        BUCKET_NAME = 'novelverse-audio-storage-20260131'
-        
-        task_chain = []
-        
-        for offset in range(num_preloads+1):  # current + preloads
-            ch_nr = chapter_nr + offset
-            s3_key = get_s3_key(book_url, ch_nr)
-            try:
-                s3.head_object(Bucket=BUCKET_NAME, Key=s3_key)
-                continue
-            except Exception as e:
+        request_start = time.perf_counter()
+
+        # Only the requested chapter is resolved on the request path; preloads follow in the background
+        s3_key = get_s3_key(book_url, chapter_nr)
+        cached_key = s3_key if cached_audio.exists(s3_key) else None
+        first_task = None
+        attached = False
+        if not cached_key:
+            # Someone is already generating this chapter: listen to that Task instead of synthesizing it again
+            first_task = inflight.attach(s3_key)
+            if first_task:
+                attached = True
+            else:
                 logger.info("cache missed Generating")
-
-            chapter_url = get_chapter_url(book_url, ch_nr)
-            text = scrape_novel_chapter(chapter_url)
-
-            if not text:
-                logger.warning(f"Failed to scrape chapter {ch_nr}")
-                continue  # skip bad chapter, don't fail whole chain
-
-            duration = (len(text.split()) / WPM) * 60
-            task_id = str(uuid.uuid4())
-            task = Task(task_id, text, ch_nr, book_url, WPM, duration)
-            task_chain.append(task)
-
-        if not task_chain:
-            r.decr(user_chain_key)
-            return {"error": "No valid chapters could be scraped"}, 400
-        
-        chain_id = str(uuid.uuid4())
-        task_chain_obj = TaskChain(chain_id, task_chain)
-        task_queue.put_chain(task_chain_obj)
-
+                # A claim on another node is ignored here: this listener cannot wait for its upload
+                built_task = build_task(book_url, chapter_nr)
+                if not built_task:
+                    r.decr(user_chain_key)
+                    return {"error": "No valid chapters could be scraped"}, 400
+                first_task = inflight.claim(s3_key, built_task)
+                attached = first_task is not built_task  # another request won the race while we scraped
+            if attached:
+                # It may be sitting in someone's queue as a preload; a listener is waiting on it now
+                task_queue.job_scheduler.promote(first_task, PRIORITY_LIVE)
+                logger.info(f"Attached to in-flight generation of {s3_key}")
+
+        owns_first = first_task is not None and not attached
+        task_chain_obj = TaskChain(str(uuid.uuid4()), [first_task] if owns_first else [], complete=False,
+                                   user_id=user_ip, live_ch=chapter_nr)
+        if owns_first:
+            task_queue.put_chain(task_chain_obj)
+        preload_planner.plan(task_chain_obj, book_url, range(chapter_nr + 1, chapter_nr + num_preloads + 1),
+                             queued=owns_first)
+        # Warm scraped text past the preload window so the next request skips the site entirely
+        chapter_prefetcher.warm(book_url, chapter_nr + num_preloads + 1)
+        stage_timings.record("request_planning", time.perf_counter() - request_start)
+
+        def record_first_audio(stage):
+            elapsed = time.perf_counter() - request_start
+            stage_timings.record(stage, elapsed)
+            logger.info(f"{stage} for chapter {chapter_nr}: {elapsed:.2f}s")
+
+        stream_format = data.get("format", "sse")
 
         def generate():
             try:
-                task = task_chain_obj.tasks[0]
-                if task.ch != chapter_nr:
-                    logger.info("ch already generated")
-                    return 
-                
+                task = first_task
                 yield f"data: {json.dumps({'status': 'started', 'chapter': task.ch})}\n\n"
                 chars = len(task.text)
                 duration = chars / CPM * 60
                 yield f"data: {json.dumps({'status': 'audio-info', 'duration': duration, 'WPM': WPM, 'text': task.text})}\n\n"
 
-                sent_bytes = 0
-                while True:
-                    full_buffer, is_done = task_chain_obj.tasks[0].get_response()
-
-                    pcm_bytes = b''
-                    if len(full_buffer) > sent_bytes:
-                        new_pcm = full_buffer[sent_bytes:]
-                        sent_bytes = len(full_buffer)
-                        pcm_float = np.frombuffer(new_pcm, dtype=np.float32)
-                        pcm_int16 = (pcm_float * 32767).astype(np.int16)
-                        pcm_bytes = pcm_int16.tobytes()
-
-                    if is_done and pcm_bytes:
-                        silence_samples = int(0.2 * SAMPLE_RATE)
-                        silence_pcm = np.zeros(silence_samples, dtype=np.int16).tobytes()
-                        pcm_bytes += silence_pcm
-
-                    if not pcm_bytes:
-                        if is_done:
-                            yield f"data: {json.dumps({'status': 'complete'})}\n\n"
-                            break
-                        time.sleep(0.05)
-                        continue
-
-                    mp3_bytes = encode_mp3(pcm_bytes)
+                first_audio = True
+                timing_cursor = 0
+                for mp3_bytes, cursor, is_done in iter_task_mp3(task):
+                    segments = task.timing.since(timing_cursor)
+                    if segments:
+                        timing_cursor += len(segments)
+                        yield f"data: {json.dumps(timing_event(task.timing, segments))}\n\n"
+
+                    if not mp3_bytes:
+                        yield f"data: {json.dumps({'status': 'complete'})}\n\n"
+                        break
+
+                    if first_audio:
+                        first_audio = False
+                        record_first_audio("time_to_first_audio")
+
                     yield f"data: {json.dumps({'status': 'chunk', 'audio_bytes': base64.b64encode(mp3_bytes).decode('utf-8')})}\n\n"
 
                     if task.error:
@@ -186,13 +495,11 @@ def stream():
                         break
 
                     if is_done:
-                        duration_sec = round((len(full_buffer) / SAMPLE_RATE), 2)
+                        duration_sec = round((cursor / task.sample_rate), 2)
                         yield f"data: {json.dumps({'status': 'audio-info', 'duration': duration_sec, 'WPM': WPM, 'text': task.text})}\n\n"
                         yield f"data: {json.dumps({'status': 'complete'})}\n\n"
                         break
 
-                    time.sleep(0.05)
-
             except GeneratorExit:  # client disconnected
                 logger.info("Client disconnected during stream")
                 raise
@@ -201,12 +508,130 @@ def stream():
                 yield f"data: {json.dumps({'status': 'error', 'message': str(e)})}\n\n"
             finally:
                 logger.info("Stream generator finished.")
-                if user_chain_key:
-                    r.decr(user_chain_key)
-                    count = r.get(user_chain_key)
-                    if count is None or int(count) <= 0:
-                        r.delete(user_chain_key)
+                release_chain_slot(user_chain_key)
+
+        def generate_binary():
+            try:
+                task = first_task
+                # Text and timing go out once; everything after this is raw MP3
+                yield encode_json_frame(FRAME_META, {'status': 'started', 'chapter': task.ch,
+                                                     'duration': len(task.text) / CPM * 60, 'WPM': WPM,
+                                                     'text': task.text, 'codec': 'audio/mpeg'})
+
+                first_audio = True
+                timing_cursor = 0
+                for mp3_bytes, cursor, is_done in iter_task_mp3(task):
+                    segments = task.timing.since(timing_cursor)
+                    if segments:
+                        timing_cursor += len(segments)
+                        yield encode_json_frame(FRAME_TIMING, timing_event(task.timing, segments))
+
+                    if mp3_bytes:
+                        if first_audio:
+                            first_audio = False
+                            record_first_audio("time_to_first_audio")
+                        yield encode_frame(FRAME_AUDIO, mp3_bytes)
+
+                    if task.error:
+                        yield encode_json_frame(FRAME_ERROR, {'status': 'error', 'message': task.error})
+                        break
+
+                    if is_done:
+                        yield encode_json_frame(FRAME_END, {'status': 'complete',
+                                                            'duration': round(cursor / task.sample_rate, 2)})
+                        break
+
+            except GeneratorExit:  # client disconnected
+                logger.info("Client disconnected during binary stream")
+                raise
+            except Exception as e:
+                logger.error(f"Binary stream generator error: {e}")
+                yield encode_json_frame(FRAME_ERROR, {'status': 'error', 'message': str(e)})
+            finally:
+                logger.info("Binary stream generator finished.")
+                release_chain_slot(user_chain_key)
+
+        def generate_cached():
+            # Cache hit: served straight from S3, never touches the TTS queue
+            transcoder = None
+            try:
+                meta = cached_audio.metadata(cached_key)
+                yield f"data: {json.dumps({'status': 'started', 'chapter': chapter_nr, 'cached': True})}\n\n"
+                yield f"data: {json.dumps({'status': 'audio-info', 'duration': meta['duration'], 'WPM': meta['WPM'] or WPM, 'text': meta['text']})}\n\n"
+                timing = cached_timing(cached_key)
+                if timing is not None:
+                    yield f"data: {json.dumps(timing_event(timing, timing.since(0)))}\n\n"
+
+                transcoder = mp3_encoders.open_transcoder("ogg")
+                if transcoder:
+                    first_audio = True
+                    for opus_bytes in cached_audio.iter_bytes(cached_key):
+                        mp3_bytes = transcoder.feed(opus_bytes)
+                        if mp3_bytes:
+                            if first_audio:
+                                first_audio = False
+                                record_first_audio("time_to_first_audio_cached")
+                            yield f"data: {json.dumps({'status': 'chunk', 'audio_bytes': base64.b64encode(mp3_bytes).decode('utf-8')})}\n\n"
+                    mp3_bytes = transcoder.close()
+                else:
+                    mp3_bytes = transcode_mp3(b''.join(cached_audio.iter_bytes(cached_key)), "ogg")
+                if mp3_bytes:
+                    yield f"data: {json.dumps({'status': 'chunk', 'audio_bytes': base64.b64encode(mp3_bytes).decode('utf-8')})}\n\n"
+                yield f"data: {json.dumps({'status': 'complete'})}\n\n"
+
+            except GeneratorExit:  # client disconnected
+                logger.info("Client disconnected during cached stream")
+                raise
+            except Exception as e:
+                logger.error(f"Cached stream generator error: {e}")
+                yield f"data: {json.dumps({'status': 'error', 'message': str(e)})}\n\n"
+            finally:
+                if transcoder:
+                    transcoder.abort()
+                logger.info("Cached stream generator finished.")
+                release_chain_slot(user_chain_key)
 
+        def generate_cached_binary():
+            # Binary clients get the stored Opus bytes as-is
+            try:
+                meta = cached_audio.metadata(cached_key)
+                yield encode_json_frame(FRAME_META, {'status': 'started', 'chapter': chapter_nr, 'cached': True,
+                                                     'duration': meta['duration'], 'WPM': meta['WPM'] or WPM,
+                                                     'text': meta['text'], 'codec': 'audio/ogg'})
+                timing = cached_timing(cached_key)
+                if timing is not None:
+                    yield encode_json_frame(FRAME_TIMING, timing_event(timing, timing.since(0)))
+                first_audio = True
+                for opus_bytes in cached_audio.iter_bytes(cached_key):
+                    if first_audio:
+                        first_audio = False
+                        record_first_audio("time_to_first_audio_cached")
+                    yield encode_frame(FRAME_AUDIO, opus_bytes)
+                yield encode_json_frame(FRAME_END, {'status': 'complete', 'duration': meta['duration']})
+
+            except GeneratorExit:  # client disconnected
+                logger.info("Client disconnected during cached binary stream")
+                raise
+            except Exception as e:
+                logger.error(f"Cached binary stream generator error: {e}")
+                yield encode_json_frame(FRAME_ERROR, {'status': 'error', 'message': str(e)})
+            finally:
+                logger.info("Cached binary stream generator finished.")
+                release_chain_slot(user_chain_key)
+
+        if cached_key:
+            return Response(
+                stream_with_context(generate_cached_binary() if stream_format == "binary" else generate_cached()),
+                mimetype=BINARY_MIMETYPE if stream_format == "binary" else 'text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
+
+        if stream_format == "binary":
+            return Response(
+                stream_with_context(generate_binary()),
+                mimetype=BINARY_MIMETYPE,
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
 
         return Response(
             stream_with_context(generate()),
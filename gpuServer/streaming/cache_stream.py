@@ -0,0 +1,204 @@
+import io
+import re
+import json
+import logging
+
+from botocore.exceptions import ClientError
+
+from mutagen.oggopus import OggOpusInfo, OggOpusVComment
+
+from caching.cache_opum import get_timing_key, get_manifest_key
+from tts.timing import TimingIndex
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+TAG_PROBE_BYTES = 256 * 1024  # OpusHead + OpusTags pages; the chapter text lives in the tags
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    """Parses a single-range HTTP Range header into an inclusive (start, end).
+
+    Returns None when there is no usable header (serve the whole object) and
+    raises ValueError when the range cannot be satisfied.
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None  # multi-range or malformed: RFC 7233 allows ignoring it
+
+    first, last = match.groups()
+    if first == '':
+        length = int(last)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(f"Range {header} not satisfiable for {size} bytes")
+    return start, end
+
+
+def iter_s3_object(s3, bucket, key, start=None, end=None, chunk_size=CHUNK_SIZE):
+    """Yields an S3 object's bytes (optionally an inclusive byte range) as they download."""
+    kwargs = {"Bucket": bucket, "Key": key}
+    if start is not None:
+        kwargs["Range"] = f"bytes={start}-{'' if end is None else end}"
+    body = s3.get_object(**kwargs)["Body"]
+    try:
+        for chunk in body.iter_chunks(chunk_size):
+            yield chunk
+    finally:
+        body.close()
+
+
+def parse_opus_tags(data):
+    """Reads DURATION / WPM / LYRICS from the header pages of an Ogg Opus stream."""
+    fileobj = io.BytesIO(data)
+    info = OggOpusInfo(fileobj)
+    tags = OggOpusVComment(fileobj, info)
+
+    def first(name):
+        values = tags.get(name)
+        return values[0] if values else None
+
+    duration = first("DURATION")
+    wpm = first("WPM")
+    return {
+        "duration": float(duration) if duration else None,
+        "WPM": int(float(wpm)) if wpm else None,
+        "text": first("LYRICS"),
+    }
+
+
+def read_opus_metadata(s3, bucket, key):
+    """Fetches just enough of a cached chapter to read its tags, falling back to the whole object."""
+    head = b''.join(iter_s3_object(s3, bucket, key, 0, TAG_PROBE_BYTES - 1))
+    try:
+        return parse_opus_tags(head)
+    except Exception:
+        if len(head) < TAG_PROBE_BYTES:
+            raise  # we already had the whole object
+        logger.info(f"Tags for {key} exceed {TAG_PROBE_BYTES} bytes, fetching the full object")
+        return parse_opus_tags(b''.join(iter_s3_object(s3, bucket, key)))
+
+
+def iter_mmap(mapped, start=None, end=None, chunk_size=CHUNK_SIZE):
+    """Yields an inclusive byte range of an mmap in chunks, closing the mapping when done."""
+    try:
+        pos = start or 0
+        stop = len(mapped) if end is None else end + 1
+        while pos < stop:
+            yield mapped[pos:min(pos + chunk_size, stop)]
+            pos += chunk_size
+    finally:
+        mapped.close()
+
+
+class CachedAudioSource:
+    """Cached chapter audio: local disk tier first, S3 behind it.
+
+    Full reads that miss the disk are streamed from S3 and written through to
+    disk once the download completes, so the next hit costs no S3 round-trip.
+    """
+
+    def __init__(self, s3, bucket, disk_cache=None):
+        self.s3 = s3
+        self.bucket = bucket
+        self.disk_cache = disk_cache
+
+    def size(self, key):
+        """Object size in bytes, or None if the chapter is not cached anywhere."""
+        if self.disk_cache:
+            size = self.disk_cache.size_of(key)
+            if size is not None:
+                return size
+        try:
+            return self.s3.head_object(Bucket=self.bucket, Key=key)["ContentLength"]
+        except Exception:
+            return None
+
+    def exists(self, key):
+        return self.size(key) is not None
+
+    def iter_bytes(self, key, start=None, end=None):
+        mapped = self.disk_cache.open(key) if self.disk_cache else None
+        if mapped is not None:
+            yield from iter_mmap(mapped, start, end)
+            return
+
+        if start is not None or not self.disk_cache:
+            yield from iter_s3_object(self.s3, self.bucket, key, start, end)
+            return
+
+        parts = []
+        for chunk in iter_s3_object(self.s3, self.bucket, key):
+            parts.append(chunk)
+            yield chunk
+        # Only reached when the client read everything
+        self.disk_cache.put(key, b''.join(parts))
+
+    def metadata(self, key):
+        mapped = self.disk_cache.open(key) if self.disk_cache else None
+        if mapped is None:
+            return read_opus_metadata(self.s3, self.bucket, key)
+        try:
+            try:
+                return parse_opus_tags(mapped[:TAG_PROBE_BYTES])
+            except Exception:
+                return parse_opus_tags(mapped[:])
+        finally:
+            mapped.close()
+
+    def timing(self, key):
+        """TimingIndex of a cached chapter from its sidecar, or None for audio cached before sidecars existed."""
+        timing_key = get_timing_key(key)
+        mapped = self.disk_cache.open(timing_key) if self.disk_cache else None
+        if mapped is not None:
+            try:
+                return TimingIndex.from_json(mapped[:])
+            finally:
+                mapped.close()
+        try:
+            data = self.s3.get_object(Bucket=self.bucket, Key=timing_key)["Body"].read()
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return None
+            raise
+        if self.disk_cache:
+            self.disk_cache.put(timing_key, data)
+        return TimingIndex.from_json(data)
+
+    def manifest(self, key):
+        """v2 segment manifest of a chapter (see tasks.segment_store), or None if it was never stored in segments.
+
+        A manifest that is still growing is always read from S3; only complete
+        ones are served from, and written through to, the disk tier.
+        """
+        manifest_key = get_manifest_key(key)
+        local = None
+        mapped = self.disk_cache.open(manifest_key) if self.disk_cache else None
+        if mapped is not None:
+            try:
+                local = json.loads(mapped[:])
+            finally:
+                mapped.close()
+            if local.get("complete"):
+                return local
+        try:
+            data = self.s3.get_object(Bucket=self.bucket, Key=manifest_key)["Body"].read()
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return local  # produced on this node without S3 (AUDIO_UPLOAD=0)
+            raise
+        manifest = json.loads(data)
+        if manifest.get("complete") and self.disk_cache:
+            self.disk_cache.put(manifest_key, data)
+        return manifest
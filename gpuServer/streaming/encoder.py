@@ -0,0 +1,159 @@
+import os
+import queue
+import logging
+import threading
+import subprocess
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+MAX_MP3_ENCODERS = int(os.environ.get("MAX_MP3_ENCODERS", 32))
+MP3_BITRATE = "128k"
+# 0 keeps the input rate (24 kHz MP3 is fine for speech); set it for clients that need 44.1/48 kHz
+MP3_SAMPLE_RATE = int(os.environ.get("MP3_SAMPLE_RATE", 0))
+READ_SIZE = 64 * 1024
+FEED_WAIT = 0.05  # how long feed() waits for the encoder to catch up before returning what it has
+
+
+def get_ffmpeg_path():
+    if os.environ.get("ENV") == "dev":
+        script_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        return os.path.join(script_dir, "ffmpeg.exe")
+    return "ffmpeg"  # Production PATH
+
+
+FFMPEG_PATH = get_ffmpeg_path()
+
+
+class FfmpegStream:
+    """One long-lived ffmpeg process: raw bytes in on stdin, encoded bytes out on stdout.
+
+    A reader thread drains stdout so a large feed() can never deadlock on a full pipe.
+    """
+
+    def __init__(self, input_args, output_args):
+        cmd = [FFMPEG_PATH, "-hide_banner", "-loglevel", "error",
+               *input_args, "-i", "pipe:0", *output_args, "pipe:1"]
+        self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.DEVNULL)
+        self._output = queue.Queue()
+        self._reader = threading.Thread(target=self._read_output, daemon=True)
+        self._reader.start()
+        self.closed = False
+
+    def _read_output(self):
+        fd = self.process.stdout.fileno()
+        while True:
+            data = os.read(fd, READ_SIZE)
+            if not data:
+                break
+            self._output.put(data)
+        self._output.put(None)
+
+    def _drain(self, wait=0.0):
+        parts = []
+        try:
+            part = self._output.get(timeout=wait) if wait else self._output.get_nowait()
+            while part is not None:
+                parts.append(part)
+                part = self._output.get_nowait()
+        except queue.Empty:
+            pass
+        return b''.join(parts)
+
+    def feed(self, data):
+        """Writes input and returns whatever output is ready (possibly b'' while the encoder fills its lookahead)."""
+        self.process.stdin.write(data)
+        self.process.stdin.flush()
+        return self._drain(FEED_WAIT)
+
+    def close(self):
+        """Flushes the encoder and returns the remaining output."""
+        if self.closed:
+            return b''
+        self.closed = True
+        self.process.stdin.close()
+        self._reader.join()
+        self.process.wait()
+        return self._drain()
+
+    def abort(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.process.kill()
+        self.process.wait()
+
+
+class Mp3EncoderSession(FfmpegStream):
+    """Continuous MP3 stream for one listener: input bytes in, back-to-back MP3 frames out."""
+
+    def __init__(self, pool, input_args):
+        output_rate = ["-ar", str(MP3_SAMPLE_RATE)] if MP3_SAMPLE_RATE else []
+        super().__init__(
+            input_args,
+            ["-codec:a", "libmp3lame", "-b:a", MP3_BITRATE, *output_rate, "-write_xing", "0",
+             "-flush_packets", "1", "-f", "mp3"],
+        )
+        self._pool = pool
+
+    def close(self):
+        try:
+            return super().close()
+        finally:
+            self._pool.release(self)
+
+    def abort(self):
+        try:
+            super().abort()
+        finally:
+            self._pool.release(self)
+
+
+class Mp3EncoderPool:
+    """Caps how many encoder processes can run at once across all listeners."""
+
+    def __init__(self, max_sessions=MAX_MP3_ENCODERS):
+        self.max_sessions = max_sessions
+        self._slots = threading.BoundedSemaphore(max_sessions)
+        self._lock = threading.Lock()
+        self._active = set()
+        self._opened = 0
+        self._rejected = 0
+
+    def open_session(self, sample_rate, channels=1):
+        """Session fed s16le PCM. Returns None when the pool is full (callers fall back to per-chunk encoding)."""
+        return self._open(["-f", "s16le", "-ar", str(sample_rate), "-ac", str(channels)])
+
+    def open_transcoder(self, input_format):
+        """Session fed an encoded stream (e.g. cached Ogg Opus) that is transcoded to MP3 as it arrives."""
+        return self._open(["-f", input_format])
+
+    def _open(self, input_args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            return None
+        try:
+            session = Mp3EncoderSession(self, input_args)
+        except Exception as e:
+            logger.error(f"Failed to start MP3 encoder: {e}")
+            self._slots.release()
+            return None
+        with self._lock:
+            self._active.add(session)
+            self._opened += 1
+        return session
+
+    def release(self, session):
+        with self._lock:
+            if session not in self._active:
+                return
+            self._active.discard(session)
+        self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {"max_sessions": self.max_sessions, "active": len(self._active),
+                    "opened": self._opened, "rejected": self._rejected}
@@ -0,0 +1,37 @@
+import json
+import struct
+
+# Binary /stream framing (format=binary):
+#   1 byte frame type | 4 byte big-endian payload length | payload
+# META  - JSON, sent once up front (chapter, text, WPM, estimated duration, codec)
+# AUDIO - raw audio bytes in the announced codec, no base64, no JSON
+# TIMING - JSON {"sample_rate", "segments": [[char_start, char_end, sample_start, sample_end, paragraph], ...]}
+#          with the segments not sent yet; always ahead of the audio it describes
+# END   - JSON with the final duration
+# ERROR - JSON with a message; no frames follow
+FRAME_META = b'M'
+FRAME_AUDIO = b'A'
+FRAME_TIMING = b'T'
+FRAME_END = b'E'
+FRAME_ERROR = b'X'
+
+HEADER = struct.Struct('>cI')
+BINARY_MIMETYPE = 'application/vnd.novelverse.audio-frames'
+
+
+def encode_frame(kind, payload):
+    return HEADER.pack(kind, len(payload)) + payload
+
+
+def encode_json_frame(kind, obj):
+    return encode_frame(kind, json.dumps(obj).encode('utf-8'))
+
+
+def iter_frames(data):
+    """Decodes a complete framed byte string into (kind, payload) pairs - handy for clients and tools."""
+    pos = 0
+    while pos + HEADER.size <= len(data):
+        kind, length = HEADER.unpack_from(data, pos)
+        pos += HEADER.size
+        yield kind, data[pos:pos + length]
+        pos += length
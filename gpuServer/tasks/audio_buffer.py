@@ -0,0 +1,54 @@
+import numpy as np
+
+MIN_CAPACITY = 19200 * 8
+GROWTH_FACTOR = 2
+
+
+class AudioBuffer:
+    """Append-only sample buffer backed by a growable preallocated array.
+
+    Appends copy only the new block (amortised O(1) per sample) and reads return
+    views, so a listener asking for "samples since cursor N" never copies what it
+    has already seen. Single writer; views handed out stay valid after a regrow
+    because they keep the old array alive and written samples never change.
+    """
+
+    def __init__(self, dtype='float32', capacity=0):
+        self.dtype = np.dtype(dtype)
+        self._data = np.empty(max(int(capacity), MIN_CAPACITY), dtype=self.dtype)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def capacity(self):
+        return len(self._data)
+
+    def append(self, chunk):
+        n = len(chunk)
+        end = self._size + n
+        if end > len(self._data):
+            self._grow(end)
+        self._data[self._size:end] = chunk
+        # Publish the new length only once the samples are in place
+        self._size = end
+
+    def _grow(self, needed):
+        new_data = np.empty(max(needed, int(len(self._data) * GROWTH_FACTOR)), dtype=self.dtype)
+        new_data[:self._size] = self._data[:self._size]
+        self._data = new_data
+
+    def read(self, start=0, end=None):
+        """Zero-copy view of samples [start, end)."""
+        size = self._size
+        end = size if end is None else min(end, size)
+        return self._data[min(start, end):end]
+
+    def read_bytes(self, start=0, end=None):
+        """Same as read(), as a raw byte memoryview."""
+        return memoryview(self.read(start, end)).cast('B')
+
+    def clear(self):
+        self._data = np.empty(MIN_CAPACITY, dtype=self.dtype)
+        self._size = 0
@@ -0,0 +1,104 @@
+import os
+import socket
+import logging
+import threading
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+INFLIGHT_CLAIM_TTL = int(os.environ.get("INFLIGHT_CLAIM_TTL", 900))  # seconds; outlives any single chapter
+NODE_ID = os.environ.get("NODE_ID") or f"{socket.gethostname()}:{os.getpid()}"
+KEY_PREFIX = "inflight"
+
+
+class InflightRegistry:
+    """Single-flight registry of chapters being generated, keyed by their S3 key.
+
+    A request for a chapter that is already being generated on this node
+    attaches to the existing Task as one more listener instead of scraping and
+    synthesizing it again. With a Redis client, claims are also published as
+    `inflight:{s3_key}` -> node id so other GPU nodes can skip chapters that
+    someone else is already producing. Entries are released once the audio
+    is in S3; claims from a node that died expire after INFLIGHT_CLAIM_TTL.
+    """
+
+    def __init__(self, redis_client=None, node_id=NODE_ID, ttl=INFLIGHT_CLAIM_TTL):
+        self.r = redis_client
+        self.node_id = node_id
+        self.ttl = ttl
+        self._tasks = {}
+        self._lock = threading.Lock()
+        self._claims = 0
+        self._attached = 0
+        self._remote_skips = 0
+
+    def _redis_key(self, key):
+        return f"{KEY_PREFIX}:{key}"
+
+    def get(self, key):
+        """The live Task producing `key` on this node, or None. Failed tasks are dropped."""
+        with self._lock:
+            task = self._tasks.get(key)
+            if task is not None and task.error:
+                del self._tasks[key]
+                task = None
+            return task
+
+    def attach(self, key):
+        """Like get(), but counts the caller as an extra listener."""
+        task = self.get(key)
+        if task is not None:
+            with self._lock:
+                self._attached += 1
+        return task
+
+    def claimed_elsewhere(self, key):
+        """True if another node holds the Redis claim for `key`."""
+        if self.r is None:
+            return False
+        try:
+            owner = self.r.get(self._redis_key(key))
+        except Exception as e:
+            logger.warning(f"In-flight claim lookup failed for {key}: {e}")
+            return False
+        if owner is not None and owner != self.node_id:
+            with self._lock:
+                self._remote_skips += 1
+            return True
+        return False
+
+    def claim(self, key, task):
+        """Registers `task` as the producer of `key`. Returns the Task that owns it (an earlier one wins a race)."""
+        with self._lock:
+            existing = self._tasks.get(key)
+            if existing is not None and not existing.error:
+                self._attached += 1
+                return existing
+            self._tasks[key] = task
+            self._claims += 1
+        if self.r is not None:
+            try:
+                self.r.set(self._redis_key(key), self.node_id, nx=True, ex=self.ttl)
+            except Exception as e:
+                logger.warning(f"In-flight claim publish failed for {key}: {e}")
+        return task
+
+    def release(self, key, task):
+        """Drops the entry for `key` if `task` still owns it."""
+        with self._lock:
+            if self._tasks.get(key) is not task:
+                return
+            del self._tasks[key]
+        if self.r is not None:
+            try:
+                # Not atomic, but a claim can only be lost to TTL expiry, long after this node finished
+                if self.r.get(self._redis_key(key)) == self.node_id:
+                    self.r.delete(self._redis_key(key))
+            except Exception as e:
+                logger.warning(f"In-flight claim release failed for {key}: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": len(self._tasks), "claims": self._claims,
+                    "attached_listeners": self._attached, "remote_skips": self._remote_skips}
@@ -0,0 +1,110 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from caching.cache_opum import encode_opus, get_timing_key
+from metrics import stage_timings
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+BUCKET_NAME = 'novelverse-audio-storage-20260131'
+POSTPROCESS_WORKERS = int(os.environ.get("POSTPROCESS_WORKERS", 2))
+POSTPROCESS_QUEUE = int(os.environ.get("POSTPROCESS_QUEUE", 8))  # finished chapters allowed to wait for a worker
+UPLOAD_RETRIES = int(os.environ.get("UPLOAD_RETRIES", 3))
+UPLOAD_BACKOFF = 0.5  # seconds, doubled per attempt
+
+
+def put_with_retries(s3, key, body, content_type, retries=UPLOAD_RETRIES):
+    for attempt in range(retries + 1):
+        try:
+            s3.put_object(Bucket=BUCKET_NAME, Key=key, Body=body, ContentType=content_type)
+            return
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = UPLOAD_BACKOFF * 2 ** attempt
+            logger.warning(f"Upload of {key} failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def store_chapter(task, s3_key, s3=None, audio_cache=None, retries=UPLOAD_RETRIES):
+    """Encodes a finished chapter to tagged Opus and stores it with its timing sidecar (disk cache, then S3)."""
+    with stage_timings.time("postprocess_encode"):
+        opus_bytes = encode_opus(task.audio.read(), task)
+    timing_key, timing_bytes = get_timing_key(s3_key), task.timing.to_json()
+    if audio_cache:
+        audio_cache.put(timing_key, timing_bytes)
+        audio_cache.put(s3_key, opus_bytes)  # write-through: hot chapters skip S3
+    if s3:
+        with stage_timings.time("postprocess_upload"):
+            # Sidecar first: whoever finds the audio can count on its timing index
+            put_with_retries(s3, timing_key, timing_bytes, 'application/json', retries)
+            put_with_retries(s3, s3_key, opus_bytes, 'audio/ogg', retries)
+
+
+class PostProcessor:
+    """Bounded executor that encodes and uploads finished chapters off the inference workers.
+
+    A worker hands its finished Task over and goes straight to the next job.
+    Only when POSTPROCESS_QUEUE chapters are already waiting does submit()
+    block, so a slow S3 cannot pile up unbounded chapters of PCM in memory.
+    """
+
+    def __init__(self, max_workers=POSTPROCESS_WORKERS, max_pending=POSTPROCESS_QUEUE, retries=UPLOAD_RETRIES):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.retries = retries
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="postprocess")
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._done = 0
+        self._failed = 0
+
+    def submit(self, task, s3_key, s3=None, audio_cache=None):
+        """Queues `task` for storing and returns its Future (result None, or the storing exception)."""
+        return self.submit_call(s3_key, store_chapter, task, s3_key, s3, audio_cache, self.retries)
+
+    def submit_call(self, name, fn, *args):
+        """Queues any storing step, fn(*args), under the same bound; `name` is what failures are logged as."""
+        start = time.perf_counter()
+        self._slots.acquire()  # backpressure: only blocks when encode/upload is far behind
+        stage_timings.record("postprocess_submit_wait", time.perf_counter() - start)
+        with self._lock:
+            self._queued += 1
+        future = self._executor.submit(self._run, name, fn, args, time.perf_counter())
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _run(self, name, fn, args, queued_at):
+        stage_timings.record("postprocess_queue_wait", time.perf_counter() - queued_at)
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+        try:
+            with stage_timings.time("postprocess_total"):
+                result = fn(*args)
+            with self._lock:
+                self._done += 1
+            return result
+        except Exception as e:
+            logger.error(f"Storing {name} failed: {e}", exc_info=True)
+            with self._lock:
+                self._failed += 1
+            raise
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def stats(self):
+        with self._lock:
+            return {"workers": self.max_workers, "queued": self._queued, "running": self._running,
+                    "done": self._done, "failed": self._failed}
@@ -0,0 +1,61 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import stage_timings
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+PRELOAD_WORKERS = int(os.environ.get("PRELOAD_WORKERS", 4))
+
+
+class PreloadPlanner:
+    """Resolves preload chapters (cache check + scrape) off the request path.
+
+    Chapters are resolved concurrently on a bounded, process-wide pool and
+    appended to the chain in chapter order as they become ready, so the next
+    chapter is always generated first. Resolved Tasks that never make it into
+    the chain (it was canceled) are handed to `release_chapter`, so whatever
+    resolving claimed for them is given back.
+    """
+
+    def __init__(self, task_queue, resolve_chapter, release_chapter=None, max_workers=PRELOAD_WORKERS):
+        self.task_queue = task_queue
+        self.resolve_chapter = resolve_chapter  # (book_url, ch_nr) -> Task, or None if cached / unscrapable
+        self.release_chapter = release_chapter  # Task -> None, for resolved Tasks that are not queued
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="preload")
+
+    def plan(self, task_chain, book_url, chapters, queued):
+        """Starts resolving `chapters` for `task_chain`. `queued` says whether the chain is already in the TaskQueue."""
+        futures = [(ch_nr, self.executor.submit(self.resolve_chapter, book_url, ch_nr)) for ch_nr in chapters]
+        threading.Thread(target=self._collect, args=(task_chain, futures, queued, time.perf_counter()),
+                         name=f"preload-{task_chain.chain_id[:8]}", daemon=True).start()
+
+    def _collect(self, task_chain, futures, queued, started):
+        try:
+            for ch_nr, future in futures:
+                # Keep consuming after a cancel: every resolved Task is either queued or released
+                try:
+                    task = future.result()
+                except Exception as e:
+                    logger.warning(f"Preload of chapter {ch_nr} failed: {e}")
+                    continue
+                if task is None:
+                    continue
+                if not task_chain.add_task(task):
+                    if self.release_chapter:
+                        self.release_chapter(task)
+                    continue
+                if not queued:
+                    # Requested chapter was cached: the chain only needs a worker once it has work
+                    self.task_queue.put_chain(task_chain)
+                    queued = True
+        finally:
+            task_chain.close()
+            elapsed = time.perf_counter() - started
+            stage_timings.record("preload_complete", elapsed)
+            logger.info(f"Preload planning for chain {task_chain.chain_id} finished in {elapsed:.2f}s")
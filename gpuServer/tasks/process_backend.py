@@ -0,0 +1,359 @@
+import os
+import queue
+import logging
+import threading
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import boto3
+import numpy as np
+import torch
+
+from tts.model_pool import ModelPool, DEFAULT_LANG_CODE
+from tts.inference_scheduler import InferenceScheduler
+from caching.cache_opum import get_s3_key
+from tasks.audio_buffer import AudioBuffer
+from tts.timing import TimingIndex
+from tasks.postprocess import PostProcessor
+from tasks.task_queue import ChainDispatcher, render_task, BUFFER_HEADROOM, AUDIO_UPLOAD
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(processName)s - %(threadName)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# TASK_DEVICES pins one process per entry ("cuda:0,cuda:1" or "cpu,cpu,cpu,cpu");
+# otherwise one process per GPU, or TASK_PROCESSES CPU processes with disjoint core sets.
+TASK_DEVICES = os.environ.get("TASK_DEVICES", "")
+TASK_PROCESSES = int(os.environ.get("TASK_PROCESSES", 0))
+THREADS_PER_PROCESS = int(os.environ.get("TASK_THREADS_PER_PROCESS", 2))
+RING_SLOTS = int(os.environ.get("TASK_RING_SLOTS", 64))  # blocks per process in flight to the HTTP process
+CANCEL_POLL_SECONDS = 0.2
+READY_TIMEOUT = 600
+
+
+def plan_devices(devices=TASK_DEVICES, processes=TASK_PROCESSES):
+    """[(device, cpu core set or None)] for each worker process."""
+    if devices:
+        names = [d.strip() for d in devices.split(",") if d.strip()]
+    elif torch.cuda.is_available() and not processes:
+        names = [f"cuda:{i}" for i in range(torch.cuda.device_count())]
+    else:
+        names = ["cpu"] * (processes or max(1, (os.cpu_count() or 1) // 4))
+
+    cpu_names = [i for i, name in enumerate(names) if name == "cpu"]
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else []
+    plan = [(name, None) for name in names]
+    if cpu_names and len(cores) >= len(cpu_names):
+        share = len(cores) // len(cpu_names)
+        for n, i in enumerate(cpu_names):
+            plan[i] = ("cpu", cores[n * share:(n + 1) * share])
+    return plan
+
+
+class _ChildTask:
+    """Stand-in for Task inside a worker process: blocks go to the shared-memory ring, not to listeners."""
+
+    def __init__(self, payload, dtype, ring, free_slots, results, cancel_event):
+        self.job_id = payload["job_id"]
+        self.task_id = payload["task_id"]
+        self.text = payload["text"]
+        self.ch = payload["ch"]
+        self.book_url = payload["book_url"]
+        self.wpm = payload["wpm"]
+        self.duration = payload["duration"]
+        self.sample_rate = payload["sample_rate"]
+        self.priority = payload["priority"]
+        self.dtype = dtype
+        self.audio = AudioBuffer(dtype, capacity=self.duration * self.sample_rate * BUFFER_HEADROOM)  # for encode_opus
+        self.timing = TimingIndex(self.sample_rate)  # for the sidecar upload
+        self.done = False
+        self.error = None
+        self._ring = ring
+        self._free_slots = free_slots
+        self._results = results
+        self._cancel_event = cancel_event
+
+    def is_canceled(self):
+        return self.done or self._cancel_event.is_set()
+
+    def put_chunk(self, chunk):
+        self.audio.append(chunk)
+        slot_size = self._ring.shape[1]
+        for start in range(0, len(chunk), slot_size):
+            piece = chunk[start:start + slot_size]
+            slot = self._free_slots.get()  # backpressure: waits while the HTTP process catches up
+            self._ring[slot, :len(piece)] = piece
+            self._results.put(("block", self.job_id, slot, len(piece)))
+
+    def add_timing(self, entry):
+        self.timing.add(entry)
+        self._results.put(("timing", self.job_id, entry))
+
+    def mark_complete(self):
+        self.done = True
+        self._results.put(("complete", self.job_id))
+
+    def set_error(self, msg):
+        self.error = msg
+        self.done = True
+        self._results.put(("error", self.job_id, msg))
+
+
+class _CacheRelay:
+    """Hands encoded audio back to the HTTP process, which owns the disk cache index."""
+
+    def __init__(self, results, job_id):
+        self._results = results
+        self._job_id = job_id
+
+    def put(self, key, data):
+        self._results.put(("cache", self._job_id, key, data))
+
+
+def process_main(index, device, cores, dtype, sample_rate, block_size, shm_name, ring_slots,
+                 job_queues, cancel_events, free_slots, results, stop_event, relay_cache):
+    """Entry point of a worker process: one model + InferenceScheduler, THREADS_PER_PROCESS job threads."""
+    if cores:
+        os.sched_setaffinity(0, cores)
+        torch.set_num_threads(len(cores))
+    device = torch.device(device)
+
+    model_pool = ModelPool(sample_rate)
+    model_pool.load(DEFAULT_LANG_CODE, device)
+    scheduler = InferenceScheduler(model_pool, DEFAULT_LANG_CODE, device)
+    scheduler.start()
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    ring = np.ndarray((ring_slots, block_size), dtype=dtype, buffer=shm.buf)
+    s3 = boto3.client('s3') if AUDIO_UPLOAD else None
+    post_processor = PostProcessor()
+
+    def run_jobs(slot):
+        worker_id = f"p{index}-{slot}"
+        while not stop_event.is_set():
+            try:
+                payload = job_queues[slot].get(timeout=0.1)
+            except queue.Empty:
+                continue
+            task = _ChildTask(payload, dtype, ring, free_slots, results, cancel_events[slot])
+            stored = None
+            try:
+                cache = _CacheRelay(results, task.job_id) if relay_cache else None
+                stored = render_task(task, get_s3_key(task.book_url, task.ch), worker_id, dtype, block_size,
+                                     sample_rate, stop_event, scheduler, s3, cache, post_processor)
+            finally:
+                # The thread is free now; "stored" follows once encode + upload are done
+                results.put(("finished", task.job_id, stored is not None))
+                if stored is not None:
+                    stored.add_done_callback(lambda _, job_id=task.job_id: results.put(("stored", job_id)))
+
+    threads = [threading.Thread(target=run_jobs, args=(slot,), name=f"proc{index}-worker{slot}", daemon=True)
+               for slot in range(len(job_queues))]
+    for t in threads:
+        t.start()
+    results.put(("ready", index, str(device), cores, model_pool.stats()))
+
+    stop_event.wait()
+    scheduler.stop()
+    for t in threads:
+        t.join(timeout=5)
+    post_processor.shutdown(wait=False)
+    del ring
+    shm.close()
+
+
+class _WorkerProcess:
+    """Parent-side handle of one worker process: its queues, ring and the jobs it is running."""
+
+    def __init__(self, ctx, index, device, cores, dtype, block_size, ring_slots, threads):
+        self.index = index
+        self.device = device
+        self.cores = cores
+        self.itemsize = np.dtype(dtype).itemsize
+        self.shm = shared_memory.SharedMemory(create=True, size=ring_slots * block_size * self.itemsize)
+        self.ring = np.ndarray((ring_slots, block_size), dtype=dtype, buffer=self.shm.buf)
+        self.job_queues = [ctx.Queue() for _ in range(threads)]
+        self.cancel_events = [ctx.Event() for _ in range(threads)]
+        self.free_slots = ctx.Queue()
+        for slot in range(ring_slots):
+            self.free_slots.put(slot)
+        self.results = ctx.Queue()
+        self.ready = threading.Event()
+        self.process = None
+        self.model_stats = None
+        self.jobs = {}  # job_id -> (Job, finished Event)
+        self.storing = {}  # job_id -> Task whose audio is still being encoded / uploaded
+        self.lock = threading.Lock()
+        self.blocks = 0
+        self.jobs_done = 0
+
+
+class ProcessTaskQueue(ChainDispatcher):
+    """TaskQueue backend that renders chapters in worker processes (TASK_BACKEND=process).
+
+    Scheduling stays in the HTTP process (same JobScheduler, priorities and
+    fair share as the thread backend). Each worker process is pinned to a
+    device or a CPU core set and runs its own model and InferenceScheduler,
+    so synthesis, resampling and Opus encoding never hold the HTTP process's
+    GIL. Audio blocks come back through a per-process shared-memory ring:
+    the worker writes a block into a free slot and sends only the slot
+    number, the HTTP process copies it into the Task's AudioBuffer and hands
+    the slot back.
+
+    Worker processes are spawned (CUDA cannot be forked), so they re-import the
+    server module as `__mp_main__`, which skips building the service objects;
+    start() must run under its `__main__` guard.
+    """
+    backend = "process"
+
+    def __init__(self, dtype, sample_rate, block_size, num_workers=None, audio_cache=None, inflight=None,
+                 devices=None, threads_per_process=THREADS_PER_PROCESS, ring_slots=RING_SLOTS):
+        super().__init__()
+        self.dtype = dtype
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.audio_cache = audio_cache
+        self.inflight = inflight
+        self.threads_per_process = threads_per_process
+        self.ring_slots = ring_slots
+        self.device_plan = devices if devices is not None else plan_devices()
+        self.num_workers = len(self.device_plan) * threads_per_process  # num_workers is implied by the plan
+        self.model_pool = None  # models live in the worker processes; see process_stats()
+        self.inference_scheduler = None
+        self.post_processor = None  # each worker process stores its own chapters
+
+        self._ctx = mp.get_context("spawn")  # CUDA cannot be forked
+        self._stop_event = self._ctx.Event()
+        self._processes = []
+
+        logger.info(f"ProcessTaskQueue plan: {self.device_plan} x {threads_per_process} threads")
+
+    def start(self, worker_function=None):
+        """Starts the worker processes. `worker_function` is accepted for parity with TaskQueue and unused."""
+        for index, (device, cores) in enumerate(self.device_plan):
+            proc = _WorkerProcess(self._ctx, index, device, cores, self.dtype, self.block_size,
+                                  self.ring_slots, self.threads_per_process)
+            proc.process = self._ctx.Process(
+                target=process_main, name=f"tts-worker-{index}", daemon=True,
+                args=(index, device, cores, self.dtype, self.sample_rate, self.block_size, proc.shm.name,
+                      self.ring_slots, proc.job_queues, proc.cancel_events, proc.free_slots, proc.results,
+                      self._stop_event, self.audio_cache is not None))
+            proc.process.start()
+            self._processes.append(proc)
+            threading.Thread(target=self._relay, args=(proc,), name=f"relay-{index}", daemon=True).start()
+
+        for proc in self._processes:
+            if not proc.ready.wait(READY_TIMEOUT):
+                raise RuntimeError(f"Worker process {proc.index} on {proc.device} did not start")
+            for slot in range(self.threads_per_process):
+                threading.Thread(target=self._dispatch, args=(proc, slot),
+                                 name=f"dispatch-{proc.index}-{slot}", daemon=True).start()
+        self.workers_initialized.set()
+        logger.info(f"All {len(self._processes)} worker processes initialized.")
+
+    def _dispatch(self, proc, slot):
+        # One dispatcher per process thread: a process never holds queued work the scheduler could give elsewhere
+        while not self._stop_event.is_set():
+            job = self.job_scheduler.get(timeout=0.1)
+            if job is None:
+                continue
+            task = job.task
+            finished = threading.Event()
+            try:
+                if job.is_canceled() or not proc.process.is_alive():
+                    if not proc.process.is_alive():
+                        task.set_error(f"Worker process {proc.index} is not running")
+                    continue
+                job_id = task.task_id
+                with proc.lock:
+                    proc.jobs[job_id] = (job, finished)
+                proc.cancel_events[slot].clear()
+                proc.job_queues[slot].put({
+                    "job_id": job_id, "task_id": task.task_id, "text": task.text, "ch": task.ch,
+                    "book_url": task.book_url, "wpm": task.wpm, "duration": task.duration,
+                    "sample_rate": task.sample_rate, "priority": task.priority,
+                })
+                while not finished.wait(CANCEL_POLL_SECONDS):
+                    if job.is_canceled():
+                        proc.cancel_events[slot].set()
+                    if not proc.process.is_alive():
+                        task.set_error(f"Worker process {proc.index} exited")
+                        break
+            finally:
+                with proc.lock:
+                    proc.jobs.pop(task.task_id, None)
+                    storing = task.task_id in proc.storing
+                if self.inflight and not storing:  # otherwise released when "stored" arrives
+                    self.inflight.release(get_s3_key(task.book_url, task.ch), task)
+                self.job_scheduler.task_done(job)
+
+    def _relay(self, proc):
+        """Applies one worker process's messages to the Tasks listeners are reading."""
+        while not self._stop_event.is_set():
+            try:
+                message = proc.results.get(timeout=1)
+            except queue.Empty:
+                if not proc.process.is_alive() and not proc.ready.is_set():
+                    logger.error(f"Worker process {proc.index} died during startup")
+                    return
+                continue
+            kind = message[0]
+            if kind == "ready":
+                _, _, _, _, proc.model_stats = message
+                proc.ready.set()
+                continue
+
+            job_id = message[1]
+            if kind == "stored":
+                with proc.lock:
+                    task = proc.storing.pop(job_id, None)
+                if task is not None and self.inflight:
+                    self.inflight.release(get_s3_key(task.book_url, task.ch), task)
+                continue
+            with proc.lock:
+                job, finished = proc.jobs.get(job_id, (None, None))
+            if kind == "block":
+                _, _, slot, n = message
+                if job is not None:
+                    job.task.put_chunk(proc.ring[slot, :n])  # AudioBuffer.append copies out of the ring
+                proc.free_slots.put(slot)
+                proc.blocks += 1
+            elif job is None:
+                continue
+            elif kind == "timing":
+                job.task.add_timing(message[2])
+            elif kind == "complete":
+                job.task.mark_complete()
+            elif kind == "error":
+                job.task.set_error(message[2])
+            elif kind == "cache":
+                if self.audio_cache:
+                    self.audio_cache.put(message[2], message[3])
+            elif kind == "finished":
+                if message[2]:
+                    with proc.lock:
+                        proc.storing[job_id] = job.task
+                proc.jobs_done += 1
+                finished.set()
+
+
+    def stop(self):
+        self._stop_event.set()
+        for proc in self._processes:
+            proc.process.join(timeout=10)
+            if proc.process.is_alive():
+                proc.process.terminate()
+            del proc.ring
+            proc.shm.close()
+            proc.shm.unlink()
+        logger.info("Stopped all worker processes.")
+
+    def process_stats(self):
+        stats = []
+        for proc in self._processes:
+            with proc.lock:
+                running = len(proc.jobs)
+            stats.append({"index": proc.index, "device": proc.device, "cores": proc.cores,
+                          "pid": proc.process.pid, "alive": proc.process.is_alive(), "running_jobs": running,
+                          "jobs_done": proc.jobs_done, "blocks": proc.blocks, "model": proc.model_stats})
+        return stats
@@ -0,0 +1,484 @@
+import os
+import json
+import time
+import logging
+import threading
+
+import boto3
+import numpy as np
+import redis
+import torch
+
+from tts.model_pool import ModelPool, DEFAULT_LANG_CODE
+from tts.inference_scheduler import InferenceScheduler
+from caching.cache_opum import get_s3_key
+from tasks.audio_buffer import AudioBuffer
+from tts.timing import TimingIndex
+from tasks.inflight import NODE_ID
+from tasks.scheduler import PRIORITY_NAMES
+from tasks.postprocess import PostProcessor
+from tasks.task_queue import ChainDispatcher, render_task, BUFFER_HEADROOM, AUDIO_UPLOAD, MAX_WORKERS
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+REDIS_WORKERS = int(os.environ.get("REDIS_WORKERS", MAX_WORKERS))  # TTS threads on this node; 0 = HTTP front only
+REDIS_DISPATCH_SLOTS = int(os.environ.get("REDIS_DISPATCH_SLOTS", 8))  # jobs this node keeps in the cluster at once
+JOB_VISIBILITY_TIMEOUT = int(os.environ.get("JOB_VISIBILITY_TIMEOUT", 60))  # seconds without a heartbeat
+JOB_STREAMS = {priority: f"tts:jobs:{name}" for priority, name in PRIORITY_NAMES.items()}
+WORKER_GROUP = "tts-workers"
+DEAD_LETTER_STREAM = "tts:jobs:dead"  # jobs a worker could not handle at all (e.g. a malformed payload)
+DEAD_LETTER_MAXLEN = 1000
+RELAY_MAXLEN = 10000  # entries kept per relay stream; a block is read within a second of being written
+KEY_TTL = 3600  # relay streams and job state of a node/job that vanished
+READ_BLOCK_MS = 1000
+CANCEL_POLL_SECONDS = 0.2
+CANCEL_CHECK_SECONDS = 0.5
+
+
+def _relay_key(node_id):
+    return f"tts:relay:{node_id}"
+
+
+def _state_key(job_id):
+    return f"tts:job:{job_id}"
+
+
+def _text(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class _RemoteTask:
+    """Stand-in for Task on the node that renders a job: blocks are published to the requesting node's relay stream.
+
+    `resume_from` samples were already published by a node that died (or was
+    stopped) mid-job; they are rendered again but not sent twice.
+    """
+
+    def __init__(self, r, payload, resume_from=0):
+        self.job_id = payload["job_id"]
+        self.task_id = payload["task_id"]
+        self.text = payload["text"]
+        self.ch = payload["ch"]
+        self.book_url = payload["book_url"]
+        self.wpm = payload["wpm"]
+        self.duration = payload["duration"]
+        self.sample_rate = payload["sample_rate"]
+        self.priority = payload["priority"]
+        self.dtype = payload["dtype"]
+        self.audio = AudioBuffer(self.dtype, capacity=self.duration * self.sample_rate * BUFFER_HEADROOM)
+        self.timing = TimingIndex(self.sample_rate)
+        self.done = False
+        self.error = None
+        self.handed_off = False  # another node owns the job now; publish nothing more
+        self.resume_from = resume_from
+        self._r = r
+        self._reply = payload["reply"]
+        self._canceled = False
+        self._cancel_checked = 0.0
+
+    def is_canceled(self):
+        if self.done or self.handed_off or self._canceled:
+            return True
+        now = time.monotonic()
+        if now - self._cancel_checked >= CANCEL_CHECK_SECONDS:
+            self._cancel_checked = now
+            self._canceled = bool(self._r.hget(_state_key(self.job_id), "cancel"))
+        return self._canceled
+
+    def _publish(self, kind, pipe=None, **fields):
+        pipe = pipe if pipe is not None else self._r.pipeline(transaction=False)
+        pipe.xadd(self._reply, {"job_id": self.job_id, "kind": kind, **fields}, maxlen=RELAY_MAXLEN, approximate=True)
+        pipe.expire(self._reply, KEY_TTL)
+        pipe.execute()
+
+    def put_chunk(self, chunk):
+        start = len(self.audio)
+        self.audio.append(chunk)
+        end = len(self.audio)
+        if self.handed_off or end <= self.resume_from:
+            return
+        piece = chunk[max(0, self.resume_from - start):]
+        pipe = self._r.pipeline(transaction=False)
+        # The published offset is what a node taking the job over resumes from
+        pipe.hset(_state_key(self.job_id), "published", end)
+        pipe.expire(_state_key(self.job_id), KEY_TTL)
+        self._publish("block", pipe, end=end, pcm=np.ascontiguousarray(piece).tobytes())
+
+    def add_timing(self, entry):
+        self.timing.add(entry)
+        if not self.handed_off and entry[3] > self.resume_from:
+            self._publish("timing", entry=json.dumps(entry))
+
+    def mark_complete(self):
+        self.done = True
+        if not self.handed_off:
+            self._publish("complete")
+
+    def set_error(self, msg):
+        self.error = msg
+        self.done = True
+        if not self.handed_off:
+            self._publish("error", message=msg)
+
+    def finish(self, storing=False):
+        if not self.handed_off:
+            self._publish("finished", storing=int(storing))
+
+    def stored(self):
+        if not self.handed_off:
+            self._publish("stored")
+
+
+class RedisTaskQueue(ChainDispatcher):
+    """TaskQueue backend that shares chapter jobs between nodes through Redis streams (TASK_BACKEND=redis).
+
+    The HTTP side works like the other backends: chains become Jobs in a local
+    JobScheduler (priorities, fair share, promote), and REDIS_DISPATCH_SLOTS
+    dispatchers move them into the cluster as they are picked, one stream per
+    priority class. Any node with REDIS_WORKERS > 0 claims jobs from those
+    streams through a consumer group (live first) and publishes the audio
+    blocks to the requesting node's relay stream, which copies them into the
+    Task its listeners read.
+
+    A claimed job stays pending in its stream until it is finished. Workers
+    refresh their claims every JOB_VISIBILITY_TIMEOUT / 4; a job whose node
+    stopped heartbeating is taken over with XAUTOCLAIM and resumed after the
+    last published block. stop() (e.g. on a spot interruption notice) hands
+    running jobs back at once instead of waiting for the timeout.
+
+    `redis_client` must not decode responses: audio travels as raw bytes.
+    A job promoted after it was dispatched keeps the priority it was queued with.
+    """
+    backend = "redis"
+
+    def __init__(self, redis_client, dtype, sample_rate, block_size, num_workers=REDIS_WORKERS, audio_cache=None,
+                 inflight=None, node_id=NODE_ID, dispatch_slots=REDIS_DISPATCH_SLOTS,
+                 visibility_timeout=JOB_VISIBILITY_TIMEOUT):
+        super().__init__()
+        self.r = redis_client
+        self.dtype = dtype
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.num_workers = num_workers
+        self.audio_cache = audio_cache
+        self.inflight = inflight
+        self.node_id = node_id
+        self.dispatch_slots = dispatch_slots
+        self.visibility_ms = int(visibility_timeout * 1000)
+        self.heartbeat_seconds = visibility_timeout / 4
+        self.relay_stream = _relay_key(node_id)
+        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.model_pool = ModelPool(sample_rate) if num_workers else None
+        self.inference_scheduler = None
+        self.post_processor = PostProcessor() if num_workers else None
+
+        self._stop_event = threading.Event()
+        self._jobs = {}  # job_id -> (Job, finished Event) for jobs this node dispatched
+        self._storing = {}  # job_id -> Task rendered elsewhere whose audio is still being stored
+        self._jobs_lock = threading.Lock()
+        self._claims = {}  # stream entry id -> (stream, _RemoteTask) for jobs this node renders
+        self._claims_lock = threading.Lock()
+        self._backlog = []  # entries a multi-stream read claimed beyond the one it needed
+        self._backlog_lock = threading.Lock()
+        self._reap_lock = threading.Lock()
+        self._last_reap = 0.0
+        self._counts = {"dispatched": 0, "relayed_blocks": 0, "rendered": 0, "resumed": 0, "handed_off": 0}
+
+        logger.info(f"RedisTaskQueue node {node_id}: {num_workers} workers, {dispatch_slots} dispatch slots")
+
+    def start(self, worker_function=None):
+        """Starts the dispatchers, the relay and (with num_workers) the TTS workers. `worker_function` is unused."""
+        for stream in JOB_STREAMS.values():
+            try:
+                self.r.xgroup_create(stream, WORKER_GROUP, id="0", mkstream=True)
+            except redis.ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+        self.r.delete(self.relay_stream)  # node ids are per process; anything here is from a dead namesake
+
+        threading.Thread(target=self._relay, name="redis-relay", daemon=True).start()
+        for slot in range(self.dispatch_slots):
+            threading.Thread(target=self._dispatch, name=f"redis-dispatch-{slot}", daemon=True).start()
+
+        if self.num_workers:
+            self.model_pool.load(DEFAULT_LANG_CODE, self.device)
+            self.inference_scheduler = InferenceScheduler(self.model_pool, DEFAULT_LANG_CODE, self.device)
+            self.inference_scheduler.start()
+            for index in range(self.num_workers):
+                threading.Thread(target=self._work, args=(index,), name=f"redis-worker-{index}", daemon=True).start()
+            threading.Thread(target=self._heartbeat, name="redis-heartbeat", daemon=True).start()
+
+        self.workers_initialized.set()
+        logger.info("Redis task queue started.")
+
+    # HTTP side: local jobs into the cluster, audio back into Tasks
+
+    def _dispatch(self):
+        while not self._stop_event.is_set():
+            job = self.job_scheduler.get(timeout=0.1)
+            if job is None:
+                continue
+            task = job.task
+            finished = threading.Event()
+            try:
+                if job.is_canceled():
+                    continue
+                job_id = task.task_id
+                with self._jobs_lock:
+                    self._jobs[job_id] = (job, finished)
+                payload = {"job_id": job_id, "task_id": task.task_id, "text": task.text, "ch": task.ch,
+                           "book_url": task.book_url, "wpm": task.wpm, "duration": task.duration,
+                           "sample_rate": task.sample_rate, "priority": job.priority, "dtype": self.dtype,
+                           "reply": self.relay_stream}
+                self.r.xadd(JOB_STREAMS[job.priority], {"payload": json.dumps(payload)})
+                self._counts["dispatched"] += 1
+                cancel_sent = False
+                while not finished.wait(CANCEL_POLL_SECONDS) and not self._stop_event.is_set():
+                    if job.is_canceled() and not cancel_sent:
+                        self.r.hset(_state_key(job_id), "cancel", 1)
+                        self.r.expire(_state_key(job_id), KEY_TTL)
+                        cancel_sent = True
+            except redis.RedisError as e:
+                logger.error(f"Could not dispatch task {task.task_id}: {e}")
+                task.set_error(f"Job queue unavailable: {e}")
+            finally:
+                with self._jobs_lock:
+                    self._jobs.pop(task.task_id, None)
+                    storing = task.task_id in self._storing
+                if self.inflight and not storing:  # otherwise released when "stored" arrives
+                    self.inflight.release(get_s3_key(task.book_url, task.ch), task)
+                self.job_scheduler.task_done(job)
+
+    def _relay(self):
+        """Applies this node's relay stream to the Tasks listeners are reading."""
+        last_id = "0-0"
+        while not self._stop_event.is_set():
+            try:
+                response = self.r.xread({self.relay_stream: last_id}, count=100, block=READ_BLOCK_MS)
+            except redis.RedisError as e:
+                logger.warning(f"Relay read failed: {e}")
+                self._stop_event.wait(1)
+                continue
+            for _, entries in response or []:
+                for entry_id, fields in entries:
+                    last_id = entry_id
+                    self._apply(fields)
+
+    def _apply(self, fields):
+        job_id = _text(fields[b"job_id"])
+        kind = _text(fields[b"kind"])
+        if kind == "stored":
+            with self._jobs_lock:
+                task = self._storing.pop(job_id, None)
+            if task is not None and self.inflight:
+                self.inflight.release(get_s3_key(task.book_url, task.ch), task)
+            return
+        with self._jobs_lock:
+            job, finished = self._jobs.get(job_id, (None, None))
+        if job is None:
+            return
+        task = job.task
+        if kind == "block":
+            pcm = np.frombuffer(fields[b"pcm"], dtype=self.dtype)
+            have = len(task.audio)
+            end = int(fields[b"end"])
+            if end > have:  # a takeover can overlap what the previous node already sent
+                task.put_chunk(pcm[max(0, len(pcm) - (end - have)):])
+                self._counts["relayed_blocks"] += 1
+        elif kind == "timing":
+            task.add_timing(json.loads(fields[b"entry"]))  # the index ignores entries a resumed job re-sends
+        elif kind == "complete":
+            task.mark_complete()
+        elif kind == "error":
+            task.set_error(_text(fields[b"message"]))
+        elif kind == "finished":
+            if fields.get(b"storing") == b"1":
+                with self._jobs_lock:
+                    self._storing[job_id] = task
+            finished.set()
+
+
+    # Worker side: claim jobs from the cluster and render them
+
+    def _next_entry(self):
+        with self._backlog_lock:
+            if self._backlog:
+                self._backlog.sort(key=lambda entry: entry[0])
+                return self._backlog.pop(0)[1:]
+
+        entry = self._reap()
+        if entry is not None:
+            return entry
+
+        streams = {stream: ">" for _, stream in sorted(JOB_STREAMS.items())}
+        response = self.r.xreadgroup(WORKER_GROUP, self.node_id, streams, count=1, block=READ_BLOCK_MS)
+        if not response:
+            return None
+        priorities = {stream: priority for priority, stream in JOB_STREAMS.items()}
+        claimed = sorted((priorities[_text(stream)], _text(stream), entries[0][0], entries[0][1])
+                         for stream, entries in response if entries)
+        if len(claimed) > 1:
+            # One blocking read covers every stream, so it can claim one job per stream; keep the rest for later
+            with self._backlog_lock:
+                self._backlog.extend(claimed[1:])
+        return claimed[0][1:]
+
+    def _reap(self):
+        """Takes over one job whose node stopped heartbeating, at most once per heartbeat interval per node."""
+        with self._reap_lock:
+            now = time.monotonic()
+            if now - self._last_reap < self.heartbeat_seconds:
+                return None
+            self._last_reap = now
+        for _, stream in sorted(JOB_STREAMS.items()):
+            # Redis 7 adds a third element (deleted ids) to the reply; 6.2 returns [next_id, entries]
+            entries = self.r.xautoclaim(stream, WORKER_GROUP, self.node_id, self.visibility_ms,
+                                        start_id="0-0", count=1)[1]
+            if entries:
+                entry_id, fields = entries[0]
+                logger.warning(f"Took over stale job {_text(entry_id)} from {stream}")
+                return stream, entry_id, fields
+        return None
+
+    def _work(self, index):
+        worker_id = f"{self.node_id}-{index}"
+        s3 = boto3.client('s3') if AUDIO_UPLOAD else None
+        while not self._stop_event.is_set():
+            try:
+                entry = self._next_entry()
+            except redis.RedisError as e:
+                logger.warning(f"Worker {worker_id}: job read failed: {e}")
+                self._stop_event.wait(1)
+                continue
+            if entry is None:
+                continue
+            try:
+                self._render(worker_id, s3, *entry)
+            except Exception as e:
+                # Anything _render does not handle itself would come back through XAUTOCLAIM forever
+                logger.error(f"Worker {worker_id}: job {_text(entry[1])} failed: {e}", exc_info=True)
+                self._dead_letter(*entry, error=e)
+
+    def _dead_letter(self, stream, entry_id, fields, error):
+        with self._claims_lock:
+            self._claims.pop(entry_id, None)
+        try:
+            self.r.xadd(DEAD_LETTER_STREAM, {**fields, "stream": stream, "entry_id": entry_id, "error": str(error)},
+                        maxlen=DEAD_LETTER_MAXLEN, approximate=True)
+            self.r.xack(stream, WORKER_GROUP, entry_id)
+            self.r.xdel(stream, entry_id)
+        except redis.RedisError as e:
+            logger.error(f"Could not dead-letter job {_text(entry_id)}: {e}")
+
+    def _render(self, worker_id, s3, stream, entry_id, fields):
+        payload = json.loads(fields[b"payload"])
+        task = None
+        stored = None
+        try:
+            state = self.r.hgetall(_state_key(payload["job_id"]))
+            task = _RemoteTask(self.r, payload, int(state.get(b"published", 0)))
+            with self._claims_lock:
+                self._claims[entry_id] = (stream, task)
+            if state.get(b"cancel"):
+                logger.info(f"Worker {worker_id}: Task {task.task_id} is canceled. Skipping.")
+                return
+            if task.resume_from:
+                self._counts["resumed"] += 1
+                logger.info(f"Worker {worker_id}: Resuming task {task.task_id} after {task.resume_from} samples")
+            logger.info(f"Worker {worker_id}: Processing task {task.task_id} (chapter {task.ch}, "
+                        f"priority {task.priority})")
+            stored = render_task(task, get_s3_key(task.book_url, task.ch), worker_id, task.dtype, self.block_size,
+                                 task.sample_rate, self._stop_event, self.inference_scheduler, s3, self.audio_cache,
+                                 self.post_processor)
+            self._counts["rendered"] += 1
+        except redis.RedisError as e:
+            # The claim stays pending, so another node (or this one) takes the job over after the timeout
+            logger.error(f"Worker {worker_id}: lost Redis during job {_text(entry_id)}: {e}")
+            if task is not None:
+                task.handed_off = True
+        finally:
+            if stored is not None and not task.handed_off:
+                # The worker moves on, but the claim (and its heartbeat) stays until the audio is stored:
+                # a node that dies mid-upload gets the job retried
+                try:
+                    task.finish(storing=True)
+                except redis.RedisError as e:
+                    logger.error(f"Worker {worker_id}: could not report job {_text(entry_id)} finished: {e}")
+                stored.add_done_callback(lambda _: self._acknowledge(worker_id, stream, entry_id, task, stored=True))
+            else:
+                self._acknowledge(worker_id, stream, entry_id, task)
+
+    def _acknowledge(self, worker_id, stream, entry_id, task, stored=False):
+        with self._claims_lock:
+            self._claims.pop(entry_id, None)
+        if task is None or task.handed_off:
+            return
+        try:
+            if stored:
+                task.stored()
+            else:
+                task.finish()
+            self.r.xack(stream, WORKER_GROUP, entry_id)
+            self.r.xdel(stream, entry_id)
+        except redis.RedisError as e:
+            logger.error(f"Worker {worker_id}: could not acknowledge job {_text(entry_id)}: {e}")
+
+    def _heartbeat(self):
+        """Keeps this node's claims from going stale; stops rendering any job another node has taken over."""
+        while not self._stop_event.wait(self.heartbeat_seconds):
+            with self._claims_lock:
+                claims = list(self._claims.items())
+            with self._backlog_lock:
+                claims += [(entry_id, (stream, None)) for _, stream, entry_id, _ in self._backlog]
+            for entry_id, (stream, task) in claims:
+                try:
+                    pending = self.r.xpending_range(stream, WORKER_GROUP, min=entry_id, max=entry_id, count=1)
+                    if not pending or _text(pending[0]["consumer"]) != self.node_id:
+                        logger.warning(f"Job {_text(entry_id)} was taken over by another node; dropping it")
+                        if task is None:
+                            with self._backlog_lock:
+                                self._backlog = [entry for entry in self._backlog if entry[2] != entry_id]
+                        else:
+                            task.handed_off = True
+                        self._counts["handed_off"] += 1
+                        continue
+                    self.r.xclaim(stream, WORKER_GROUP, self.node_id, 0, [entry_id], justid=True)
+                except redis.RedisError as e:
+                    logger.warning(f"Heartbeat for job {_text(entry_id)} failed: {e}")
+
+    def stop(self):
+        """Stops this node. Jobs it was rendering become claimable by other nodes immediately."""
+        with self._claims_lock:
+            claims = list(self._claims.items())
+        for _, (_, task) in claims:
+            task.handed_off = True
+        self._stop_event.set()
+        for entry_id, (stream, _) in claims:
+            try:
+                self.r.xclaim(stream, WORKER_GROUP, self.node_id, 0, [entry_id], idle=self.visibility_ms,
+                              justid=True)
+                self._counts["handed_off"] += 1
+            except redis.RedisError as e:
+                logger.warning(f"Could not hand back job {_text(entry_id)}: {e}")
+        if self.inference_scheduler:
+            self.inference_scheduler.stop()
+        if self.post_processor:
+            self.post_processor.shutdown(wait=False)
+        logger.info(f"Stopped Redis task queue node {self.node_id} ({len(claims)} jobs handed back).")
+
+    def cluster_stats(self):
+        streams = {}
+        for priority, stream in JOB_STREAMS.items():
+            try:
+                streams[PRIORITY_NAMES[priority]] = {"length": self.r.xlen(stream),
+                                                     "claimed": self.r.xpending(stream, WORKER_GROUP)["pending"]}
+            except redis.RedisError as e:
+                streams[PRIORITY_NAMES[priority]] = {"error": str(e)}
+        with self._jobs_lock:
+            remote_jobs = len(self._jobs)
+        with self._claims_lock:
+            rendering = len(self._claims)
+        return {"node": self.node_id, "workers": self.num_workers, "streams": streams,
+                "dispatched_running": remote_jobs, "rendering": rendering, **self._counts}
@@ -0,0 +1,149 @@
+import time
+import logging
+import itertools
+import threading
+from collections import OrderedDict, defaultdict, deque
+
+from metrics import stage_timings
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Lower runs first: a listener is waiting > the chapter after it > deeper preloads
+PRIORITY_LIVE = 0
+PRIORITY_NEXT = 1
+PRIORITY_PRELOAD = 2
+PRIORITY_NAMES = {PRIORITY_LIVE: "live", PRIORITY_NEXT: "next", PRIORITY_PRELOAD: "preload"}
+
+
+def chapter_priority(ch_nr, live_ch):
+    """Priority class of chapter `ch_nr` in a chain whose listener asked for `live_ch`."""
+    if live_ch is None:
+        return PRIORITY_PRELOAD
+    distance = ch_nr - live_ch
+    if distance <= 0:
+        return PRIORITY_LIVE
+    if distance == 1:
+        return PRIORITY_NEXT
+    return PRIORITY_PRELOAD
+
+
+class Job:
+    """One chapter of a chain, scheduled on its own so any idle worker can pick it up."""
+
+    def __init__(self, task, chain, priority, user_id=None):
+        self.task = task
+        self.chain = chain
+        self.priority = priority
+        self.user_id = user_id
+        self.queued_at = time.perf_counter()
+        self.done = threading.Event()
+        task.priority = priority  # segments inherit it at the inference scheduler
+
+    def is_canceled(self):
+        return self.task.is_canceled() or (self.chain is not None and self.chain.is_canceled())
+
+
+class JobScheduler:
+    """Per-chapter job queue with priority classes and per-user fair share.
+
+    The highest non-empty priority class always goes first. Within a class the
+    user with the fewest running jobs (then the one served longest ago) is
+    picked, and a user's own jobs run in the order they were queued. Workers
+    share one scheduler, so a chain's preloads spread over whichever workers
+    are idle instead of running behind each other on one worker.
+    """
+
+    def __init__(self):
+        self._queues = {priority: OrderedDict() for priority in PRIORITY_NAMES}  # priority -> user -> deque[Job]
+        self._running = defaultdict(int)
+        self._last_served = {}
+        self._served = itertools.count()
+        self._cond = threading.Condition()
+        self._pending = 0
+        self._started = defaultdict(int)
+        self._dropped = 0
+
+    def put(self, job):
+        with self._cond:
+            self._queues[job.priority].setdefault(job.user_id, deque()).append(job)
+            self._pending += 1
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Next job to run, or None if nothing became runnable within `timeout`."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._pending > 0, timeout):
+                return None
+            job = self._pop_next()
+            if job is None:
+                return None
+            self._running[job.user_id] += 1
+            self._last_served[job.user_id] = next(self._served)
+            self._started[job.priority] += 1
+        stage_timings.record(f"job_wait_{PRIORITY_NAMES[job.priority]}", time.perf_counter() - job.queued_at)
+        return job
+
+    def _pop_next(self):
+        for priority in sorted(self._queues):
+            users = self._queues[priority]
+            while users:
+                user_id = min(users, key=lambda u: (self._running.get(u, 0), self._last_served.get(u, -1)))
+                jobs = users[user_id]
+                job = jobs.popleft()
+                if not jobs:
+                    del users[user_id]
+                self._pending -= 1
+                if job.is_canceled():
+                    # Canceled chains leave their jobs behind; drop them lazily
+                    self._dropped += 1
+                    job.done.set()
+                    continue
+                return job
+        return None
+
+    def promote(self, task, priority):
+        """Raises `task` to `priority` (e.g. a live listener attached to a preload).
+
+        A queued job moves to the front of its user's queue in the new class;
+        a running one picks the priority up for the segments it submits next.
+        """
+        with self._cond:
+            if priority >= task.priority:
+                return False
+            task.priority = priority
+            for users in self._queues.values():
+                for user_id, jobs in users.items():
+                    job = next((job for job in jobs if job.task is task), None)
+                    if job is None:
+                        continue
+                    jobs.remove(job)
+                    if not jobs:
+                        del users[user_id]
+                    job.priority = priority
+                    self._queues[priority].setdefault(user_id, deque()).appendleft(job)
+                    return True
+        return False
+
+    def task_done(self, job):
+        with self._cond:
+            self._running[job.user_id] -= 1
+            if self._running[job.user_id] <= 0:
+                del self._running[job.user_id]
+        job.done.set()
+
+    def qsize(self):
+        with self._cond:
+            return self._pending
+
+    def stats(self):
+        with self._cond:
+            return {
+                "pending": {PRIORITY_NAMES[p]: sum(len(jobs) for jobs in users.values())
+                            for p, users in self._queues.items()},
+                "running": sum(self._running.values()),
+                "users_running": len(self._running),
+                "started": {PRIORITY_NAMES[p]: n for p, n in self._started.items()},
+                "dropped_canceled": self._dropped,
+            }
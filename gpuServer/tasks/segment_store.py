@@ -0,0 +1,253 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from concurrent.futures import Future
+
+from botocore.exceptions import ClientError
+
+from caching.cache_opum import encode_pcm_opus, decode_opus, get_manifest_key, get_segment_key, segment_name
+from metrics import stage_timings
+from tasks.postprocess import BUCKET_NAME, put_with_retries, store_chapter
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+SEGMENTED_AUDIO = os.environ.get("SEGMENTED_AUDIO", "0") == "1"  # also store chapters as v2 segments + manifest
+SEGMENT_SECONDS = float(os.environ.get("AUDIO_SEGMENT_SECONDS", 10))
+MANIFEST_VERSION = 2
+
+
+def text_digest(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def load_manifest(s3_key, s3=None, audio_cache=None):
+    """The v2 manifest of a chapter as a dict (S3 first: partial ones change), or None if there is none."""
+    manifest_key = get_manifest_key(s3_key)
+    if s3:
+        try:
+            return json.loads(s3.get_object(Bucket=BUCKET_NAME, Key=manifest_key)["Body"].read())
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404"):
+                raise
+    mapped = audio_cache.open(manifest_key) if audio_cache else None
+    if mapped is None:
+        return None
+    try:
+        return json.loads(mapped[:])
+    finally:
+        mapped.close()
+
+
+def read_segment(s3_key, index, s3=None, audio_cache=None):
+    segment_key = get_segment_key(s3_key, index)
+    mapped = audio_cache.open(segment_key) if audio_cache else None
+    if mapped is not None:
+        try:
+            return mapped[:]
+        finally:
+            mapped.close()
+    return s3.get_object(Bucket=BUCKET_NAME, Key=segment_key)["Body"].read()
+
+
+class SegmentWriter:
+    """Stores a chapter progressively as ~SEGMENT_SECONDS Ogg Opus segments plus a manifest.
+
+    Segments are cut at the first segment boundary of the timing index past
+    SEGMENT_SECONDS, so every stored segment ends where synthesis can pick up
+    again. Each one is encoded and uploaded on the PostProcessor as soon as its
+    audio is in the Task; the manifest (segment sample / text ranges and the
+    timing entries they cover) is rewritten whenever the run of uploaded
+    segments grows, so a crashed or canceled chapter leaves a usable prefix.
+    The final segment carries the tail (padding and silence) and marks the
+    manifest complete. The v1 object is still written as before; the Node
+    backend and the cached stream paths read that one.
+    """
+
+    def __init__(self, task, s3_key, s3=None, audio_cache=None, post_processor=None,
+                 segment_seconds=SEGMENT_SECONDS):
+        self.task = task
+        self.s3_key = s3_key
+        self.s3 = s3
+        self.audio_cache = audio_cache
+        self.post_processor = post_processor
+        self.segment_samples = int(segment_seconds * task.sample_rate)
+        self.segment_seconds = segment_seconds
+        self.segments = []  # manifest entries, in order
+        self.closed = Future()  # done once every segment, the manifest and the v1 object are stored
+        self._uploaded = set()  # indexes of stored segments
+        self._written = 0  # segments covered by the last manifest built
+        self._written_complete = False
+        self._manifest_seq = 0  # of the last manifest built
+        self._complete = False
+        self._timing_cursor = 0
+        self._sample_start = 0
+        self._char_start = 0
+        self._futures = []
+        self._lock = threading.Lock()  # segment / upload bookkeeping; never held across I/O
+        self._manifest_lock = threading.Lock()  # orders manifest writes
+
+    def resume(self, block_size):
+        """Refills the Task from a partial manifest of the same text; returns (char, sample) to continue from."""
+        try:
+            manifest = load_manifest(self.s3_key, self.s3, self.audio_cache)
+        except Exception as e:
+            logger.warning(f"Could not read manifest for {self.s3_key}: {e}")
+            return 0, 0
+        if (not manifest or manifest.get("complete") or not manifest.get("segments")
+                or manifest.get("text_sha1") != text_digest(self.task.text)
+                or manifest.get("sample_rate") != self.task.sample_rate):
+            return 0, 0
+
+        # Everything is fetched and decoded before the Task sees any of it
+        try:
+            with stage_timings.time("segment_resume"):
+                pcm = []
+                for index, entry in enumerate(manifest["segments"]):
+                    audio = decode_opus(read_segment(self.s3_key, index, self.s3, self.audio_cache),
+                                        self.task.dtype, self.task.sample_rate)
+                    samples = entry["sample_end"] - entry["sample_start"]
+                    audio = audio[:samples]
+                    if len(audio) < samples:
+                        audio = audio.copy()
+                        audio.resize(samples)  # pads with zeros
+                    pcm.append(audio)
+        except Exception as e:
+            logger.warning(f"Could not resume {self.s3_key} from its segments, starting over: {e}")
+            return 0, 0
+
+        for entry in manifest["timing"]:
+            self.task.add_timing(entry)
+        for audio in pcm:
+            for start in range(0, len(audio), block_size):
+                self.task.put_chunk(audio[start:start + block_size])
+
+        self.segments = manifest["segments"]
+        self._uploaded = set(range(len(self.segments)))
+        self._written = len(self.segments)
+        self._timing_cursor = len(manifest["timing"])
+        self._sample_start = self.segments[-1]["sample_end"]
+        self._char_start = self.segments[-1]["char_end"]
+        logger.info(f"Resuming {self.s3_key} from {len(self.segments)} stored segments "
+                    f"({self._sample_start / self.task.sample_rate:.1f}s, char {self._char_start})")
+        return self._char_start, self._sample_start
+
+    def advance(self):
+        """Cuts and queues a segment once SEGMENT_SECONDS of finished text segments are in the Task."""
+        available = len(self.task.audio)
+        for char_start, char_end, sample_start, sample_end, _ in self.task.timing.since(self._timing_cursor):
+            if sample_end > available:
+                return
+            self._timing_cursor += 1
+            if sample_end - self._sample_start >= self.segment_samples:
+                self._cut(sample_end, char_end)
+
+    def finish(self):
+        """Queues the tail as the final segment and the v1 object; returns the `closed` Future."""
+        self.advance()
+        if len(self.task.audio) > self._sample_start:
+            self._cut(len(self.task.audio), len(self.task.text), final=True)
+        else:
+            with self._lock:
+                self._complete = True
+            self._submit(self.s3_key, self._write_manifest)  # the last cut already took everything
+        self._submit(self.s3_key, store_chapter, self.task, self.s3_key, self.s3, self.audio_cache)
+        self._watch()
+        return self.closed
+
+    def _cut(self, sample_end, char_end, final=False):
+        index = len(self.segments)
+        entry = {"key": segment_name(index), "sample_start": self._sample_start, "sample_end": sample_end,
+                 "char_start": self._char_start, "char_end": char_end}
+        self.segments.append(entry)
+        if final:
+            with self._lock:
+                self._complete = True  # only once the final entry is listed
+        pcm = self.task.audio.read(self._sample_start, sample_end)  # a view; the buffer never rewrites samples
+        self._sample_start, self._char_start = sample_end, char_end
+        self._submit(get_segment_key(self.s3_key, index), self._store_segment, index, pcm)
+
+    def _submit(self, name, fn, *args):
+        if self.post_processor:
+            self._futures.append(self.post_processor.submit_call(name, fn, *args))
+            return
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            logger.error(f"Storing {name} failed: {e}", exc_info=True)
+            future.set_exception(e)
+        self._futures.append(future)
+
+    def _store_segment(self, index, pcm):
+        with stage_timings.time("segment_store"):
+            opus_bytes = encode_pcm_opus(pcm, self.task.sample_rate)
+            segment_key = get_segment_key(self.s3_key, index)
+            if self.audio_cache:
+                self.audio_cache.put(segment_key, opus_bytes)
+            if self.s3:
+                put_with_retries(self.s3, segment_key, opus_bytes, 'audio/ogg')
+        with self._lock:
+            self._uploaded.add(index)
+        self._write_manifest()
+
+    def _write_manifest(self):
+        # Built under _lock, stored outside it, so segment uploads and the inference
+        # thread (finish / _cut) never wait on S3. Writes are ordered by their sequence
+        # number: a stale manifest is skipped rather than stored over a newer one.
+        with self._lock:
+            stored = 0
+            while stored < len(self.segments) and stored in self._uploaded:
+                stored += 1
+            complete = self._complete and stored == len(self.segments)
+            if stored <= self._written and not (complete and not self._written_complete):
+                return
+            self._written = stored
+            self._written_complete = complete
+            self._manifest_seq += 1
+            seq = self._manifest_seq
+            covered = self.segments[stored - 1]["sample_end"] if stored else 0
+            manifest = {
+                "version": MANIFEST_VERSION,
+                "sample_rate": self.task.sample_rate,
+                "segment_seconds": self.segment_seconds,
+                "text_sha1": text_digest(self.task.text),
+                "text_length": len(self.task.text),
+                "wpm": self.task.wpm,
+                "complete": complete,
+                "samples": covered,
+                "segments": self.segments[:stored],
+                "timing": [entry for entry in self.task.timing.since(0) if entry[3] <= covered],
+            }
+        data = json.dumps(manifest).encode("utf-8")
+        manifest_key = get_manifest_key(self.s3_key)
+        with self._manifest_lock:
+            if seq < self._manifest_seq:
+                return  # a newer manifest was built; its writer stores it after us
+            if self.audio_cache:
+                self.audio_cache.put(manifest_key, data)
+            if self.s3:
+                put_with_retries(self.s3, manifest_key, data, 'application/json')
+
+    def _watch(self):
+        remaining = [len(self._futures)]
+        errors = []
+        lock = threading.Lock()
+
+        def done(future):
+            with lock:
+                if future.exception() is not None:
+                    errors.append(future.exception())
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            if errors:
+                self.closed.set_exception(errors[0])
+            else:
+                self.closed.set_result(None)
+
+        for future in list(self._futures):
+            future.add_done_callback(done)
@@ -4,41 +4,91 @@ import threading
 import logging
 import torch
 import uuid
-import queue
 import boto3
 from tts.tts_pipeline import TTSPipeline
-from caching.cache_opum import encode_opus, get_s3_key
-
+from tts.model_pool import ModelPool, DEFAULT_LANG_CODE
+from tts.inference_scheduler import InferenceScheduler
+from caching.cache_opum import get_s3_key
+from tasks.audio_buffer import AudioBuffer
+from tts.timing import TimingIndex
+from tts.audio_format import PIPELINE_SAMPLE_RATE, PIPELINE_DTYPE
+from tasks.scheduler import Job, JobScheduler, chapter_priority, PRIORITY_LIVE
+from tasks.postprocess import PostProcessor, store_chapter
+from tasks.segment_store import SegmentWriter, SEGMENTED_AUDIO
+
+import os
 import numpy as np
 
 MAX_WORKERS = 10
+AUDIO_UPLOAD = os.environ.get("AUDIO_UPLOAD", "1") != "0"  # 0 = keep generated audio local (benchmarks, dev)
+BUFFER_HEADROOM = 1.25  # preallocate a bit past the duration estimate; AudioBuffer grows if it is short
 
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 class TaskChain:
-    def __init__(self, chain_id, tasks: list):
+    def __init__(self, chain_id, tasks: list, complete=True, user_id=None, live_ch=None):
         self.chain_id = chain_id
         self.tasks = tasks
+        self.user_id = user_id  # fair-share key at the job scheduler
+        self.live_ch = live_ch  # chapter a listener is waiting on; later chapters are preloads
         self.canceled = False
         self.error = None
+        # False while preload chapters are still being resolved and appended in the background
+        self.complete = complete
+        self._cond = threading.Condition()
 
     def is_canceled(self):
         return self.canceled
     def cancel(self):
-        self.canceled = True
+        with self._cond:
+            self.canceled = True
+            self._cond.notify_all()
         for task in self.tasks:
             task.cancel()
             task.clear_buffer()
         logger.info(f"Task chain {self.chain_id} has been canceled.")
     def set_error(self, msg):
-        self.error = msg
-        self.canceled = True  # stop waiting
+        with self._cond:
+            self.error = msg
+            self.canceled = True  # stop waiting
+            self._cond.notify_all()
+
+    def add_task(self, task):
+        """Appends a task; returns False (and leaves it out) once the chain is canceled."""
+        with self._cond:
+            if self.canceled:
+                return False
+            self.tasks.append(task)
+            self._cond.notify_all()
+            return True
+
+    def close(self):
+        """No more tasks will be added."""
+        with self._cond:
+            self.complete = True
+            self._cond.notify_all()
+
+    def iter_tasks(self):
+        """Yields tasks in order, waiting for late additions until the chain is closed or canceled."""
+        i = 0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: i < len(self.tasks) or self.complete or self.canceled)
+                if i >= len(self.tasks):
+                    return
+                task = self.tasks[i]
+            i += 1
+            yield task
+
+    def priority_of(self, task):
+        return chapter_priority(task.ch, self.live_ch)
 
 
 class Task:
-    def __init__(self, task_id, text, ch_nr, book_url, wpm, duration, dtype='float32'):
+    def __init__(self, task_id, text, ch_nr, book_url, wpm, duration, dtype=PIPELINE_DTYPE,
+                 sample_rate=PIPELINE_SAMPLE_RATE):
         self.task_id = task_id
         self.text = text
         self.ch = ch_nr
@@ -46,61 +96,167 @@ class Task:
         self.wpm = wpm
         self.duration = duration
         self.dtype = dtype
-        self.response_queues = np.array([], dtype=dtype)
+        self.sample_rate = sample_rate
+        self.audio = AudioBuffer(dtype, capacity=duration * sample_rate * BUFFER_HEADROOM)
+        self.timing = TimingIndex(sample_rate)
         self.done = False
         self.error = None
+        self.priority = PRIORITY_LIVE  # set from the chain when the task is scheduled
+        # Listeners block on this instead of polling; notified on every block, completion and error
+        self._cond = threading.Condition()
 
     def cancel(self):
-        self.done = True
+        with self._cond:
+            self.done = True
+            self._cond.notify_all()
         logger.info(f"Task {self.task_id} has been canceled.")
 
     def clear_buffer(self):
-        self.response_queues = np.array([], dtype=self.dtype)
+        with self._cond:
+            self.audio.clear()
+            self._cond.notify_all()
         logger.info(f"Task {self.task_id} buffer cleared.")
 
     def is_canceled(self):
         return self.done
 
     def put_chunk(self, chunk):
-        self.response_queues = np.concatenate((self.response_queues, chunk))
+        with self._cond:
+            self.audio.append(chunk)
+            self._cond.notify_all()
+
+    def add_timing(self, entry):
+        self.timing.add(entry)
 
     def get_response(self):
-        return self.response_queues, self.done
+        return self.audio.read(), self.done
+
+    def read_since(self, cursor):
+        """Samples produced after `cursor` (zero-copy view) and whether the task is done."""
+        done = self.done  # read before the samples so a done=True reader has seen every block
+        return self.audio.read(cursor), done
+
+    def wait_for_samples(self, cursor, timeout=None):
+        """Blocks until there are samples past `cursor` or the task is done, then behaves like read_since.
+
+        Any number of listeners can wait on the same task, each with its own cursor.
+        Returns an empty view with done=False if `timeout` expires first.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self.done or len(self.audio) > cursor, timeout)
+            return self.read_since(cursor)
 
     def mark_complete(self):
         logger.info(f"Task {self.task_id} has been completed 2.")
-        self.done = True
+        with self._cond:
+            self.done = True
+            self._cond.notify_all()
 
     def set_error(self, msg):
-        self.error = msg
-        self.done = True  # stop waiting
+        with self._cond:
+            self.error = msg
+            self.done = True  # stop waiting
+            self._cond.notify_all()
+
+class ChainDispatcher:
+    """Chain plumbing shared by every TaskQueue backend.
+
+    Chains and single tasks become Jobs in the backend's JobScheduler (a chain's
+    chapters one by one, as they are added) and stay in `active_tasks` until all
+    of their jobs are done. Backends only differ in how they run the jobs.
+    """
+
+    def __init__(self):
+        self.job_scheduler = JobScheduler()
+        self.workers_initialized = threading.Event()
+        self.active_tasks = {}  # task_id / chain_id -> Task / TaskChain
+        self.active_tasks_lock = threading.Lock()
+
+    def wait_for_initialization(self):
+        self.workers_initialized.wait()
+
+    def put_task(self, task: Task):
+        logger.info(f"Queueing task {task.task_id}")
+        with self.active_tasks_lock:
+            self.active_tasks[task.task_id] = task
+
+        job = Job(task, None, PRIORITY_LIVE)
+        self.job_scheduler.put(job)
+        threading.Thread(target=self._retire, args=(task.task_id, [job]), daemon=True).start()
+
+    def put_chain(self, task_chain: TaskChain):
+        logger.info(f"Queueing task chain of size {len(task_chain.tasks)}")
+        with self.active_tasks_lock:
+            self.active_tasks[task_chain.chain_id] = task_chain
+        threading.Thread(target=self._dispatch_chain, args=(task_chain,),
+                         name=f"chain-{task_chain.chain_id[:8]}", daemon=True).start()
+
+    def _dispatch_chain(self, task_chain: TaskChain):
+        """Turns each chapter of the chain into its own job as it is added, then retires the chain."""
+        jobs = []
+        for task in task_chain.iter_tasks():
+            job = Job(task, task_chain, task_chain.priority_of(task), task_chain.user_id)
+            self.job_scheduler.put(job)
+            jobs.append(job)
+        self._retire(task_chain.chain_id, jobs)
+
+    def _retire(self, key, jobs):
+        for job in jobs:
+            job.done.wait()
+        with self.active_tasks_lock:
+            self.active_tasks.pop(key, None)
+        logger.info(f"Completed {key} ({len(jobs)} jobs)")
+
+    def cancel_task(self, task_id):
+        with self.active_tasks_lock:
+            task = self.active_tasks.pop(task_id, None)
+        if task:
+            # Outside the lock: canceling a chain touches every task. Backends that render
+            # elsewhere forward the cancel to the worker at their next poll.
+            task.cancel()
+            logger.info(f"Task {task_id} marked as canceled.")
+            return True
+        logger.warning(f"Task {task_id} not found in active tasks.")
+        return False
+
+
+class TaskQueue(ChainDispatcher):
+    backend = "thread"
 
-class TaskQueue:
-    def __init__(self, dtype, sample_rate, block_size, num_workers=MAX_WORKERS):
+    def __init__(self, dtype, sample_rate, block_size, num_workers=MAX_WORKERS, audio_cache=None, inflight=None):
+        super().__init__()
         self.num_workers = num_workers
-        self.request_queue = queue.Queue()
+        self.audio_cache = audio_cache
+        self.inflight = inflight
         self.dtype = dtype
         self.sample_rate = sample_rate
         self.block_size = block_size
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.lang_code = DEFAULT_LANG_CODE
+        self.model_pool = ModelPool(sample_rate)
+        self.inference_scheduler = None
+        self.post_processor = PostProcessor()
 
-        self.workers_initialized = threading.Event()
         self.worker_barrier = threading.Barrier(self.num_workers + 1)
         self.workers = {}
-        self.active_tasks = {} # Store active tasks by task_id
-        self.active_tasks_lock = threading.Lock()
 
         logger.info(f"TaskQueue using device: {self.device}")
 
     def start(self, worker_function):
+        # Load + warm the shared model before any worker can pick up a chain
+        self.model_pool.load(self.lang_code, self.device)
+        self.inference_scheduler = InferenceScheduler(self.model_pool, self.lang_code, self.device)
+        self.inference_scheduler.start()
+
         for _ in range(self.num_workers):
             worker_id = str(uuid.uuid4())
             stop_event = threading.Event()
             t = threading.Thread(
                 target=worker_function,
-                args=(self.request_queue,
+                args=(self.job_scheduler,
                       self.device, self.dtype, self.sample_rate,
-                      self.block_size, worker_id, stop_event, self.worker_barrier, self.active_tasks_lock, self.active_tasks),
+                      self.block_size, worker_id, stop_event, self.worker_barrier, self.active_tasks_lock, self.active_tasks,
+                      self.inference_scheduler, self.audio_cache, self.inflight, self.post_processor),
                 daemon=True
             )
             self.workers[worker_id] = {"thread": t, "stop_event": stop_event}
@@ -111,108 +267,99 @@ class TaskQueue:
         self.workers_initialized.set()
         logger.info("All workers initialized.")
 
-    def wait_for_initialization(self):
-        self.workers_initialized.wait()
-
-    def put_task(self, task: Task):
-        logger.info(f"Queueing task {task.task_id}")
-        with self.active_tasks_lock:
-            self.active_tasks[task.task_id] = task
-
-        self.request_queue.put(task)
-    def put_chain(self, task_chain: TaskChain):
-        logger.info(f"Queueing task chain of size {len(task_chain.tasks)}")
-        with self.active_tasks_lock:
-            self.active_tasks[task_chain.chain_id] = task_chain
-        self.request_queue.put(task_chain)
-    def cancel_task(self, task_id):
-        with self.active_tasks_lock:
-            task = self.active_tasks.get(task_id)
-            if task:
-                self.active_tasks.pop(task_id,None)
-                task.cancel()
-                logger.info(f"Task {task_id} marked as canceled.")
-                # Clear per-socket response queue
-                return True
-        logger.warning(f"Task {task_id} not found in active tasks.")
-        return False
-    
     def stop(self):
         for worker_id, info in self.workers.items():
             info["stop_event"].set()
+        if self.inference_scheduler:
+            self.inference_scheduler.stop()
+        self.post_processor.shutdown(wait=False)
         logger.info("Stopping all workers.")
 
 
+def render_task(task, s3_key, worker_id, dtype, block_size, sample_rate, stop_event,
+                inference_scheduler, s3=None, audio_cache=None, post_processor=None, segmented=SEGMENTED_AUDIO):
+    """Synthesizes one chapter into `task`, then stores the encoded Opus in the disk cache and S3.
+
+    Shared by every backend's workers. With a post_processor the storing is
+    queued there and its Future returned, so the worker can take the next job
+    right away; without one it happens inline and None is returned. With
+    `segmented`, v2 segments are stored while the chapter is synthesized and a
+    chapter left partial by an earlier attempt resumes after its last segment.
+    """
+    stored = None
+    writer = None
+    try:
+        start_char = start_sample = 0
+        if segmented and (s3 or audio_cache):
+            writer = SegmentWriter(task, s3_key, s3, audio_cache, post_processor)
+            start_char, start_sample = writer.resume(block_size)
+
+        # Pass the task object itself to the TTSPipeline
+        tts_pipeline = TTSPipeline(worker_id, dtype, block_size, sample_rate, stop_event, task, inference_scheduler)
+
+        for isFinal, chunk in tts_pipeline.generate_audio_chunks(task.text, start_char, start_sample):
+
+            if isFinal:
+                logger.info(f"Worker {worker_id}: Completed task {task.task_id}")
+                canceled = task.is_canceled()  # the pipeline stops early on cancel; that audio is partial
+                task.put_chunk(chunk)
+                task.mark_complete()
+                if canceled or (not s3 and not audio_cache):
+                    continue  # a segmented chapter keeps the segments it already stored
+                if writer:
+                    stored = writer.finish()
+                    if not post_processor:
+                        stored = stored.result()  # stored inline, so already done; raises like store_chapter
+                elif post_processor:
+                    stored = post_processor.submit(task, s3_key, s3, audio_cache)
+                else:
+                    store_chapter(task, s3_key, s3, audio_cache)
+                continue
+            task.put_chunk(chunk)
+            if writer:
+                writer.advance()
+
+    except Exception as e:
+        logger.error(f"Worker {worker_id} error on task {task.task_id}: {e}", exc_info=True)
+        task.set_error(str(e))
+    return stored
+
+
 # Worker function
-def worker_function(request_queue, device,
+def worker_function(job_scheduler, device,
                     dtype, sample_rate, block_size,
-                    worker_id, stop_event, worker_barrier, active_tasks_lock, active_tasks):
+                    worker_id, stop_event, worker_barrier, active_tasks_lock, active_tasks,
+                    inference_scheduler, audio_cache=None, inflight=None, post_processor=None):
 
     logger.info(f"Worker {worker_id} ready at barrier.")
     worker_barrier.wait()
     logger.info(f"Worker {worker_id} started.")
 
 
-    s3 = boto3.client('s3')  # ← this line uses EC2 IAM role automatically
-    BUCKET_NAME = 'novelverse-audio-storage-20260131'
+    s3 = boto3.client('s3') if AUDIO_UPLOAD else None  # ← this line uses EC2 IAM role automatically
     while not stop_event.is_set():
-        try:
-            task_chain: TaskChain = request_queue.get(timeout=0.1)
-        except queue.Empty:
+        job = job_scheduler.get(timeout=0.1)
+        if job is None:
             continue
 
-        if task_chain.is_canceled():
-            logger.info(f"Worker {worker_id}: Task chain {task_chain.chain_id} is canceled before starting.")
-            continue
-
-        logger.info(f"Worker {worker_id}: Starting task chain {task_chain.chain_id}")
+        task = job.task
+        s3_key = get_s3_key(task.book_url, task.ch)
+        stored = None
+        try:
+            logger.info(f"Worker {worker_id}: Processing task {task.task_id} (chapter {task.ch}, priority {job.priority})")
+            if job.is_canceled():
+                logger.info(f"Worker {worker_id}: Task {task.task_id} is canceled. Skipping.")
+                continue
 
+            stored = render_task(task, s3_key, worker_id, dtype, block_size, sample_rate, stop_event,
+                                 inference_scheduler, s3, audio_cache, post_processor)
 
-        try:
-            for task in task_chain.tasks:
-                
-                s3_key = get_s3_key(task.book_url, task.ch)
-
-                logger.info(f"Worker {worker_id}: Processing task {task.task_id} in chain {task_chain.chain_id}")
-                if task_chain.is_canceled() or task.is_canceled():
-                    logger.info(f"Worker {worker_id}: Task {task.task_id} or chain {task_chain.chain_id} is canceled. Skipping.")
-                    continue
-                try:
-                    # Pass the task object itself to the TTSPipeline
-                    tts_pipeline = TTSPipeline(worker_id, dtype, block_size, sample_rate, stop_event, task, device)
-
-                    for isFinal, chunk in tts_pipeline.generate_audio_chunks(task.text):
-
-                        if isFinal:
-                            logger.info(f"Worker {worker_id}: Completed task {task.task_id}")
-                            task.put_chunk(chunk)
-                            task.mark_complete()
-                            opus_bytes = encode_opus(task.response_queues, task)
-                            s3.put_object(
-                                Bucket=BUCKET_NAME,
-                                Key=s3_key,
-                                Body=opus_bytes,
-                                ContentType='audio/ogg'
-                            )
-                            continue
-                        task.put_chunk(chunk)
-                    else:
-                        continue  # Continue to next task in chain
-
-                except Exception as e:
-                    logger.error(f"Worker {worker_id} error on task {task.task_id}: {e}", exc_info=True)
-                    task.set_error(str(e))
-                    
-                finally:
-                    continue
-            else:
-                with active_tasks_lock:
-                    active_tasks.pop(task_chain.chain_id, None)
-                task_chain.cancel()
-                logger.info(f"Worker {worker_id}: Completed task chain {task_chain.chain_id}")
-        except Exception as e:
-            logger.error(f"Worker {worker_id}: Error processing task chain {task_chain.chain_id}: {e}")
-            task_chain.set_error(str(e))
         finally:
-            with active_tasks_lock:
-                active_tasks.pop(task_chain.chain_id, None)
+            if inflight:
+                # Late requests now find the chapter in S3 (or see it failed and generate again);
+                # until the upload is done they keep attaching to the finished Task
+                if stored is not None:
+                    stored.add_done_callback(lambda _, s3_key=s3_key, task=task: inflight.release(s3_key, task))
+                else:
+                    inflight.release(s3_key, task)
+            job_scheduler.task_done(job)
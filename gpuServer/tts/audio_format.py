@@ -0,0 +1,34 @@
+import os
+
+import numpy as np
+
+# Kokoro's native output rate. Audio stays at PIPELINE_SAMPLE_RATE from the
+# model through Task buffers, relays and storage; encoders take it as-is (Opus
+# and MP3 both accept 24 kHz) and only resample when an output rate is forced.
+# PIPELINE_SAMPLE_RATE=48000 restores the old upsampled path.
+MODEL_SAMPLE_RATE = 24000
+PIPELINE_SAMPLE_RATE = int(os.environ.get("PIPELINE_SAMPLE_RATE", MODEL_SAMPLE_RATE))
+PIPELINE_DTYPE = os.environ.get("PIPELINE_DTYPE", "float32")  # "int16" halves buffer memory again
+BLOCK_SECONDS = 0.4  # one streamed block
+INT16_SCALE = 32767
+
+
+def block_size_for(sample_rate):
+    return int(sample_rate * BLOCK_SECONDS)
+
+
+def to_dtype(pcm, dtype):
+    """Converts float PCM in [-1, 1] and int16 PCM into each other; anything else is a plain cast (no copy if equal)."""
+    dtype = np.dtype(dtype)
+    if pcm.dtype == dtype:
+        return pcm
+    if dtype == np.int16:
+        return (np.clip(pcm, -1.0, 1.0) * INT16_SCALE).astype(np.int16)
+    if pcm.dtype == np.int16:
+        return (pcm / INT16_SCALE).astype(dtype)
+    return pcm.astype(dtype)
+
+
+def to_int16(pcm):
+    """s16le samples for ffmpeg; int16 buffers pass through without a copy."""
+    return to_dtype(pcm, np.int16)
@@ -0,0 +1,189 @@
+import os
+import time
+import queue
+import logging
+import itertools
+import threading
+
+import torch
+import numpy as np
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Knobs: how many segments one scheduling pass may take, and how long the first
+# segment of a pass may wait for company before the batch is run anyway.
+# Segments still run one at a time (see InferenceScheduler), so MAX_BATCH_SIZE
+# only limits how many a pass takes before it checks for preemption, and the
+# fill wait defaults to 0: without a batched forward it is pure added latency.
+MAX_BATCH_SIZE = int(os.environ.get("TTS_MAX_BATCH_SIZE", 8))
+MAX_BATCH_WAIT_MS = float(os.environ.get("TTS_MAX_BATCH_WAIT_MS", 0))
+
+
+class SegmentRequest:
+    """A single text segment waiting for synthesis on behalf of a task."""
+
+    def __init__(self, text, voice, speed, task=None, seq=0):
+        self.text = text
+        self.voice = voice
+        self.speed = speed
+        self.task = task
+        # Lower runs first; taken from the task's job priority (live listener > next chapter > preload)
+        self.priority = task.priority if task is not None else 0
+        self.seq = seq
+        self.audio = None
+        self.error = None
+        self.submitted_at = time.perf_counter()
+        self._done = threading.Event()
+
+    def is_canceled(self):
+        return self.task is not None and self.task.is_canceled()
+
+    def sort_key(self):
+        return (self.priority, self.seq)
+
+    def set_result(self, audio):
+        self.audio = audio
+        self._done.set()
+
+    def set_error(self, msg):
+        self.error = msg
+        self._done.set()
+
+    def result(self, timeout=None):
+        """Blocks until the segment is synthesized. Returns None if it was dropped (canceled/stopped)."""
+        if not self._done.wait(timeout):
+            raise TimeoutError("Segment synthesis timed out")
+        if self.error:
+            raise RuntimeError(self.error)
+        return self.audio
+
+
+class InferenceScheduler:
+    """Owns the device: collects segments from every active task and runs them in batches.
+
+    Segments are taken in priority order, and a batch yields at segment
+    boundaries: if a higher-priority segment arrives while a batch of preload
+    segments is running, the rest of the batch goes back into the queue.
+
+    Kokoro's KModel.forward only takes one phoneme sequence, so a batch is executed
+    back-to-back under a single lease on one thread. That still removes the
+    MAX_WORKERS-way contention for the device and keeps all per-batch setup in one
+    place; _run_batch is the only thing to change once a padded batched forward exists.
+    """
+
+    def __init__(self, model_pool, lang_code, device,
+                 max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_BATCH_WAIT_MS):
+        self.model_pool = model_pool
+        self.lang_code = lang_code
+        self.device = device
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.model = model_pool.load(lang_code, device)
+
+        self._queue = queue.PriorityQueue()  # (priority, seq, SegmentRequest)
+        self._seq = itertools.count()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._segments = 0
+        self._busy_seconds = 0.0
+        self._preemptions = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"inference-{self.device}", daemon=True)
+        self._thread.start()
+        logger.info(f"InferenceScheduler started on {self.device} "
+                    f"(max_batch_size={self.max_batch_size}, max_wait={self.max_wait * 1000:.0f}ms)")
+
+    def stop(self):
+        self._stop_event.set()
+        # Release anyone still waiting on a segment that will never run
+        while True:
+            try:
+                self._queue.get_nowait()[-1].set_result(None)
+            except queue.Empty:
+                break
+
+    def submit(self, text, voice, speed=1, task=None):
+        request = SegmentRequest(text, voice, speed, task, next(self._seq))
+        if self._stop_event.is_set():
+            request.set_result(None)
+        else:
+            self._queue.put((*request.sort_key(), request))
+        return request
+
+    def _preempted_by_queue(self, request):
+        # Peek under the queue's own lock; the heap head is the most urgent waiting segment
+        with self._queue.mutex:
+            return bool(self._queue.queue) and self._queue.queue[0][0] < request.priority
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=0.1)[-1]]
+        except queue.Empty:
+            return []
+
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining)[-1])
+                else:
+                    batch.append(self._queue.get_nowait()[-1])  # whatever is already queued
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        with self.model_pool.lease(self.lang_code, self.device) as model:
+            while not self._stop_event.is_set():
+                batch = self._next_batch()
+                if batch:
+                    self._run_batch(model, batch)
+
+    def _run_batch(self, model, batch):
+        start = time.perf_counter()
+        ran = 0
+        for i, request in enumerate(batch):
+            if self._preempted_by_queue(request):
+                for waiting in batch[i:]:
+                    self._queue.put((*waiting.sort_key(), waiting))
+                with self._stats_lock:
+                    self._preemptions += 1
+                break
+            if request.is_canceled():
+                request.set_result(None)
+                continue
+            try:
+                parts = [audio for _, _, audio in model.pipeline(request.text, voice=request.voice,
+                                                                 speed=request.speed, split_pattern=None)
+                         if isinstance(audio, torch.Tensor)]
+                audio = torch.cat(parts).cpu().numpy() if parts else np.array([], dtype=np.float32)
+                request.set_result(audio)
+                ran += 1
+            except Exception as e:
+                logger.error(f"InferenceScheduler: segment failed: {e}", exc_info=True)
+                request.set_error(str(e))
+
+        with self._stats_lock:
+            self._batches += 1
+            self._segments += ran
+            self._busy_seconds += time.perf_counter() - start
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "device": str(self.device),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "pending_segments": self._queue.qsize(),
+                "batches": self._batches,
+                "segments": self._segments,
+                "avg_batch_size": round(self._segments / self._batches, 2) if self._batches else 0,
+                "busy_seconds": round(self._busy_seconds, 3),
+                "preemptions": self._preemptions,
+            }
@@ -0,0 +1,118 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+import torch
+import kokoro
+import torchaudio
+
+from tts.audio_format import MODEL_SAMPLE_RATE
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_LANG_CODE = 'a'
+DEFAULT_VOICE = 'am_adam'
+WARMUP_TEXT = "Warming up."
+
+
+def get_rss_bytes():
+    """Current resident set size of this process (falls back to peak RSS off Linux)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class PooledModel:
+    """One loaded Kokoro pipeline + resampler (None at the native rate), shared by every worker on the same device."""
+
+    def __init__(self, lang_code, device, pipeline, resampler, load_seconds, warmup_seconds, param_bytes):
+        self.lang_code = lang_code
+        self.device = device
+        self.pipeline = pipeline
+        self.resampler = resampler
+        self.load_seconds = load_seconds
+        self.warmup_seconds = warmup_seconds
+        self.param_bytes = param_bytes
+        self.active_leases = 0
+        self.total_leases = 0
+
+    def stats(self):
+        return {
+            "lang_code": self.lang_code,
+            "device": str(self.device),
+            "load_seconds": round(self.load_seconds, 3),
+            "warmup_seconds": round(self.warmup_seconds, 3),
+            "param_bytes": self.param_bytes,
+            "active_leases": self.active_leases,
+            "total_leases": self.total_leases,
+        }
+
+
+class ModelPool:
+    """Process-wide registry that loads each (lang_code, device) pipeline exactly once."""
+
+    def __init__(self, sample_rate, voice=DEFAULT_VOICE):
+        self.sample_rate = sample_rate
+        self.voice = voice
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def load(self, lang_code, device):
+        key = (lang_code, str(device))
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                model = self._load_model(lang_code, device)
+                self._models[key] = model
+            return model
+
+    def _load_model(self, lang_code, device):
+        logger.info(f"ModelPool: loading Kokoro pipeline lang={lang_code} device={device}")
+        rss_before = get_rss_bytes()
+        start = time.perf_counter()
+        pipeline = kokoro.KPipeline(lang_code=lang_code, device=device)
+        resampler = None
+        if self.sample_rate != MODEL_SAMPLE_RATE:
+            resampler = torchaudio.transforms.Resample(orig_freq=MODEL_SAMPLE_RATE, new_freq=self.sample_rate)
+        load_seconds = time.perf_counter() - start
+
+        # First inference pays for voice download, lazy kernels and g2p caches - do it now, not on a listener
+        start = time.perf_counter()
+        for _, _, audio in pipeline(WARMUP_TEXT, voice=self.voice, speed=1):
+            if isinstance(audio, torch.Tensor) and resampler is not None:
+                resampler(audio.cpu().float().unsqueeze(0))
+        warmup_seconds = time.perf_counter() - start
+
+        model = getattr(pipeline, "model", None)
+        param_bytes = sum(p.numel() * p.element_size() for p in model.parameters()) if model is not None else 0
+
+        logger.info(f"ModelPool: loaded lang={lang_code} device={device} in {load_seconds:.2f}s, "
+                    f"warmup {warmup_seconds:.2f}s, RSS +{(get_rss_bytes() - rss_before) / 2**20:.0f} MiB")
+        return PooledModel(lang_code, device, pipeline, resampler, load_seconds, warmup_seconds, param_bytes)
+
+    @contextmanager
+    def lease(self, lang_code, device):
+        model = self.load(lang_code, device)
+        with self._lock:
+            model.active_leases += 1
+            model.total_leases += 1
+        try:
+            yield model
+        finally:
+            with self._lock:
+                model.active_leases -= 1
+
+    def stats(self):
+        with self._lock:
+            models = [model.stats() for model in self._models.values()]
+        stats = {"models": models, "rss_bytes": get_rss_bytes()}
+        if torch.cuda.is_available():
+            stats["cuda_allocated_bytes"] = torch.cuda.memory_allocated()
+        return stats
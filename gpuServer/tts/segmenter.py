@@ -0,0 +1,97 @@
+import os
+import re
+
+# The first segment is kept short so the first block is ready after one sentence
+# or clause; later segments grow by SEGMENT_GROWTH up to MAX_SEGMENT_CHARS, since
+# longer segments cost fewer model calls per second of audio.
+FIRST_SEGMENT_CHARS = int(os.environ.get("TTS_FIRST_SEGMENT_CHARS", 100))
+MAX_SEGMENT_CHARS = int(os.environ.get("TTS_MAX_SEGMENT_CHARS", 400))
+SEGMENT_GROWTH = float(os.environ.get("TTS_SEGMENT_GROWTH", 2))
+MIN_CUT_CHARS = 20  # a clause cut shorter than this sounds clipped; keep reading instead
+
+PARAGRAPH = re.compile(r'[^\n]+')
+SENTENCE_END = re.compile(r'[.!?…]+["\'”’)\]]*\s+')
+CLAUSE_END = re.compile(r'[,;:—–]\s*')
+WHITESPACE = re.compile(r'\s+')
+
+
+class Segment:
+    """A piece of chapter text synthesized in one model call; text == chapter[start:end]."""
+
+    __slots__ = ("text", "start", "end", "paragraph")
+
+    def __init__(self, text, start, end, paragraph):
+        self.text = text
+        self.start = start
+        self.end = end
+        self.paragraph = paragraph
+
+    def __repr__(self):
+        return f"Segment({self.start}:{self.end}, paragraph={self.paragraph}, {self.text[:30]!r})"
+
+
+def _strip_span(text, start, end):
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+def _sentences(text, start, end):
+    """(start, end) spans of the sentences in text[start:end]."""
+    pos = start
+    for match in SENTENCE_END.finditer(text, start, end):
+        yield pos, match.end()
+        pos = match.end()
+    if pos < end:
+        yield pos, end
+
+
+def _cut(text, start, end, budget):
+    """End offset for a piece of text[start:end] of at most ~budget chars: last clause break, else last space."""
+    limit = start + budget
+    best = None
+    for pattern in (CLAUSE_END, WHITESPACE):
+        for match in pattern.finditer(text, start + MIN_CUT_CHARS, min(limit, end)):
+            best = match.end()
+        if best is not None:
+            return best
+    return min(limit, end)  # one unbroken run of characters; nothing better to do
+
+
+def segment_text(text, first_chars=FIRST_SEGMENT_CHARS, max_chars=MAX_SEGMENT_CHARS, growth=SEGMENT_GROWTH):
+    """Yields the Segments of a chapter in reading order.
+
+    Segments never span paragraphs (lines) and end on sentence boundaries
+    where possible. The size budget starts at `first_chars` and grows by
+    `growth` after every segment up to `max_chars`. A sentence longer than the
+    budget is cut at its last clause break (then last space) within it.
+    """
+    budget = first_chars
+    for paragraph, line in enumerate(PARAGRAPH.finditer(text)):
+        p_start, p_end = _strip_span(text, line.start(), line.end())
+        if p_start == p_end:
+            continue
+        seg_start = seg_end = None
+        for s_start, s_end in _sentences(text, p_start, p_end):
+            if seg_start is not None and s_end - seg_start <= budget:
+                seg_end = s_end
+                continue
+            if seg_start is not None:
+                start, end = _strip_span(text, seg_start, seg_end)
+                yield Segment(text[start:end], start, end, paragraph)
+                budget = min(max_chars, budget * growth)
+            seg_start, seg_end = s_start, s_end
+            while seg_end - seg_start > budget:
+                cut = _cut(text, seg_start, seg_end, int(budget))
+                start, end = _strip_span(text, seg_start, cut)
+                if start < end:
+                    yield Segment(text[start:end], start, end, paragraph)
+                budget = min(max_chars, budget * growth)
+                seg_start = cut
+        if seg_start is not None:
+            start, end = _strip_span(text, seg_start, seg_end)
+            if start < end:
+                yield Segment(text[start:end], start, end, paragraph)
+                budget = min(max_chars, budget * growth)
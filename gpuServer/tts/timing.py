@@ -0,0 +1,104 @@
+import json
+import threading
+from bisect import bisect_right
+
+TIMING_VERSION = 1
+
+
+class TimingIndex:
+    """Where each synthesized segment of a chapter sits in the text and in the audio.
+
+    One entry per segment, in reading order:
+    [char_start, char_end, sample_start, sample_end, paragraph], with sample
+    offsets at `sample_rate` and `paragraph` the 0-based index of the
+    non-blank line the segment is in. Entries only move forward; a re-sent entry (a
+    resumed job replaying segments a listener already has) is ignored.
+    Lookups are binary searches over the starts.
+    """
+
+    def __init__(self, sample_rate, segments=None):
+        self.sample_rate = sample_rate
+        self._segments = []
+        self._char_starts = []
+        self._sample_starts = []
+        self._paragraphs = []
+        self._lock = threading.Lock()
+        for entry in segments or ():
+            self.add(entry)
+
+    def add(self, entry):
+        char_start, char_end, sample_start, sample_end, paragraph = (int(v) for v in entry)
+        with self._lock:
+            if self._segments and char_start < self._segments[-1][1]:
+                return False
+            self._segments.append([char_start, char_end, sample_start, sample_end, paragraph])
+            self._char_starts.append(char_start)
+            self._sample_starts.append(sample_start)
+            self._paragraphs.append(paragraph)
+            return True
+
+    def __len__(self):
+        return len(self._segments)
+
+    def since(self, cursor):
+        """Entries after the first `cursor` ones (what a listener has not seen yet)."""
+        with self._lock:
+            return self._segments[cursor:]
+
+    def segment_at_char(self, offset):
+        """Index of the segment containing text offset `offset` (or the one before a gap), None before the first."""
+        with self._lock:
+            i = bisect_right(self._char_starts, offset) - 1
+        return i if i >= 0 else None
+
+    def segment_at_sample(self, sample):
+        with self._lock:
+            i = bisect_right(self._sample_starts, sample) - 1
+        return i if i >= 0 else None
+
+    def sample_at_char(self, offset):
+        """Audio position of text offset `offset`: exact at segment starts, interpolated by characters inside one."""
+        i = self.segment_at_char(offset)
+        if i is None:
+            return None
+        char_start, char_end, sample_start, sample_end, _ = self._segments[i]
+        if offset >= char_end:
+            return sample_end
+        return sample_start + (sample_end - sample_start) * (offset - char_start) // max(1, char_end - char_start)
+
+    def char_at_sample(self, sample):
+        """Text offset being read at audio position `sample` (the reverse of sample_at_char)."""
+        i = self.segment_at_sample(sample)
+        if i is None:
+            return None
+        char_start, char_end, sample_start, sample_end, _ = self._segments[i]
+        if sample >= sample_end:
+            return char_end
+        return char_start + (char_end - char_start) * (sample - sample_start) // max(1, sample_end - sample_start)
+
+    def paragraph_start(self, paragraph):
+        """Sample where paragraph `paragraph` starts, None if not synthesized yet.
+
+        Paragraphs are the non-blank lines of the chapter text, numbered from 0. Scraped
+        text separates paragraphs with blank lines, so paragraph k is not text line k.
+        """
+        with self._lock:
+            i = bisect_right(self._paragraphs, paragraph - 1)
+            if i < len(self._paragraphs) and self._paragraphs[i] == paragraph:
+                return self._sample_starts[i]
+        return None
+
+    def to_dict(self):
+        with self._lock:
+            return {"version": TIMING_VERSION, "sample_rate": self.sample_rate, "segments": list(self._segments)}
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), separators=(",", ":")).encode("utf-8")
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["sample_rate"], data["segments"])
+
+    @classmethod
+    def from_json(cls, data):
+        return cls.from_dict(json.loads(data))
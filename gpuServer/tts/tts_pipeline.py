@@ -1,68 +1,100 @@
 import torch
-import kokoro
 import logging
 import numpy as np
 import threading
-import torchaudio
+from collections import deque
+from tts.model_pool import DEFAULT_VOICE
+from tts.segmenter import segment_text
+from tts.audio_format import to_dtype
+
+SEGMENT_LOOKAHEAD = 2  # segments queued at the inference scheduler ahead of the one being consumed
 
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 class TTSPipeline:
-    def __init__(self, worker_id, dtype, block_size: int, sample_rate:int , stop_event: threading.Event, task, device=None):  # Add buffer_size parameter
-        """Initializes the Kokoro TTS pipeline."""
-        self.device = device or torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        logging.info(f"TaskQueue using device: {self.device}")
+    def __init__(self, worker_id, dtype, block_size: int, sample_rate:int , stop_event: threading.Event, task, scheduler,
+                 segmenter=segment_text):
+        """Turns a task's text into fixed-size blocks using the shared inference scheduler."""
+        self.device = scheduler.device
         self.worker_id = worker_id
         self.dtype = dtype
         self.block_size = block_size
         self.task = task
         self.sample_rate = sample_rate
         self.stop_event = stop_event
-        self.pipeline = kokoro.KPipeline(lang_code='a', device=self.device)
-        self.resampler = torchaudio.transforms.Resample(orig_freq=24000, new_freq=self.sample_rate)
+        self.voice = DEFAULT_VOICE
+        self.scheduler = scheduler
+        self.resampler = scheduler.model.resampler
+        self.segmenter = segmenter
+
+    def generate_audio_chunks(self, text, start_char=0, start_sample=0):
+        """Generates audio from text with robust cancellation support.
 
-    def generate_audio_chunks(self, text):
-        """Generates audio from text with robust cancellation support."""
+        A resumed chapter passes the text offset and sample position it stopped at
+        (a segment boundary); segments before `start_char` are skipped.
+        """
         logging.info(f"Kokoro Wrapper: Starting speech generation for text.")
 
-        _buffer = np.array([], dtype=self.dtype)  # local buffer, no self.
+        # Blocks are filled in place instead of concatenating/slicing a growing buffer
+        block = np.empty(self.block_size, dtype=self.dtype)
+        filled = 0
+        position = start_sample  # samples of speech placed so far; the timing index is in these units
 
         try:
             if not text:
                 logging.info("No text provided. Stopping speech generation.")
                 return
 
-            generator = self.pipeline(text, voice='am_adam', speed=1, split_pattern=r'\n+')
+            # Short first segment, growing after it: the first block only waits for one sentence
+            segments = (segment for segment in self.segmenter(text) if segment.start >= start_char)
+            pending = deque()
 
-            for _, _, audio_tensor in generator:
+            def fill_pending():
+                while len(pending) < SEGMENT_LOOKAHEAD:
+                    segment = next(segments, None)
+                    if segment is None:
+                        return
+                    pending.append((segment, self.scheduler.submit(segment.text, self.voice, 1, self.task)))
 
-                # logging.debug(f"Kokoro Wrapper: Generated audio tensor shape: {audio_tensor}")
-
-                if not isinstance(audio_tensor, torch.Tensor):
-                    logging.info(f"Expected torch.Tensor, got {type(audio_tensor)}. Skipping chunk.")
-                    continue
+            fill_pending()
+            while pending:
+                segment, request = pending.popleft()
+                fill_pending()
+                audio = request.result()
 
                 if self.stop_event.is_set() or self.task.is_canceled():
                     logging.info(f"Task {self.worker_id}: Cancellation detected. Stopping generation.")
                     break
 
-                raw_chunk = audio_tensor.cpu().numpy().astype(self.dtype)
-                resampled_chunk = self.resampler(torch.from_numpy(raw_chunk).unsqueeze(0)).squeeze(0).numpy()
-                _buffer = np.concatenate((_buffer, resampled_chunk))
+                if audio is None or len(audio) == 0:
+                    continue
 
-                # Flush buffer in blocks, check cancellation at every iteration
-                while len(_buffer) >= self.block_size:
-                    block = _buffer[:self.block_size]
-                    _buffer = _buffer[self.block_size:]
-                    yield (False, block)
+                # At the model's native rate there is no resampler: one dtype conversion, no torch round trip
+                if self.resampler is not None:
+                    audio = self.resampler(torch.from_numpy(audio).unsqueeze(0)).squeeze(0).numpy()
+                chunk = to_dtype(audio, self.dtype)
+                # Recorded before the segment's blocks go out, so listeners get its timing ahead of its audio
+                self.task.add_timing([segment.start, segment.end, position, position + len(chunk),
+                                      segment.paragraph])
+                position += len(chunk)
+
+                pos = 0
+                while pos < len(chunk):
+                    take = min(self.block_size - filled, len(chunk) - pos)
+                    block[filled:filled + take] = chunk[pos:pos + take]
+                    filled += take
+                    pos += take
+                    if filled == self.block_size:
+                        yield (False, block)
+                        block = np.empty(self.block_size, dtype=self.dtype)
+                        filled = 0
 
             # Yield any remaining partial block
-            if len(_buffer) > 0:
-                padded_block = np.pad(_buffer, (0, self.block_size - len(_buffer)),
-                                    mode='constant', constant_values=0).astype(self.dtype)
-                yield (False, padded_block)
+            if filled > 0:
+                block[filled:] = 0
+                yield (False, block)
 
             silence = np.zeros(self.block_size, dtype=self.dtype)
 